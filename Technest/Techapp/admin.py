@@ -1,12 +1,23 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.template.response import TemplateResponse
+from . import simulator
+from .pagination import EstimatedCountPaginator
 from .models import (
     Product, CustomUser, Cart, Category, Wishlist, 
     ProductReview, Order, OrderItem, Coupon, 
-    NewsletterSubscription, UserAddress
+    NewsletterSubscription, UserAddress, StockHold, CouponRedemption
 )
 from django.contrib.auth.admin import UserAdmin
 
 
+# ==================== LARGE TABLE CHANGELISTS ====================
+class LargeTableAdminMixin:
+    """Changelist paging for tables that grow without bound: no exact COUNT(*) on huge unfiltered lists"""
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) behind "N results (M total)"
+    show_full_result_count = False
+
+
 # ==================== CATEGORY ADMIN ====================
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -25,6 +36,8 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'desc', 'sku')
     ordering = ('-created_at',)
     list_editable = ('price', 'sale_price', 'stock', 'featured', 'on_sale', 'is_active')
+    list_select_related = ('category',)
+    readonly_fields = ('held_stock',)
     
     fieldsets = (
         ('Basic Information', {
@@ -34,7 +47,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('price', 'on_sale', 'sale_price')
         }),
         ('Inventory', {
-            'fields': ('stock', 'image')
+            'fields': ('stock', 'held_stock', 'image')
         }),
         ('Status', {
             'fields': ('is_active', 'featured')
@@ -59,33 +72,50 @@ class CustomUserAdmin(UserAdmin):
 
 # ==================== CART ADMIN ====================
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'product', 'quantity', 'added_at', 'subtotal')
+    list_select_related = ('user', 'product')
     list_filter = ('added_at',)
     search_fields = ('user__username', 'product__name')
     ordering = ('-added_at',)
     readonly_fields = ('added_at', 'subtotal')
+    raw_id_fields = ('user', 'product')
+
+
+# ==================== STOCK HOLD ADMIN ====================
+@admin.register(StockHold)
+class StockHoldAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('product', 'cart_key', 'quantity', 'expires_at', 'created_at')
+    list_select_related = ('product',)
+    list_filter = ('expires_at',)
+    search_fields = ('cart_key', 'product__name')
+    ordering = ('expires_at',)
+    readonly_fields = ('product', 'cart_key', 'quantity', 'expires_at', 'created_at')
 
 
 # ==================== WISHLIST ADMIN ====================
 @admin.register(Wishlist)
-class WishlistAdmin(admin.ModelAdmin):
+class WishlistAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'product', 'added_at')
+    list_select_related = ('user', 'product')
     list_filter = ('added_at',)
     search_fields = ('user__username', 'product__name')
     ordering = ('-added_at',)
     readonly_fields = ('added_at',)
+    raw_id_fields = ('user', 'product')
 
 
 # ==================== PRODUCT REVIEW ADMIN ====================
 @admin.register(ProductReview)
-class ProductReviewAdmin(admin.ModelAdmin):
+class ProductReviewAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'title', 'is_approved', 'is_verified_purchase', 'created_at')
+    list_select_related = ('product', 'user')
     list_filter = ('rating', 'is_approved', 'is_verified_purchase', 'created_at')
     search_fields = ('product__name', 'user__username', 'title', 'comment')
     ordering = ('-created_at',)
     list_editable = ('is_approved',)
     readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('product', 'user')
     
     fieldsets = (
         ('Review Information', {
@@ -107,18 +137,24 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ('subtotal',)
     fields = ('product', 'quantity', 'price', 'subtotal')
+    raw_id_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 # ==================== ORDER ADMIN ====================
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('order_number', 'customer_name', 'customer_email', 'status', 'payment_status', 'total', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('status', 'payment_status', 'created_at')
     search_fields = ('order_number', 'user__username', 'guest_email', 'guest_name')
     ordering = ('-created_at',)
     list_editable = ('status', 'payment_status')
     readonly_fields = ('order_number', 'created_at', 'updated_at', 'customer_email', 'customer_name')
     inlines = [OrderItemInline]
+    raw_id_fields = ('user', 'coupon')
     
     fieldsets = (
         ('Order Information', {
@@ -146,11 +182,13 @@ class OrderAdmin(admin.ModelAdmin):
 
 # ==================== ORDER ITEM ADMIN ====================
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('order', 'product', 'quantity', 'price', 'subtotal')
+    list_select_related = ('order', 'product')
     list_filter = ('order__created_at',)
     search_fields = ('order__order_number', 'product__name')
     readonly_fields = ('subtotal',)
+    raw_id_fields = ('order', 'product')
 
 
 # ==================== COUPON ADMIN ====================
@@ -162,6 +200,7 @@ class CouponAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     list_editable = ('is_active',)
     readonly_fields = ('uses_count', 'created_at', 'updated_at')
+    actions = ['simulate_over_past_orders']
     
     fieldsets = (
         ('Coupon Details', {
@@ -179,11 +218,36 @@ class CouponAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.action(description='Simulate cost over past orders')
+    def simulate_over_past_orders(self, request, queryset):
+        """What-if report: what the selected coupons would have cost on every past order"""
+        if not simulator.is_available():
+            self.message_user(request, 'The coupon simulator requires NumPy (pip install numpy)', messages.ERROR)
+            return None
+        results = simulator.simulate([simulator.spec_from_coupon(coupon) for coupon in queryset])
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Coupon simulation',
+            'opts': self.model._meta,
+            'results': results,
+        }
+        return TemplateResponse(request, 'admin/Techapp/coupon/simulation.html', context)
+
+
+# ==================== COUPON REDEMPTION ADMIN ====================
+@admin.register(CouponRedemption)
+class CouponRedemptionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('coupon', 'user', 'uses')
+    list_select_related = ('coupon', 'user')
+    search_fields = ('coupon__code', 'user__username')
+    readonly_fields = ('coupon', 'user', 'uses')
+
 
 # ==================== NEWSLETTER SUBSCRIPTION ADMIN ====================
 @admin.register(NewsletterSubscription)
 class NewsletterSubscriptionAdmin(admin.ModelAdmin):
     list_display = ('email', 'user', 'is_active', 'subscribed_at', 'unsubscribed_at')
+    list_select_related = ('user',)
     list_filter = ('is_active', 'subscribed_at')
     search_fields = ('email', 'user__username')
     ordering = ('-subscribed_at',)
@@ -208,6 +272,7 @@ class NewsletterSubscriptionAdmin(admin.ModelAdmin):
 @admin.register(UserAddress)
 class UserAddressAdmin(admin.ModelAdmin):
     list_display = ('user', 'full_name', 'address_type', 'city', 'state', 'is_default')
+    list_select_related = ('user',)
     list_filter = ('address_type', 'is_default', 'country')
     search_fields = ('user__username', 'full_name', 'city', 'state')
     ordering = ('-is_default', '-created_at')
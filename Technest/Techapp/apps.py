@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class TechappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Techapp'
+
+    def ready(self):
+        # Register model signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,243 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip siblings are written
+    brotli = None
+
+# Page-critical files of templates/base.html, bundled in this order
+BUNDLES = {
+    'core.css': [
+        'css/bootstrap.min.css',
+        'css/futuristic-theme.css',
+        'css/quick-wins.css',
+        'css/style.css',
+        'css/responsive.css',
+        'css/readability.css',
+        'css/toast-notifications.css',
+        'css/cart-badge.css',
+    ],
+    'core.js': [
+        'js/jquery.min.js',
+        'js/popper.min.js',
+        'js/toast-notifications.js',
+        'js/cart-badge.js',
+        'js/quick-wins.js',
+    ],
+}
+
+# Built bundles live outside STATIC_ROOT and are served by AssetMiddleware
+ASSET_BUILD_DIR = getattr(settings, 'ASSET_BUILD_DIR', os.path.join(settings.BASE_DIR, 'assets'))
+ASSET_URL = getattr(settings, 'ASSET_URL', '/assets/')
+MANIFEST_NAME = 'manifest.json'
+
+# Fingerprinted names never change content, so clients may keep them for a year
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Content-Encoding -> file suffix, most preferred first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+CONTENT_TYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8'}
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_CSS_IMPORT = re.compile(r'@import\s+[^;]+;\s*')
+_CSS_CHARSET = re.compile(r'@charset\s+[^;]+;\s*')
+_SOURCE_MAP = re.compile(r'^\s*(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)\s*$', re.MULTILINE)
+
+
+class AssetError(Exception):
+    """Raised when a bundle cannot be built"""
+
+
+def bundled_name(name, content):
+    """``core.css`` -> ``core.<12 hex chars of SHA-256>.css``"""
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _rebase_css(css, source):
+    """Point relative ``url()``s of ``source`` at STATIC_URL, since the bundle is served from elsewhere"""
+    directory = posixpath.dirname(source)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '#', '/')) or '://' in url:
+            return match.group(0)
+        return f'url({quote}{settings.STATIC_URL}{posixpath.normpath(posixpath.join(directory, url))}{quote})'
+    return _CSS_URL.sub(rebase, css)
+
+
+def _read_source(source):
+    path = finders.find(source)
+    if path is None:
+        raise AssetError(f'Static file {source} not found')
+    with open(path, encoding='utf-8') as f:
+        return _SOURCE_MAP.sub('', f.read())
+
+
+def concatenate(name, sources):
+    """
+    Join a bundle's sources into one file's text.
+
+    CSS ``@import`` rules only work at the top of a stylesheet, so they are
+    hoisted; JS files are separated with ``;`` in case one lacks a final
+    semicolon.
+    """
+    parts = [f'/* {source} */\n{_read_source(source)}' for source in sources]
+    if name.endswith('.css'):
+        imports = []
+        parts = [_rebase_css(_CSS_CHARSET.sub('', part), source) for part, source in zip(parts, sources)]
+        for i, part in enumerate(parts):
+            imports.extend(match.group(0).strip() for match in _CSS_IMPORT.finditer(part))
+            parts[i] = _CSS_IMPORT.sub('', part)
+        return '\n'.join(imports + parts)
+    return ';\n'.join(parts) + '\n'
+
+
+def compress(content):
+    """``{suffix: bytes}`` of the precompressed siblings worth keeping"""
+    siblings = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        siblings['.br'] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in siblings.items() if len(data) < len(content)}
+
+
+def _write(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(bundles=BUNDLES, directory=None):
+    """
+    Write every bundle under its fingerprinted name, with compressed siblings.
+
+    Files of the previous build are kept so pages rendered before a deploy
+    still load; anything older is removed. The manifest is written last, so
+    a failed build leaves the previous one in use.
+
+    Returns:
+        dict: The new manifest, ``{bundle name: fingerprinted name}``
+
+    Raises:
+        AssetError: If a source file is missing
+    """
+    directory = directory or ASSET_BUILD_DIR
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, sources in bundles.items():
+        content = concatenate(name, sources).encode('utf-8')
+        manifest[name] = bundled_name(name, content)
+        target = os.path.join(directory, manifest[name])
+        _write(target, content)
+        for suffix, data in compress(content).items():
+            _write(target + suffix, data)
+
+    previous = read_manifest(directory)
+    keep = {MANIFEST_NAME, *manifest.values(), *previous.values()}
+    _write(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+    for filename in os.listdir(directory):
+        if filename not in keep and filename.removesuffix('.gz').removesuffix('.br') not in keep:
+            os.remove(os.path.join(directory, filename))
+    _manifest_cache.clear()
+    return manifest
+
+
+_manifest_cache = {}
+
+
+def read_manifest(directory=None):
+    """The last build's manifest, or ``{}`` when nothing was built; reread only when the file changes"""
+    path = os.path.join(directory or ASSET_BUILD_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _manifest_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding='utf-8') as f:
+            cached = _manifest_cache[path] = (mtime, json.load(f))
+    return cached[1]
+
+
+def bundle_url(name):
+    """URL of a built bundle, or None when it has not been built"""
+    filename = read_manifest().get(name)
+    return ASSET_URL + filename if filename else None
+
+
+def _accepted_encodings(header):
+    """Codings the client accepts, from an ``Accept-Encoding`` value (``q=0`` excluded)"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve(request, filename, directory=None):
+    """
+    Response for a fingerprinted bundle, picking the best precompressed sibling.
+
+    Only names produced by a build (``name.<hash>.ext``) are served, so the
+    response can be cached forever and no path outside ``directory`` can be
+    requested.
+    """
+    if not re.fullmatch(r'[\w-]+\.[0-9a-f]{12}\.(css|js)', filename):
+        return None
+    path = os.path.join(directory or ASSET_BUILD_DIR, filename)
+    if not os.path.exists(path):
+        return None
+
+    etag = f'"{filename}"'
+    accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    encoding = next(
+        (coding for coding, suffix in ENCODINGS.items() if coding in accepted and os.path.exists(path + suffix)),
+        None,
+    )
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(path + ENCODINGS[encoding] if encoding else path, 'rb'),
+            content_type=CONTENT_TYPES[posixpath.splitext(filename)[1]],
+        )
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class AssetMiddleware:
+    """
+    Serve built bundles under ``ASSET_URL`` before sessions, auth and CSRF run.
+
+    Place it right after SecurityMiddleware. Other requests pass through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(ASSET_URL) and request.method in ('GET', 'HEAD'):
+            response = serve(request, request.path[len(ASSET_URL):])
+            if response is not None:
+                return response
+            return HttpResponse('Not found', status=404, content_type='text/plain')
+        return self.get_response(request)
@@ -0,0 +1,257 @@
+import csv
+import json
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import holds, pricing, search
+from .models import Category, Product
+
+# Rows written per INSERT ... ON CONFLICT statement
+IMPORT_BATCH_SIZE = 1000
+
+# Invalid rows kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Columns an import may set; everything else (ratings, holds, timestamps) is left alone
+IMPORT_FIELDS = ('name', 'desc', 'price', 'sale_price', 'on_sale', 'stock', 'category', 'featured', 'is_active')
+
+# Feed column -> the IMPORT_FIELDS entry it sets (``description`` is an alias of ``desc``)
+COLUMN_FIELDS = {
+    'name': 'name', 'desc': 'desc', 'description': 'desc', 'price': 'price', 'sale_price': 'sale_price',
+    'on_sale': 'on_sale', 'stock': 'stock', 'category': 'category', 'featured': 'featured',
+    'is_active': 'is_active',
+}
+
+# A blank cell in one of these columns means "not given" rather than False
+BOOLEAN_FIELDS = ('on_sale', 'featured', 'is_active')
+
+_TRUE = {'1', 'true', 'yes', 'y', 't'}
+_FALSE = {'0', 'false', 'no', 'n', 'f'}
+
+RowError = namedtuple('RowError', ['line', 'sku', 'message'])
+ImportResult = namedtuple('ImportResult', ['rows', 'created', 'updated', 'invalid', 'errors'])
+
+
+class CatalogError(ValueError):
+    """Raised when a catalog row cannot be turned into a product"""
+
+
+def detect_format(path):
+    """``jsonl`` for ``.jsonl``/``.ndjson`` files, otherwise ``csv``"""
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line_number, row_dict)`` from an open CSV or JSONL file, one at a time.
+
+    A JSONL line that is not a JSON object is yielded as ``(line_number,
+    CatalogError)``, so the import reports it as an invalid row and goes on.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, CatalogError(f'invalid JSON ({e.msg})')
+            continue
+        if not isinstance(row, dict):
+            row = CatalogError('expected a JSON object')
+        yield line_number, row
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(row, field):
+    value = _text(row.get(field))
+    if not value:
+        return None
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise CatalogError(f'{field} is not a number: {value!r}')
+    if not amount.is_finite() or amount < 0:
+        raise CatalogError(f'{field} must be a non-negative amount')
+    return amount.quantize(Decimal('0.01'))
+
+
+def _bool(row, field, default):
+    value = row.get(field)
+    if isinstance(value, bool):
+        return value
+    value = _text(value).lower()
+    if not value:
+        return default
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise CatalogError(f'{field} is not a boolean: {value!r}')
+
+
+def provided_fields(row):
+    """
+    The IMPORT_FIELDS a row sets on an existing product, in IMPORT_FIELDS order.
+
+    Only columns the feed has are written, so a price-only feed leaves stock,
+    descriptions and categories alone; blank boolean cells count as absent.
+    """
+    fields = {
+        field for column, field in COLUMN_FIELDS.items()
+        if column in row and not (field in BOOLEAN_FIELDS and not _text(row[column]))
+    }
+    return tuple(field for field in IMPORT_FIELDS if field in fields)
+
+
+def build_product(row, category_ids):
+    """
+    Validate one catalog row and build the (unsaved) product it describes.
+
+    Columns the row lacks get the model's defaults, which only matter when
+    the SKU is new (see ``provided_fields``).
+
+    Args:
+        row (dict): Parsed CSV or JSONL row
+        category_ids (dict): Category slug to id
+
+    Raises:
+        CatalogError: If a field is missing or invalid
+    """
+    sku = _text(row.get('sku'))
+    name = _text(row.get('name'))
+    if not sku:
+        raise CatalogError('sku is required')
+    if len(sku) > Product._meta.get_field('sku').max_length:
+        raise CatalogError('sku is too long')
+    if not name:
+        raise CatalogError('name is required')
+    if len(name) > Product._meta.get_field('name').max_length:
+        raise CatalogError('name is too long')
+
+    stock = _text(row.get('stock')) or '0'
+    try:
+        stock = int(stock)
+    except ValueError:
+        raise CatalogError(f'stock is not a whole number: {stock!r}')
+    if stock < 0:
+        raise CatalogError('stock cannot be negative')
+
+    category_slug = _text(row.get('category'))
+    category_id = None
+    if category_slug:
+        category_id = category_ids.get(category_slug)
+        if category_id is None:
+            raise CatalogError(f'unknown category {category_slug!r}')
+
+    return Product(
+        sku=sku,
+        name=name,
+        desc=_text(row.get('desc', row.get('description'))),
+        price=_decimal(row, 'price'),
+        sale_price=_decimal(row, 'sale_price'),
+        on_sale=_bool(row, 'on_sale', False),
+        stock=stock,
+        category_id=category_id,
+        featured=_bool(row, 'featured', False),
+        is_active=_bool(row, 'is_active', True),
+    )
+
+
+def upsert_products(products, fields=IMPORT_FIELDS):
+    """
+    Insert or update a batch of products by SKU in one statement.
+
+    Existing products only get ``fields`` overwritten; new ones are inserted
+    whole.
+
+    ``bulk_create`` skips ``save()`` and its signals, so the search index and
+    live stock pages are refreshed here for the whole batch.
+
+    Returns:
+        int: Number of SKUs that did not exist before
+    """
+    skus = [product.sku for product in products]
+    with transaction.atomic():
+        existing = Product.objects.filter(sku__in=skus).count()
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=[*fields, 'updated_at'],
+        )
+        ids = list(Product.objects.filter(sku__in=skus).values_list('id', flat=True))
+        search.index_products(ids)
+        holds.publish_available_stock(ids)
+    return len(skus) - existing
+
+
+def import_catalog(rows, batch_size=IMPORT_BATCH_SIZE, dry_run=False, on_batch=None):
+    """
+    Validate and upsert a stream of catalog rows in fixed-size batches.
+
+    Memory is bounded by one batch: rows are consumed lazily and every
+    batch is written before the next is read. Rows are upserted in groups
+    sharing the same ``provided_fields``, so every row only overwrites the
+    columns it has. Invalid rows are skipped and reported; a SKU repeated
+    within a batch keeps its last row.
+
+    Args:
+        rows: Iterable of ``(line_number, row_dict)``, or ``(line_number, CatalogError)``
+            for a line that could not be parsed
+        batch_size (int): Products per upsert statement
+        dry_run (bool): Validate only, write nothing
+        on_batch: Optional callback receiving the running row count after each batch
+
+    Returns:
+        ImportResult: Row, created, updated and invalid counts plus the
+        first ``MAX_REPORTED_ERRORS`` row errors
+    """
+    category_ids = dict(Category.objects.values_list('slug', 'id'))
+    rows_seen = created = updated = invalid = 0
+    errors = []
+    batches = {}  # provided fields -> {sku: product}
+
+    def flush():
+        nonlocal created, updated
+        for fields, batch in batches.items():
+            if batch and not dry_run:
+                new = upsert_products(list(batch.values()), fields)
+                created += new
+                updated += len(batch) - new
+        batches.clear()
+        if on_batch is not None:
+            on_batch(rows_seen)
+
+    for line_number, row in rows:
+        rows_seen += 1
+        try:
+            if isinstance(row, CatalogError):
+                raise row
+            product = build_product(row, category_ids)
+        except CatalogError as e:
+            invalid += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                sku = _text(row.get('sku')) if isinstance(row, dict) else ''
+                errors.append(RowError(line_number, sku, str(e)))
+            continue
+        fields = provided_fields(row)
+        for batch in batches.values():
+            batch.pop(product.sku, None)
+        batches.setdefault(fields, {})[product.sku] = product
+        if sum(map(len, batches.values())) >= batch_size:
+            flush()
+    flush()
+
+    if (created or updated) and not dry_run:
+        pricing.bump_pricing_version()
+    return ImportResult(rows_seen, created, updated, invalid, errors)
@@ -0,0 +1,10 @@
+from .utils import get_cart_count
+
+
+def cart(request):
+    """
+    Expose the cart badge count to every template.
+
+    Passed as a callable so it is only computed when a template renders it.
+    """
+    return {'cart_count': lambda: get_cart_count(request)}
@@ -0,0 +1,96 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon, CouponRedemption
+
+# How long an unknown code is remembered; creating the coupon clears it early
+UNKNOWN_CODE_TIMEOUT = 300
+
+
+class CouponError(Exception):
+    """Raised when a coupon code cannot be applied"""
+
+
+def normalize_code(code):
+    return (code or '').strip()
+
+
+def _unknown_key(code):
+    # Codes are user input: hash them so keys are short and safe for any cache backend
+    return f'coupon-unknown:{hashlib.sha1(code.encode()).hexdigest()}'
+
+
+def get_coupon(code):
+    """
+    Look up a coupon by code.
+
+    Misses are cached for a few minutes, so guessing codes at random costs
+    a cache hit per guess instead of a query.
+
+    Raises:
+        CouponError: If no coupon has this code
+    """
+    code = normalize_code(code)
+    if not code or len(code) > Coupon._meta.get_field('code').max_length or cache.get(_unknown_key(code)):
+        raise CouponError('Invalid coupon code')
+    try:
+        return Coupon.objects.get(code=code)
+    except Coupon.DoesNotExist:
+        cache.set(_unknown_key(code), True, UNKNOWN_CODE_TIMEOUT)
+        raise CouponError('Invalid coupon code')
+
+
+def forget_unknown_code(code):
+    """Drop a cached miss, e.g. once a coupon with this code is created"""
+    cache.delete(_unknown_key(normalize_code(code)))
+
+
+def redeem(coupon, user, subtotal):
+    """
+    Count one use of ``coupon`` for ``user`` and return the discount.
+
+    The global limit is a single conditional ``UPDATE`` on ``uses_count`` and
+    the per-user limit a conditional ``UPDATE`` on the user's
+    ``CouponRedemption`` row, so both hold under concurrent checkouts
+    without counting orders. Must run inside the order's transaction so a
+    failed checkout gives the uses back.
+
+    Args:
+        coupon (Coupon): Coupon being applied
+        user: Customer placing the order (guests have no per-user limit)
+        subtotal (Decimal): Order subtotal the discount applies to
+
+    Raises:
+        CouponError: If the coupon is not valid for this order
+    """
+    if coupon.min_purchase_amount and subtotal < coupon.min_purchase_amount:
+        raise CouponError(f'Coupon requires a minimum purchase of ${coupon.min_purchase_amount}')
+
+    now = timezone.now()
+    claimed = (
+        Coupon.objects
+        .filter(pk=coupon.pk, is_active=True, valid_from__lte=now, valid_to__gte=now)
+        .filter(Q(max_uses__isnull=True) | Q(uses_count__lt=F('max_uses')))
+        .update(uses_count=F('uses_count') + 1)
+    )
+    if not claimed:
+        coupon.refresh_from_db()
+        valid, message = coupon.is_valid()
+        raise CouponError(message if not valid else 'Coupon usage limit reached')
+
+    if user.is_authenticated:
+        CouponRedemption.objects.bulk_create(
+            [CouponRedemption(coupon=coupon, user=user, uses=0)], ignore_conflicts=True,
+        )
+        claimed = (
+            CouponRedemption.objects
+            .filter(coupon=coupon, user=user, uses__lt=coupon.max_uses_per_user)
+            .update(uses=F('uses') + 1)
+        )
+        if not claimed:
+            raise CouponError('You have already used this coupon')
+
+    return coupon.calculate_discount(subtotal)
@@ -0,0 +1,206 @@
+import hashlib
+import http.client
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urljoin, urlsplit
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+
+# Concurrent downloads; each worker thread keeps its own connection per host
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_REDIRECTS = 5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Fetched files are stored as <IMAGE_DIRECTORY>/<2 hex chars>/<sha256>.<ext>
+IMAGE_DIRECTORY = 'products'
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+USER_AGENT = 'Technest-ImageFetcher/1.0'
+
+# A reused keep-alive connection the server already closed fails with one of these
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+FetchResult = namedtuple('FetchResult', ['url', 'name', 'created', 'size'])
+
+
+class FetchError(Exception):
+    """Raised when a URL does not yield a usable image"""
+
+
+def content_name(digest, image_format, directory=IMAGE_DIRECTORY):
+    """Storage name of an image with SHA-256 ``digest``; identical bytes always map to one file"""
+    return f'{directory}/{digest[:2]}/{digest}.{IMAGE_EXTENSIONS[image_format]}'
+
+
+class ImageFetcher:
+    """
+    Download images concurrently into content-addressed storage.
+
+    A bounded thread pool does the network work. Every worker keeps one
+    persistent HTTP/1.1 connection per host, so a feed of URLs on a few
+    CDNs costs a handful of TCP/TLS handshakes. Bodies are streamed to a
+    temporary file while being hashed and never held in memory, and a file
+    whose hash is already stored is not stored again.
+
+    Use as a context manager so the connections are closed afterwards.
+    """
+
+    def __init__(self, storage=default_storage, workers=FETCH_WORKERS, timeout=FETCH_TIMEOUT,
+                 max_bytes=MAX_IMAGE_BYTES, directory=IMAGE_DIRECTORY):
+        self.storage = storage
+        self.workers = workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.connections_opened = 0
+        self._local = threading.local()
+        self._all_connections = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            connections, self._all_connections = self._all_connections, []
+        for connection in connections:
+            connection.close()
+
+    def fetch_all(self, urls):
+        """
+        Download every URL, yielding ``(url, FetchResult or FetchError)`` as each finishes.
+
+        At most a few times ``workers`` downloads are queued at once, so a
+        long URL list is consumed lazily.
+        """
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            while True:
+                while len(pending) < self.workers * 4:
+                    url = next(urls, None)
+                    if url is None:
+                        break
+                    pending[pool.submit(self.fetch, url)] = url
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        yield url, future.result()
+                    except FetchError as e:
+                        yield url, e
+
+    def fetch(self, url):
+        """
+        Download one image, following redirects.
+
+        Raises:
+            FetchError: On a network error, a non-200 answer, an oversized
+                body or content that is not a supported image
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                response, connection = self._get(url)
+                if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                    response.read()
+                    url = urljoin(url, response.getheader('Location'))
+                    continue
+                if response.status != 200:
+                    response.read()
+                    raise FetchError(f'{url}: HTTP {response.status}')
+                return self._store(url, response, connection)
+            except (OSError, http.client.HTTPException) as e:
+                # A request or body read failed partway: the connection can't serve another request
+                self._drop_connection(url)
+                raise FetchError(f'{url}: {e}')
+        raise FetchError(f'{url}: too many redirects')
+
+    def _connection(self, scheme, netloc, fresh=False):
+        """This thread's persistent connection to ``netloc``"""
+        connections = self._local.__dict__.setdefault('connections', {})
+        key = (scheme, netloc)
+        if fresh and key in connections:
+            connections.pop(key).close()
+        if key not in connections:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+            with self._lock:
+                self.connections_opened += 1
+                self._all_connections.append(connections[key])
+        return connections[key]
+
+    def _drop_connection(self, url):
+        """Close this thread's connection to ``url``'s host so the next request opens a fresh one"""
+        parts = urlsplit(url)
+        connection = self._local.__dict__.get('connections', {}).pop((parts.scheme, parts.netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _get(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise FetchError(f'{url}: not an http(s) URL')
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = {'User-Agent': USER_AGENT, 'Accept': 'image/*'}
+        connection = self._connection(parts.scheme, parts.netloc)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse(), connection
+        except _STALE_CONNECTION_ERRORS:
+            # The server dropped the idle keep-alive connection; retry once on a new one
+            connection = self._connection(parts.scheme, parts.netloc, fresh=True)
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse(), connection
+
+    def _store(self, url, response, connection):
+        length = response.getheader('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            connection.close()
+            raise FetchError(f'{url}: {length} bytes is over the {self.max_bytes} byte limit')
+
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(suffix='.download', delete=False) as tmp:
+            try:
+                while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        # Unread body: this connection can't be reused
+                        connection.close()
+                        raise FetchError(f'{url}: body is over the {self.max_bytes} byte limit')
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.close()
+                try:
+                    with Image.open(tmp.name) as image:
+                        image_format = image.format
+                        image.verify()
+                except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+                    raise FetchError(f'{url}: not a valid image')
+                if image_format not in IMAGE_EXTENSIONS:
+                    raise FetchError(f'{url}: unsupported image format {image_format}')
+
+                name = content_name(digest.hexdigest(), image_format, self.directory)
+                # Check-then-save under a lock, or two threads with the same bytes would store two files
+                with self._lock:
+                    if self.storage.exists(name):
+                        return FetchResult(url, name, False, size)
+                    with open(tmp.name, 'rb') as f:
+                        saved = self.storage.save(name, File(f))
+                return FetchResult(url, saved, True, size)
+            finally:
+                os.remove(tmp.name)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+
+# Per-connection buffer; a slow client loses old events rather than growing memory
+SUBSCRIPTION_QUEUE_SIZE = 32
+
+
+class Subscription:
+    """One open event stream: a bounded asyncio queue bound to its event loop"""
+
+    def __init__(self, channels, loop):
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def offer(self, event):
+        """Queue an event; runs on the subscription's loop"""
+        if self.queue.full():
+            # Drop the oldest event: the newest count/stock value is what matters
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class EventHub:
+    """
+    In-process publish/subscribe hub for server-sent events.
+
+    Subscribers are asyncio queues owned by the ASGI event loop, so an idle
+    connection costs one small object and no thread. ``publish`` is
+    thread-safe and may be called from synchronous views (which Django runs
+    in worker threads under ASGI). Events only reach connections held by the
+    same process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channels):
+        """Register a subscription on the running loop for the given channels"""
+        subscription = Subscription(channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def has_subscribers(self, channel):
+        return channel in self._channels
+
+    def publish(self, channel, event_type, data):
+        """Deliver an event to every subscription listening on ``channel``"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        event = (event_type, data)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loop already closed; the stream's cleanup will unsubscribe it
+                pass
+
+
+hub = EventHub()
+
+
+def cart_channel(user_id=None, session_key=None):
+    """Channel for a user's cart, or a guest's cart by session key"""
+    if user_id is not None:
+        return f'cart:user:{user_id}'
+    if session_key:
+        return f'cart:session:{session_key}'
+    return None
+
+
+def stock_channel(product_id):
+    return f'stock:{product_id}'
+
+
+def publish_cart_count(channel, count):
+    if channel:
+        hub.publish(channel, 'cart', {'count': count})
+
+
+def publish_stock(product_id, stock):
+    hub.publish(stock_channel(product_id), 'stock', {'product_id': product_id, 'stock': stock})
+
+
+def format_event(event_type, data):
+    """Encode one event in the text/event-stream wire format"""
+    return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
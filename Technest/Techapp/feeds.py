@@ -0,0 +1,214 @@
+import csv
+import hmac
+import json
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import reverse
+
+from .models import Category, Product
+
+# Products fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+# Generated lines are joined into chunks of about this many characters
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# The sitemap protocol caps a single file at 50,000 URLs
+SITEMAP_MAX_URLS = 50_000
+
+# Absolute links in feeds and sitemaps; views use the request host instead
+SITE_URL = getattr(settings, 'SITE_URL', '')
+FEED_CURRENCY = getattr(settings, 'FEED_CURRENCY', 'USD')
+
+# Shared secret for feed consumers (``?token=`` or ``X-Feed-Token``); with it
+# the feed includes stock counts and, incrementally, deactivated products
+FEED_TOKEN = getattr(settings, 'FEED_TOKEN', '')
+
+# Incremental runs start this far before the watermark, so a write whose
+# transaction committed after the previous run began is not missed
+INCREMENTAL_OVERLAP = timedelta(minutes=1)
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+CSV_COLUMNS = ('id', 'sku', 'name', 'price', 'stock', 'image_url', 'category', 'url', 'active', 'updated_at')
+PUBLIC_CSV_COLUMNS = tuple(column for column in CSV_COLUMNS if column != 'stock')
+
+_EXPORT_ONLY = (
+    'id', 'sku', 'name', 'effective_price', 'stock', 'image', 'is_active', 'updated_at',
+    'category__slug', 'category__name',
+)
+
+
+def valid_token(token):
+    """True if ``token`` is the configured FEED_TOKEN (never when none is configured)"""
+    return bool(FEED_TOKEN and token) and hmac.compare_digest(str(token), FEED_TOKEN)
+
+
+def export_queryset(since=None, with_description=False, public=False):
+    """
+    Products to export, in a stable order for chunked iteration.
+
+    A full export is the active catalog. An incremental one (``since`` set)
+    is every product changed after the watermark, inactive ones included,
+    so consumers can drop products that were switched off; a ``public``
+    one sticks to active products.
+    """
+    products = Product.objects.select_related('category').only(
+        *_EXPORT_ONLY, *(('desc',) if with_description else ())
+    )
+    if since is None:
+        return products.filter(is_active=True).order_by('id')
+    if public:
+        products = products.filter(is_active=True)
+    return products.filter(updated_at__gte=since - INCREMENTAL_OVERLAP).order_by('updated_at', 'id')
+
+
+def iter_products(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream a queryset without caching it, ``chunk_size`` rows per fetch"""
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def product_record(product, base_url=SITE_URL, public=False):
+    """The exported fields of one product as plain JSON-friendly values; ``public`` leaves out stock"""
+    record = {
+        'id': product.id,
+        'sku': product.sku,
+        'name': product.name,
+        'price': str(product.effective_price) if product.effective_price is not None else None,
+        'stock': product.stock or 0,
+        'image_url': base_url + product.image.url if product.image else None,
+        'category': product.category.slug if product.category else None,
+        'url': base_url + reverse('product_detail', args=[product.id]),
+        'active': product.is_active,
+        'updated_at': product.updated_at.isoformat(),
+    }
+    if public:
+        del record['stock']
+    return record
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(products, base_url=SITE_URL, public=False):
+    """Yield the CSV export line by line, header first"""
+    columns = PUBLIC_CSV_COLUMNS if public else CSV_COLUMNS
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for product in products:
+        record = product_record(product, base_url, public)
+        yield writer.writerow(['' if record[column] is None else record[column] for column in columns])
+
+
+def jsonl_lines(products, base_url=SITE_URL, public=False):
+    """Yield one JSON object per product, newline terminated"""
+    for product in products:
+        yield json.dumps(product_record(product, base_url, public)) + '\n'
+
+
+def _element(tag, value):
+    return f'<{tag}>{escape(str(value))}</{tag}>'
+
+
+def feed_xml_lines(products, base_url=SITE_URL, title='Technest', public=False):
+    """
+    Yield an RSS 2.0 shopping feed (Google Merchant ``g:`` attributes).
+
+    Products need their description loaded, see ``export_queryset``.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+    yield _element('title', title) + _element('link', base_url + '/') + '\n'
+    for product in products:
+        record = product_record(product, base_url, public)
+        in_stock = product.is_active and (product.stock or 0) > 0
+        parts = [
+            _element('g:id', record['sku'] or record['id']),
+            _element('title', record['name']),
+            _element('description', getattr(product, 'desc', '') or record['name']),
+            _element('link', record['url']),
+            _element('g:availability', 'in_stock' if in_stock else 'out_of_stock'),
+        ]
+        if record['price'] is not None:
+            parts.append(_element('g:price', f"{record['price']} {FEED_CURRENCY}"))
+        if record['image_url']:
+            parts.append(_element('g:image_link', record['image_url']))
+        if product.category:
+            parts.append(_element('g:product_type', product.category.name))
+        yield '<item>' + ''.join(parts) + '</item>\n'
+    yield '</channel>\n</rss>\n'
+
+
+def export_lines(fmt, products, base_url=SITE_URL, public=False):
+    """Dispatch to the line generator for ``fmt`` (one of FORMATS)"""
+    generators = {'csv': csv_lines, 'jsonl': jsonl_lines, 'xml': feed_xml_lines}
+    return generators[fmt](products, base_url, public=public)
+
+
+def buffered(lines, size=STREAM_BUFFER_SIZE):
+    """Join small generated lines into fewer, larger chunks for the response or file"""
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# ==================== SITEMAPS ====================
+def sitemap_product_pages():
+    """Number of product sitemap files needed for the active catalog"""
+    count = Product.objects.filter(is_active=True).count()
+    return max(1, -(-count // SITEMAP_MAX_URLS))
+
+
+def sitemap_index_lines(section_urls):
+    """Yield a sitemap index listing the given sitemap file URLs"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for url in section_urls:
+        yield f'<sitemap>{_element("loc", url)}</sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def _urlset_lines(entries):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for loc, lastmod in entries:
+        lastmod = _element('lastmod', lastmod.date().isoformat()) if lastmod else ''
+        yield f'<url>{_element("loc", loc)}{lastmod}</url>\n'
+    yield '</urlset>\n'
+
+
+def product_sitemap_lines(page, base_url=SITE_URL, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield product sitemap file ``page`` (1-based), SITEMAP_MAX_URLS products per file"""
+    start = (page - 1) * SITEMAP_MAX_URLS
+    rows = (
+        Product.objects.filter(is_active=True).order_by('id')
+        .values_list('id', 'updated_at')[start:start + SITEMAP_MAX_URLS]
+        .iterator(chunk_size=chunk_size)
+    )
+    return _urlset_lines(
+        (base_url + reverse('product_detail', args=[product_id]), updated_at)
+        for product_id, updated_at in rows
+    )
+
+
+def category_sitemap_lines(base_url=SITE_URL):
+    """Yield the sitemap of category listing pages"""
+    products_url = base_url + reverse('products')
+    slugs = Category.objects.filter(is_active=True).order_by('slug').values_list('slug', flat=True)
+    return _urlset_lines((f'{products_url}?category={slug}', None) for slug in slugs.iterator())
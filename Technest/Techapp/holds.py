@@ -0,0 +1,142 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import events
+from .models import Product, StockHold
+
+# How long the checkout page keeps a cart's units out of everyone else's reach
+HOLD_DURATION = timedelta(minutes=10)
+
+# Expired holds released per sweeper transaction
+SWEEP_BATCH_SIZE = 500
+
+CartHold = namedtuple('CartHold', ['expires_at', 'short'])
+
+
+def cart_key(cart):
+    """Key identifying the cart that owns a hold, or None for a guest without a session"""
+    if cart.user.is_authenticated:
+        return f'user:{cart.user.pk}'
+    if cart.session.session_key:
+        return f'session:{cart.session.session_key}'
+    return None
+
+
+def hold_cart(cart, duration=HOLD_DURATION):
+    """
+    Hold stock for every line in the cart until ``duration`` from now.
+
+    Any earlier hold of the same cart is replaced. Each line is claimed with
+    a conditional ``UPDATE`` on ``Product.held_stock`` so the counter never
+    exceeds stock; lines that cannot be covered are reported, not held.
+
+    Returns:
+        CartHold: (expires_at, short) where short lists the products not held,
+        or None when the cart is empty or has no key yet
+    """
+    key = cart_key(cart)
+    items = cart.get_cart_items()
+    if key is None or not items:
+        return None
+
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    expires_at = timezone.now() + duration
+
+    with transaction.atomic():
+        release_cart(key)
+        release_expired(product_ids=quantities)
+        held, short = [], []
+        for product_id, quantity in quantities.items():
+            claimed = (
+                Product.objects
+                .filter(pk=product_id, is_active=True, stock__gte=F('held_stock') + quantity)
+                .update(held_stock=F('held_stock') + quantity)
+            )
+            (held if claimed else short).append(product_id)
+        StockHold.objects.bulk_create([
+            StockHold(product_id=product_id, cart_key=key, quantity=quantities[product_id], expires_at=expires_at)
+            for product_id in held
+        ])
+
+    publish_available_stock(quantities)
+    short_products = [item.product for item in items if item.product_id in short]
+    return CartHold(expires_at, short_products)
+
+
+def release_cart(key):
+    """Give back everything held by one cart; returns the number of holds released"""
+    if key is None:
+        return 0
+    return _release(StockHold.objects.filter(cart_key=key))
+
+
+def release_expired(product_ids=None, now=None):
+    """Release expired holds, optionally only those on the given products"""
+    holds = StockHold.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return _release(holds)
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Release every expired hold, one batch per transaction.
+
+    Short transactions keep the sweeper from blocking checkouts for long
+    while it catches up after downtime.
+
+    Returns:
+        int: Number of holds released
+    """
+    now = timezone.now()
+    released = 0
+    while True:
+        batch = _release(
+            StockHold.objects.filter(expires_at__lte=now).order_by('expires_at'),
+            limit=batch_size,
+        )
+        released += batch
+        if batch < batch_size:
+            return released
+
+
+def _release(holds, limit=None):
+    """Delete the given holds and take their quantities off the product counters"""
+    with transaction.atomic():
+        rows = holds.select_for_update(skip_locked=True).values_list('pk', 'product_id', 'quantity')
+        rows = list(rows[:limit] if limit else rows)
+        if not rows:
+            return 0
+        totals = {}
+        for _, product_id, quantity in rows:
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        released = Case(
+            *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in totals.items()],
+            default=Value(0),
+        )
+        Product.objects.filter(pk__in=totals).update(
+            held_stock=Greatest(F('held_stock') - released, Value(0))
+        )
+    publish_available_stock(totals)
+    return len(rows)
+
+
+def publish_available_stock(product_ids):
+    """Push current availability to pages watching these products, once committed"""
+    product_ids = [pid for pid in product_ids if events.hub.has_subscribers(events.stock_channel(pid))]
+    if not product_ids:
+        return
+
+    def notify():
+        for product in Product.objects.filter(pk__in=product_ids).only('pk', 'stock', 'held_stock'):
+            events.publish_stock(product.pk, product.available_stock)
+
+    transaction.on_commit(notify)
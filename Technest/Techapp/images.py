@@ -0,0 +1,212 @@
+import base64
+import io
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageFilter, ImageOps
+
+# Widths (px) generated for every uploaded image; never wider than the original
+RENDITION_WIDTHS = (200, 400, 800)
+
+# Longest side (px) of the blurred placeholder inlined while the image loads
+PLACEHOLDER_SIZE = 24
+
+# Model field holding the placeholder data URI, on models that have one
+PLACEHOLDER_FIELD = 'image_placeholder'
+
+# extension -> (Pillow format, MIME type, save options); WebP first, JPEG as the fallback
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Uploads are resized on one background thread instead of the request's;
+# turn off to render inline (e.g. in tests)
+RENDER_IN_BACKGROUND = getattr(settings, 'IMAGE_RENDER_IN_BACKGROUND', True)
+
+# Errors of a file that cannot be rendered; the backfill command retries those
+RENDER_ERRORS = (OSError, Image.DecompressionBombError)
+
+
+def rendition_name(name, width, ext):
+    """``products/phone.jpg`` -> ``products/phone.400w.webp``, next to the original"""
+    root, _ = posixpath.splitext(name)
+    return f'{root}.{width}w.{ext}'
+
+
+def rendition_names(record):
+    """Every file a stored renditions record refers to"""
+    return [
+        rendition_name(record['name'], width, ext)
+        for width in record.get('widths', ())
+        for ext in RENDITION_FORMATS
+    ]
+
+
+def needs_refresh(name, record):
+    """Whether a stored renditions record no longer describes image file ``name`` (uploaded, replaced or cleared)"""
+    if not record:
+        return bool(name)
+    return record.get('name') != name
+
+
+def _flatten(image):
+    """RGB copy for JPEG, compositing transparency onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(name, storage=default_storage, widths=RENDITION_WIDTHS):
+    """
+    Write the WebP and JPEG renditions of one stored image.
+
+    Only widths narrower than the original are produced, so small uploads
+    are never upscaled; an image narrower than every width gets none and is
+    served as is. Existing renditions are overwritten. Needs no database
+    access, so it can run in a worker process.
+
+    Args:
+        name (str): Storage name of the original, e.g. ``products/phone.jpg``
+        storage: Storage holding the original and receiving the renditions
+
+    Returns:
+        dict: Renditions record ``{'name': name, 'widths': [...]}`` to store on the model
+    """
+    with storage.open(name, 'rb') as f:
+        original = ImageOps.exif_transpose(Image.open(f))
+        original.load()
+
+    generated = []
+    for width in sorted(widths):
+        if width >= original.width:
+            break
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for ext, (fmt, _, options) in RENDITION_FORMATS.items():
+            image = _flatten(resized) if fmt == 'JPEG' else resized.convert('RGBA' if 'A' in resized.mode else 'RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, **options)
+            target = rendition_name(name, width, ext)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+        generated.append(width)
+    return {'name': name, 'widths': generated}
+
+
+def make_placeholder(name, storage=default_storage):
+    """
+    Tiny blurred WebP of a stored image as a ``data:`` URI (about 150 bytes).
+
+    JPEGs are decoded at reduced scale, so this stays cheap even for large
+    originals.
+    """
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    image = _flatten(image).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def delete_renditions(record, storage=default_storage):
+    """Remove the files of a renditions record, e.g. after the image was replaced"""
+    for target in rendition_names(record or {}):
+        if storage.exists(target):
+            storage.delete(target)
+
+
+def refresh_renditions(instance, field='image', record_field='image_renditions'):
+    """
+    Bring an object's renditions (and placeholder, if it has one) in line with its current image.
+
+    Runs when the stored record names a different file than the image field
+    (a new upload, a replaced or a cleared image). The result is written
+    with a conditional ``UPDATE`` so a concurrent re-upload is not
+    overwritten with renditions of the older file.
+    """
+    image = getattr(instance, field)
+    record = getattr(instance, record_field) or {}
+    if not needs_refresh(image.name, record):
+        return
+    if record:
+        delete_renditions(record, image.storage)
+    rows = type(instance)._default_manager.filter(pk=instance.pk)
+    updates = {record_field: {}}
+    if hasattr(instance, PLACEHOLDER_FIELD):
+        updates[PLACEHOLDER_FIELD] = ''
+    if image:
+        updates[record_field] = render(image.name, image.storage)
+        if PLACEHOLDER_FIELD in updates:
+            updates[PLACEHOLDER_FIELD] = make_placeholder(image.name, image.storage)
+        rows = rows.filter(**{field: image.name})
+    rows.update(**updates)
+    for name, value in updates.items():
+        setattr(instance, name, value)
+
+
+def refresh_stored(model, pk):
+    """``refresh_renditions`` for the row as stored now; an unreadable file is left to the backfill"""
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    try:
+        refresh_renditions(instance)
+    except RENDER_ERRORS:
+        # Pages keep serving the original until a backfill succeeds
+        pass
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def _refresh_in_worker(model, pk):
+    try:
+        refresh_stored(model, pk)
+    finally:
+        # The worker thread outlives the request; don't keep its connection open
+        connection.close()
+
+
+def refresh_later(model, pk):
+    """Queue ``refresh_stored`` on the background renderer (inline when RENDER_IN_BACKGROUND is off)"""
+    global _renderer
+    if not RENDER_IN_BACKGROUND:
+        refresh_stored(model, pk)
+        return
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='renditions')
+    _renderer.submit(_refresh_in_worker, model, pk)
+
+
+def _forget_renderer():
+    # A forked child inherits the executor but not its thread
+    global _renderer, _renderer_lock
+    _renderer, _renderer_lock = None, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):  # not on Windows
+    os.register_at_fork(after_in_child=_forget_renderer)
+
+
+def srcset(record, ext, storage=default_storage):
+    """``srcset`` value for one rendition format of a stored record"""
+    return ', '.join(
+        f'{storage.url(rendition_name(record["name"], width, ext))} {width}w'
+        for width in record['widths']
+    )
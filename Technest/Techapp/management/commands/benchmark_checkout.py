@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import RequestFactory
+from Techapp import orders
+from Techapp.models import Cart, OrderItem, Product
+from Techapp.utils import CartService
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent checkouts against one hot product and report throughput and oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=200, help='Number of customers checking out')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent checkout threads')
+        parser.add_argument('--stock', type=int, default=50, help='Initial stock of the hot product')
+        parser.add_argument('--quantity', type=int, default=1, help='Units in each cart')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        run_id = uuid.uuid4().hex[:8]
+        quantity = options['quantity']
+
+        product = Product.objects.create(
+            name=f'Benchmark Hot Product {run_id}', desc='Checkout benchmark',
+            price=10, stock=options['stock'], sku=f'BENCH-{run_id}',
+        )
+        User.objects.bulk_create([
+            User(username=f'bench-{run_id}-{i}', password='!')
+            for i in range(options['checkouts'])
+        ])
+        users = list(User.objects.filter(username__startswith=f'bench-{run_id}-'))
+        Cart.objects.bulk_create([Cart(user=user, product=product, quantity=quantity) for user in users])
+
+        pending = queue.Queue()
+        for user in users:
+            pending.put(user)
+        outcomes = {'placed': 0, 'sold_out': 0, 'errors': 0, 'retries': 0}
+        lock = threading.Lock()
+        factory = RequestFactory()
+
+        def record(outcome, retries):
+            with lock:
+                outcomes[outcome] += 1
+                outcomes['retries'] += retries
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        user = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    request = factory.post('/place-order/')
+                    request.user = user
+                    request.session = SessionStore()
+                    retries = 0
+                    while True:
+                        try:
+                            orders.place_order(CartService(request))
+                            record('placed', retries)
+                        except orders.InsufficientStock:
+                            record('sold_out', retries)
+                        except OperationalError:
+                            # SQLite lock contention: try the whole transaction again
+                            retries += 1
+                            if retries <= 50:
+                                continue
+                            record('errors', retries)
+                        except Exception:
+                            record('errors', retries)
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+        oversell = max(0, sold - options['stock']) + max(0, -product.stock)
+        attempts = options['checkouts']
+
+        self.stdout.write(f"Checkouts:   {attempts} ({options['workers']} workers, {quantity} unit(s) each)")
+        self.stdout.write(f"Placed:      {outcomes['placed']}")
+        self.stdout.write(f"Sold out:    {outcomes['sold_out']}")
+        self.stdout.write(f"Errors:      {outcomes['errors']} (lock retries: {outcomes['retries']})")
+        self.stdout.write(f"Stock:       {options['stock']} -> {product.stock}, units sold {sold}")
+        self.stdout.write(f'Elapsed:     {elapsed:.3f}s ({attempts / elapsed:.1f} checkouts/s)')
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=f'bench-{run_id}-').delete()
+            product.delete()
+
+        if oversell or sold + product.stock != options['stock']:
+            raise CommandError(f'Oversold {oversell} unit(s)')
+        self.stdout.write(self.style.SUCCESS('Oversell:    0'))
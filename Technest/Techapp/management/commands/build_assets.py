@@ -0,0 +1,25 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from Techapp import assets
+
+
+class Command(BaseCommand):
+    help = 'Bundle the page-critical CSS and JS into fingerprinted files with gzip (and brotli) siblings'
+
+    def handle(self, *args, **options):
+        try:
+            manifest = assets.build()
+        except (assets.AssetError, OSError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        for name, filename in manifest.items():
+            path = os.path.join(assets.ASSET_BUILD_DIR, filename)
+            sizes = [f'{os.path.getsize(path) / 1024:.0f} KiB']
+            for coding, suffix in assets.ENCODINGS.items():
+                if os.path.exists(path + suffix):
+                    sizes.append(f'{coding} {os.path.getsize(path + suffix) / 1024:.0f} KiB')
+            self.stdout.write(f'  {name} -> {filename} ({", ".join(sizes)}, {len(assets.BUNDLES[name])} files)')
+        if assets.brotli is None:
+            self.stdout.write('  brotli is not installed; only gzip siblings were written')
+        self.stdout.write(self.style.SUCCESS(f'Built {len(manifest)} bundles in {assets.ASSET_BUILD_DIR}'))
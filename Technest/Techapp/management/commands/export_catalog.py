@@ -0,0 +1,113 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from Techapp import feeds
+
+
+class Command(BaseCommand):
+    help = 'Export the catalog as CSV, JSONL or shopping-feed XML, or write the sitemap files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=(*feeds.FORMATS, 'sitemap'), default='csv')
+        parser.add_argument('--output', required=True,
+                            help='File to write (a directory for --format sitemap)')
+        parser.add_argument('--base-url', default=feeds.SITE_URL,
+                            help='Site root for absolute links, e.g. https://shop.example.com')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only export products changed since the last incremental run')
+        parser.add_argument('--since', help='Only export products changed since this ISO timestamp')
+        parser.add_argument('--state-file', help='Where --incremental keeps its watermark (default: OUTPUT.state)')
+        parser.add_argument('--chunk-size', type=int, default=feeds.EXPORT_CHUNK_SIZE,
+                            help='Products fetched per database round trip')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        started = time.monotonic()
+        if options['format'] == 'sitemap':
+            if options['incremental'] or options['since']:
+                raise CommandError('Sitemaps are always written in full')
+            if not base_url:
+                raise CommandError('Sitemaps need absolute links: pass --base-url')
+            files = self.write_sitemaps(options['output'], base_url, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {files} sitemap files to {options["output"]} in {time.monotonic() - started:.2f}s'
+            ))
+            return
+
+        state_file = options['state_file'] or options['output'] + '.state'
+        since = self.parse_since(options['since']) if options['since'] else None
+        if options['incremental'] and since is None:
+            since = self.read_watermark(state_file)
+        watermark = timezone.now()
+
+        exported = 0
+
+        def counted(products):
+            nonlocal exported
+            for product in products:
+                exported += 1
+                yield product
+
+        products = feeds.iter_products(
+            feeds.export_queryset(since, with_description=options['format'] == 'xml'),
+            chunk_size=options['chunk_size'],
+        )
+        self.write_atomically(options['output'], feeds.export_lines(options['format'], counted(products), base_url))
+        if options['incremental']:
+            self.write_atomically(state_file, [json.dumps({'watermark': watermark.isoformat()})])
+
+        elapsed = time.monotonic() - started
+        scope = f'changed since {since.isoformat()}' if since else 'active'
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {exported} {scope} products to {options["output"]} in {elapsed:.2f}s'
+        ))
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError(f'Invalid timestamp {value!r}; expected ISO 8601')
+        return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+    def read_watermark(self, state_file):
+        """Watermark of the previous incremental run, or None for a first (full) run"""
+        try:
+            with open(state_file, encoding='utf-8') as f:
+                return self.parse_since(json.load(f)['watermark'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Unreadable state file {state_file}; delete it to run a full export')
+
+    def write_atomically(self, path, lines):
+        """Stream lines to a temporary file and move it into place once complete"""
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                for chunk in feeds.buffered(lines):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            raise CommandError(f'Cannot write {path}: {e.strerror}')
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_sitemaps(self, directory, base_url, chunk_size):
+        os.makedirs(directory, exist_ok=True)
+        pages = feeds.sitemap_product_pages()
+        sections = ['sitemap-categories.xml'] + [f'sitemap-products-{page}.xml' for page in range(1, pages + 1)]
+        self.write_atomically(os.path.join(directory, sections[0]), feeds.category_sitemap_lines(base_url))
+        for page in range(1, pages + 1):
+            self.write_atomically(
+                os.path.join(directory, f'sitemap-products-{page}.xml'),
+                feeds.product_sitemap_lines(page, base_url, chunk_size),
+            )
+        self.write_atomically(
+            os.path.join(directory, 'sitemap.xml'),
+            feeds.sitemap_index_lines(f'{base_url}/{name}' for name in sections),
+        )
+        return len(sections) + 1
@@ -0,0 +1,137 @@
+import csv
+import json
+import time
+from collections import defaultdict
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from Techapp import downloads
+from Techapp.models import Product
+
+# Product lookups per query while resolving the mapping
+RESOLVE_BATCH_SIZE = 500
+
+
+def read_mapping(path, match):
+    """
+    ``(key, url)`` pairs from a mapping file.
+
+    CSV files need a header with a ``url`` column and a column named after
+    ``match`` (``sku``, ``id`` or ``name``); ``.json`` files hold one object
+    mapping keys to URLs.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.lower().endswith('.json'):
+            mapping = json.load(f)
+            if not isinstance(mapping, dict):
+                raise CommandError(f'{path}: expected a JSON object of {match} -> url')
+            yield from ((str(key), url) for key, url in mapping.items())
+            return
+        reader = csv.DictReader(f)
+        if not {match, 'url'} <= set(reader.fieldnames or ()):
+            raise CommandError(f'{path}: CSV needs "{match}" and "url" columns')
+        for row in reader:
+            if row[match] and row['url']:
+                yield row[match].strip(), row['url'].strip()
+
+
+class Command(BaseCommand):
+    help = 'Download product images from a URL mapping file into content-addressed media files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mapping', help='CSV (<match>,url columns) or JSON object of product -> image URL')
+        self.add_fetch_arguments(parser)
+
+    def add_fetch_arguments(self, parser):
+        parser.add_argument('--match', choices=('sku', 'id', 'name'), default='sku',
+                            help='Product field the mapping keys refer to')
+        parser.add_argument('--workers', type=int, default=downloads.FETCH_WORKERS,
+                            help='Concurrent downloads')
+        parser.add_argument('--timeout', type=float, default=downloads.FETCH_TIMEOUT,
+                            help='Socket timeout per request, in seconds')
+        parser.add_argument('--max-bytes', type=int, default=downloads.MAX_IMAGE_BYTES,
+                            help='Largest image accepted')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Replace images products already have')
+        parser.add_argument('--skip-renditions', action='store_true',
+                            help="Don't generate renditions and placeholders for the new images")
+
+    def handle(self, *args, **options):
+        try:
+            pairs = list(read_mapping(options['mapping'], options['match']))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["mapping"]}: {e.strerror}')
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f'{options["mapping"]}: {e}')
+        self.fetch(pairs, options)
+
+    def fetch(self, pairs, options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        started = time.monotonic()
+        targets, unknown = self.resolve(pairs, options['match'], options['overwrite'])
+        for key in unknown[:20]:
+            self.stderr.write(f'No product with {options["match"]} {key!r}')
+        if len(unknown) > 20:
+            self.stderr.write(f'... and {len(unknown) - 20} more unknown products')
+
+        downloaded = reused = failed = updated = size = 0
+        fetcher = downloads.ImageFetcher(
+            workers=options['workers'], timeout=options['timeout'], max_bytes=options['max_bytes'],
+        )
+        with fetcher:
+            for url, result in fetcher.fetch_all(targets):
+                if isinstance(result, downloads.FetchError):
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(str(result)))
+                    continue
+                downloaded += result.created
+                reused += not result.created
+                size += result.size
+                updated += Product.objects.filter(pk__in=targets[url]).update(
+                    image=result.name, updated_at=timezone.now(),
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Fetched {len(targets)} URLs in {elapsed:.2f}s'))
+        self.stdout.write(f'  Stored:       {downloaded}')
+        self.stdout.write(f'  Duplicates:   {reused}')
+        self.stdout.write(f'  Failed:       {failed}')
+        self.stdout.write(f'  Products:     {updated}')
+        self.stdout.write(f'  Downloaded:   {size / 1024:.0f} KiB over {fetcher.connections_opened} connections')
+
+        if updated and not options['skip_renditions']:
+            call_command('generate_image_renditions', model='products', stdout=self.stdout, stderr=self.stderr)
+
+    def resolve(self, pairs, match, overwrite):
+        """
+        Map each distinct URL to the products that should get it, in mapping file order.
+
+        Returns:
+            tuple: ({url: [product pk, ...]}, [unknown keys])
+        """
+        urls_by_key = defaultdict(dict)
+        for key, url in pairs:
+            urls_by_key[key][url] = None
+        keys = list(urls_by_key)
+        if match == 'id':
+            keys = [key for key in keys if key.isdigit()]
+
+        products_by_key = defaultdict(list)
+        for start in range(0, len(keys), RESOLVE_BATCH_SIZE):
+            products = Product.objects.filter(**{f'{match}__in': keys[start:start + RESOLVE_BATCH_SIZE]})
+            for pk, key, image in products.order_by('pk').values_list('pk', match, 'image'):
+                if overwrite or not image:
+                    products_by_key[str(key)].append(pk)
+                else:
+                    products_by_key.setdefault(str(key), [])
+
+        targets = defaultdict(list)
+        for key, urls in urls_by_key.items():
+            for url in urls:
+                targets[url].extend(products_by_key.get(key, ()))
+        return (
+            {url: pks for url, pks in targets.items() if pks},
+            [key for key in urls_by_key if key not in products_by_key],
+        )
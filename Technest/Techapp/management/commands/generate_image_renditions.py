@@ -0,0 +1,112 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from Techapp import images
+from Techapp.models import Category, Product
+
+MODELS = {'products': Product, 'categories': Category}
+
+
+def _init_worker():
+    # Spawned workers (macOS, Windows) start without Django configured
+    django.setup()
+
+
+def _render(job):
+    """Worker: render one image's renditions and/or placeholder, returning (name, updates, error)"""
+    name, renditions, placeholder = job
+    updates = {}
+    try:
+        if renditions:
+            updates['image_renditions'] = images.render(name)
+        if placeholder:
+            updates[images.PLACEHOLDER_FIELD] = images.make_placeholder(name)
+    except images.RENDER_ERRORS as e:
+        return name, None, str(e)
+    return name, updates, None
+
+
+class Command(BaseCommand):
+    help = 'Generate missing WebP/JPEG renditions and blurred placeholders for images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=(*MODELS, 'all'), default='all')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes resizing images')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Images handed to the pool per round')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions and placeholders that are already up to date')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+        models = MODELS.values() if options['model'] == 'all' else [MODELS[options['model']]]
+        started = time.monotonic()
+        rendered = failed = 0
+
+        # Workers only read and write files; every database write stays in this process
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            for model in models:
+                for batch in self.pending(model, options['batch_size'], options['force']):
+                    for job in batch.values():
+                        for record in job['stale_records']:
+                            images.delete_renditions(record)
+                    results = list(pool.map(_render, [
+                        (name, job['renditions'], job['placeholder']) for name, job in batch.items()
+                    ]))
+                    # Write the batch's records only once rendering is done, so no lock is held meanwhile
+                    with transaction.atomic():
+                        for name, updates, error in results:
+                            pks = batch[name]['pks']
+                            if error:
+                                failed += 1
+                                self.stderr.write(f'{model.__name__} {", ".join(map(str, pks))} ({name}): {error}')
+                                continue
+                            model.objects.filter(pk__in=pks, image=name).update(**updates)
+                            rendered += 1
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f'  {rendered} images rendered')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} images ({failed} failed) in {time.monotonic() - started:.2f}s'
+        ))
+
+    def pending(self, model, batch_size, force):
+        """
+        Yield batches of images whose renditions or placeholder are out of date.
+
+        Each batch maps an image name to the pks using it (a file shared by
+        several objects is rendered once), what needs generating and the
+        stale records to clean up. Images whose renditions are current but
+        lack a placeholder only get the (cheap) placeholder.
+        """
+        has_placeholder = any(field.name == images.PLACEHOLDER_FIELD for field in model._meta.concrete_fields)
+        columns = ['pk', 'image', 'image_renditions'] + ([images.PLACEHOLDER_FIELD] if has_placeholder else [])
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).exclude(image='').exclude(image__isnull=True)
+                .order_by('pk').values_list(*columns)[:batch_size]
+            )
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            batch = {}
+            for pk, name, record, *placeholder in rows:
+                renditions = force or images.needs_refresh(name, record)
+                placeholder = has_placeholder and (renditions or not placeholder[0])
+                if not (renditions or placeholder):
+                    continue
+                job = batch.setdefault(name, {'pks': [], 'stale_records': [], 'renditions': False, 'placeholder': False})
+                job['pks'].append(pk)
+                job['renditions'] |= renditions
+                job['placeholder'] |= placeholder
+                if record and record.get('name') != name:
+                    job['stale_records'].append(record)
+            if batch:
+                yield batch
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from Techapp import catalog
+
+
+class Command(BaseCommand):
+    help = 'Import or update products from a CSV or JSONL supplier feed, upserting by SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file (format guessed from the extension)')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Override the detected file format')
+        parser.add_argument('--batch-size', type=int, default=catalog.IMPORT_BATCH_SIZE,
+                            help='Products written per upsert statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate every row without writing anything')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        fmt = options['format'] or catalog.detect_format(options['path'])
+        started = time.monotonic()
+
+        def progress(rows):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {rows} rows, {rows / max(time.monotonic() - started, 1e-9):.0f} rows/s')
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                result = catalog.import_catalog(
+                    catalog.read_rows(stream, fmt),
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    on_batch=progress,
+                )
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e.strerror}')
+        elapsed = time.monotonic() - started
+
+        for error in result.errors:
+            self.stderr.write(f'line {error.line} ({error.sku or "no sku"}): {error.message}')
+        if result.invalid > len(result.errors):
+            self.stderr.write(f'... and {result.invalid - len(result.errors)} more invalid rows')
+
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Read {result.rows} rows in {elapsed:.2f}s'))
+        self.stdout.write(f'  Valid:    {result.rows - result.invalid}')
+        self.stdout.write(f'  Created:  {result.created}')
+        self.stdout.write(f'  Updated:  {result.updated}')
+        self.stdout.write(f'  Invalid:  {result.invalid}')
+        self.stdout.write(f'  Rate:     {result.rows / max(elapsed, 1e-9):.0f} rows/s')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from Techapp import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored product rating aggregates and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Products checked per batch')
+
+    def handle(self, *args, **options):
+        checked, repaired = ratings.reconcile(chunk_size=options['chunk_size'])
+
+        if repaired:
+            self.stdout.write(self.style.WARNING(f'Repaired {repaired} of {checked} products'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'All {checked} products are consistent'))
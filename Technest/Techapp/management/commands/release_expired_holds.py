@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Techapp import holds
+
+
+class Command(BaseCommand):
+    help = 'Release expired checkout stock holds back to available stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=holds.SWEEP_BATCH_SIZE,
+                            help='Holds released per transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep sweeping every N seconds instead of running once')
+
+    def handle(self, *args, **options):
+        while True:
+            released = holds.sweep_expired(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired holds'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
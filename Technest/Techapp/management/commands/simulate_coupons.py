@@ -0,0 +1,67 @@
+from datetime import datetime, time as dt_time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from Techapp import simulator
+from Techapp.models import Coupon, Order
+
+
+def parse_spec(text):
+    """Parse ``percentage:10`` or ``fixed:20:100`` (type, value, optional minimum purchase)"""
+    parts = text.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in ('percentage', 'fixed'):
+        raise CommandError(f'Invalid --spec {text!r}; expected percentage:VALUE[:MIN] or fixed:VALUE[:MIN]')
+    try:
+        value = Decimal(parts[1])
+        minimum = Decimal(parts[2]) if len(parts) == 3 else None
+    except InvalidOperation:
+        raise CommandError(f'Invalid number in --spec {text!r}')
+    return simulator.CouponSpec(text, parts[0], value, minimum)
+
+
+class Command(BaseCommand):
+    help = 'Estimate what coupon definitions would have cost across past orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--coupon', action='append', default=[], metavar='CODE',
+                            help='Existing coupon to simulate (repeatable)')
+        parser.add_argument('--spec', action='append', default=[], metavar='TYPE:VALUE[:MIN]',
+                            help='Ad-hoc coupon definition, e.g. percentage:15 or fixed:20:100 (repeatable)')
+        parser.add_argument('--since', help='Only orders placed on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=simulator.SIMULATION_CHUNK_SIZE,
+                            help='Orders loaded per chunk')
+
+    def handle(self, *args, **options):
+        if not simulator.is_available():
+            raise CommandError('The coupon simulator requires NumPy (pip install numpy)')
+
+        specs = [parse_spec(text) for text in options['spec']]
+        if options['coupon']:
+            coupons = Coupon.objects.in_bulk(options['coupon'], field_name='code')
+            missing = set(options['coupon']) - set(coupons)
+            if missing:
+                raise CommandError(f"Unknown coupon(s): {', '.join(sorted(missing))}")
+            specs += [simulator.spec_from_coupon(coupons[code]) for code in options['coupon']]
+        if not specs:
+            specs = [simulator.spec_from_coupon(coupon) for coupon in Coupon.objects.filter(is_active=True)]
+        if not specs:
+            raise CommandError('Nothing to simulate: pass --coupon or --spec')
+
+        orders = Order.objects.exclude(status__in=simulator.EXCLUDED_STATUSES)
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+            orders = orders.filter(created_at__gte=timezone.make_aware(datetime.combine(since, dt_time.min)))
+
+        chunks = simulator.iter_order_totals(orders, chunk_size=options['chunk_size'])
+        for result in simulator.simulate(specs, chunks):
+            self.stdout.write(self.style.SUCCESS(result.spec.label))
+            self.stdout.write(f'  Orders:          {result.orders}')
+            self.stdout.write(f'  Affected orders: {result.affected_orders}')
+            self.stdout.write(f'  Total discount:  ${result.total_discount}')
+            self.stdout.write(f'  Avg discount:    ${result.average_discount}')
+            for bucket, count in result.distribution.items():
+                self.stdout.write(f'    {bucket:>10}: {count}')
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Techapp', '0010_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_id_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(on_sale=True, sale_price__gt=0, then=models.F('sale_price')), default=models.F('price')), output_field=models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='product_eff_price_id_idx'),
+        ),
+    ]
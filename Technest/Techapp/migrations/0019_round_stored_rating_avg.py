@@ -0,0 +1,21 @@
+from django.db import migrations, models
+from django.db.models.functions import Cast, Round
+
+
+def round_rating_avg(apps, schema_editor):
+    # Averages written by review updates used to be stored unrounded (4.3333 in a 3,2 column)
+    Product = apps.get_model('Techapp', 'Product')
+    Product.objects.filter(rating_count__gt=0).update(
+        rating_avg=Round(Cast(models.F('rating_sum') * 100, models.FloatField()) / models.F('rating_count')) / 100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Techapp', '0018_product_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.RunPython(round_rating_avg, migrations.RunPython.noop),
+    ]
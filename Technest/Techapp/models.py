@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django import forms
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -6,6 +6,19 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
 
+def _skip_maintained_fields(instance, save_kwargs):
+    """Limit an update of ``instance`` to its loaded fields that are not in MAINTAINED_FIELDS"""
+    if instance._state.adding or save_kwargs.get('update_fields') is not None or save_kwargs.get('force_insert'):
+        return
+    # Like Django's own save, leave deferred fields alone instead of loading them one by one
+    deferred = instance.get_deferred_fields()
+    save_kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and not field.generated and field.name not in instance.MAINTAINED_FIELDS
+        and field.attname not in deferred
+    ]
+
+
 # ==================== USER MODEL ====================
 class CustomUser(AbstractUser):
     date_of_birth = models.DateField(null=True, blank=True)
@@ -38,12 +51,21 @@ class Category(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
+    # Resized WebP/JPEG copies of ``image`` (see Techapp.images)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Written by the image pipeline with targeted UPDATEs
+    MAINTAINED_FIELDS = ('image_renditions',)
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        _skip_maintained_fields(self, kwargs)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
@@ -55,6 +77,9 @@ class Product(models.Model):
     desc = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
+    # Resized WebP/JPEG copies of ``image`` and its inline blurred preview (see Techapp.images)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     stock = models.IntegerField(null=True, blank=True, default=0)
     created_at = models.DateTimeField(default=timezone.now)
@@ -66,19 +91,100 @@ class Product(models.Model):
     featured = models.BooleanField(default=False)
     on_sale = models.BooleanField(default=False)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Price actually charged (same rule as get_price), computed and stored by the database
+    # so it stays correct for queryset updates and bulk writes and can be indexed
+    effective_price = models.GeneratedField(
+        expression=models.Case(
+            models.When(on_sale=True, sale_price__gt=0, then=models.F('sale_price')),
+            default=models.F('price'),
+        ),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2, null=True),
+        db_persist=True,
+    )
+
+    # Approved-review aggregates, maintained incrementally (see Techapp.ratings)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Units claimed by active checkout holds (see Techapp.holds)
+    held_stock = models.PositiveIntegerField(default=0, editable=False)
+
+    # Fields kept current by targeted UPDATEs (Techapp.ratings, Techapp.holds, Techapp.images)
+    MAINTAINED_FIELDS = (
+        'rating_sum', 'rating_count', 'rating_avg',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        'held_stock', 'image_renditions', 'image_placeholder',
+    )
+
+    # Fields whose change invalidates memoized price quotes (see Techapp.pricing)
+    PRICING_FIELDS = ('price', 'sale_price', 'on_sale', 'is_active')
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_pricing()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            self._remember_pricing()
+        else:
+            # Only part of the row was reloaded; assume the next save changes prices
+            self._loaded_pricing = None
+
+    def _remember_pricing(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_pricing = None if deferred.intersection(self.PRICING_FIELDS) else {
+            field: getattr(self, field) for field in self.PRICING_FIELDS
+        }
+
+    def pricing_changed(self, update_fields=None):
+        """Whether the last save may have changed what the product costs (True when unknown)"""
+        if update_fields is not None and not set(update_fields).intersection(self.PRICING_FIELDS):
+            return False
+        loaded = getattr(self, '_loaded_pricing', None)
+        if loaded is None:
+            return True
+        return any(getattr(self, field) != value for field, value in loaded.items())
+
+    def save(self, *args, **kwargs):
+        # A full save of a stale instance must not write old counter values back
+        _skip_maintained_fields(self, kwargs)
+        super().save(*args, **kwargs)
+        self._remember_pricing()
+
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination walks these (sort key, id) pairs
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['effective_price', 'id'], name='product_eff_price_id_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='product_rating_id_idx'),
+            # Incremental catalog exports read products changed since a watermark
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id_idx'),
+        ]
 
     @property
     def in_stock(self):
         return self.stock > 0 if self.stock is not None else False
 
+    @property
+    def available_stock(self):
+        """Stock not claimed by another customer's checkout hold"""
+        return max((self.stock or 0) - self.held_stock, 0)
+
     @property
     def get_price(self):
         """Returns sale price if on sale, otherwise regular price"""
@@ -88,16 +194,20 @@ class Product(models.Model):
 
     @property
     def average_rating(self):
-        """Calculate average rating from reviews"""
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return reviews.aggregate(models.Avg('rating'))['rating__avg']
+        """Average rating of approved reviews, from the stored aggregates"""
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
     @property
     def review_count(self):
         """Count approved reviews"""
-        return self.reviews.filter(is_approved=True).count()
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Approved review counts per star, highest first: [(5, n), ..., (1, n)]"""
+        return [(stars, getattr(self, f'rating_{stars}_count')) for stars in range(5, 0, -1)]
 
 
 # ==================== WISHLIST MODEL ====================
@@ -136,11 +246,20 @@ class ProductReview(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating}★)"
 
+    def save(self, *args, **kwargs):
+        # Keep the review row and the product's rating aggregates in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Product Review'
         verbose_name_plural = 'Product Reviews'
         ordering = ['-created_at']
         unique_together = ('product', 'user')
+        indexes = [
+            # Keyset pagination of a product's reviews, newest first
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
 
 
 # ==================== CART MODEL ====================
@@ -170,6 +289,34 @@ class Cart(models.Model):
         return self.subtotal
 
 
+# ==================== STOCK HOLD MODEL ====================
+class StockHold(models.Model):
+    """Stock set aside for a cart between the checkout page and payment"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    cart_key = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} for {self.cart_key}"
+
+    class Meta:
+        verbose_name = 'Stock Hold'
+        verbose_name_plural = 'Stock Holds'
+        unique_together = ('cart_key', 'product')
+
+
+# ==================== SEQUENCE MODEL ====================
+class Sequence(models.Model):
+    """Named counter handed out to processes in blocks (see Techapp.order_numbers)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_value}"
+
+
 # ==================== ORDER MODELS ====================
 class Order(models.Model):
     """Customer orders"""
@@ -245,9 +392,9 @@ class Order(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate unique order number
-            import uuid
-            self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            # Next number from this process's pre-reserved block
+            from .order_numbers import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
     @property
@@ -325,9 +472,16 @@ class Coupon(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Incremented by redemption UPDATEs (Techapp.coupons)
+    MAINTAINED_FIELDS = ('uses_count',)
+
     def __str__(self):
         return f"{self.code} - {self.discount_value}{'%' if self.discount_type == 'percentage' else '$'}"
 
+    def save(self, *args, **kwargs):
+        _skip_maintained_fields(self, kwargs)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Coupon'
         verbose_name_plural = 'Coupons'
@@ -342,7 +496,7 @@ class Coupon(models.Model):
             return False, "Coupon is not yet valid"
         if now > self.valid_to:
             return False, "Coupon has expired"
-        if self.max_uses and self.uses_count >= self.max_uses:
+        if self.max_uses is not None and self.uses_count >= self.max_uses:
             return False, "Coupon usage limit reached"
         return True, "Coupon is valid"
 
@@ -357,6 +511,21 @@ class Coupon(models.Model):
         return min(discount, order_total)
 
 
+class CouponRedemption(models.Model):
+    """How many times a user has redeemed a coupon"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='coupon_redemptions')
+    uses = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} used {self.coupon.code} x{self.uses}"
+
+    class Meta:
+        verbose_name = 'Coupon Redemption'
+        verbose_name_plural = 'Coupon Redemptions'
+        unique_together = ('coupon', 'user')
+
+
 # ==================== NEWSLETTER MODEL ====================
 class NewsletterSubscription(models.Model):
     """Newsletter email subscriptions"""
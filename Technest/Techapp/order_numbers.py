@@ -0,0 +1,111 @@
+import os
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Order numbers start at nine digits so they can never equal a legacy
+# ``ORD-`` + 8 hex character number
+ORDER_NUMBER_SEQUENCE = 'order_number'
+ORDER_NUMBER_START = 100_000_000
+ORDER_NUMBER_PREFIX = 'ORD-'
+
+# Numbers reserved per database round-trip; unused ones are skipped when a
+# process exits, so expect gaps of up to this size
+ORDER_NUMBER_BLOCK_SIZE = getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 100)
+
+
+def reserve_block(connection, name, size, start=1):
+    """
+    Move the named sequence forward by ``size`` and return the block taken.
+
+    Must run inside a transaction on ``connection`` so the increment and
+    the read-back see the same row. A sequence's first use creates its row
+    with an insert that ignores conflicts, so processes racing to create it
+    don't fail; the increment then runs against whichever row won.
+
+    Returns:
+        tuple: (first, last) inclusive bounds of the reserved block
+    """
+    from .models import Sequence
+    table = connection.ops.quote_name(Sequence._meta.db_table)
+    with connection.cursor() as cursor:
+        increment = (f'UPDATE {table} SET last_value = last_value + %s WHERE name = %s', [size, name])
+        cursor.execute(*increment)
+        if cursor.rowcount == 0:
+            Sequence.objects.using(connection.alias).bulk_create(
+                [Sequence(name=name, last_value=start - 1)], ignore_conflicts=True,
+            )
+            cursor.execute(*increment)
+        cursor.execute(f'SELECT last_value FROM {table} WHERE name = %s', [name])
+        last = cursor.fetchone()[0]
+    return last - size + 1, last
+
+
+class BlockAllocator:
+    """
+    Hands out increasing integers from blocks reserved in the database.
+
+    Only the first number of each block costs a query; the rest come from
+    memory under a lock, so allocation is cheap and thread-safe. Every
+    process reserves its own blocks, which keeps numbers unique across
+    workers and roughly time-ordered (blocks interleave, numbers within a
+    block do not). A forked child forgets its parent's block.
+
+    Blocks are only reserved outside transactions: when the cached block
+    runs out inside one, each number is a query that commits or rolls back
+    with the caller.
+    """
+
+    def __init__(self, name, block_size, start=1, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.block_size = block_size
+        self.start = start
+        self.using = using
+        self._reset()
+        _allocators.add(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._next = 1
+        self._last = 0
+
+    def allocate(self):
+        with self._lock:
+            if self._next > self._last:
+                connection = connections[self.using]
+                if connection.in_atomic_block:
+                    # A block reserved here would roll back with the caller while
+                    # its unused numbers stayed cached, so take a single number
+                    return reserve_block(connection, self.name, 1, self.start)[0]
+                with transaction.atomic(using=self.using):
+                    self._next, self._last = reserve_block(connection, self.name, self.block_size, self.start)
+            value = self._next
+            self._next += 1
+            return value
+
+
+# Every live allocator, so one fork hook can reset them all
+_allocators = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for block_allocator in list(_allocators):
+        block_allocator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+allocator = BlockAllocator(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK_SIZE, start=ORDER_NUMBER_START)
+
+
+def format_order_number(value):
+    return f'{ORDER_NUMBER_PREFIX}{value}'
+
+
+def next_order_number():
+    """Return a new unique order number, usually without touching the database"""
+    return format_order_number(allocator.allocate())
@@ -0,0 +1,124 @@
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import coupons, holds, pricing
+from .order_numbers import next_order_number
+from .models import Order, OrderItem, Product
+
+# Checkout form fields copied onto the order
+ORDER_DETAIL_FIELDS = (
+    'guest_name', 'guest_email',
+    'shipping_address', 'shipping_city', 'shipping_state', 'shipping_zip', 'shipping_country',
+    'payment_method', 'notes',
+)
+
+
+class OrderError(Exception):
+    """Raised when a cart cannot be turned into an order"""
+
+
+class InsufficientStock(OrderError):
+    """Raised when one or more products no longer have enough stock"""
+
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f'Not enough stock for: {names}')
+
+
+def reserve_stock(quantities):
+    """
+    Decrement stock for every product in one conditional ``UPDATE``.
+
+    Each row only matches while ``stock >= held_stock + quantity``, so
+    concurrent checkouts can never drive stock negative or take units held
+    for another cart. Must run inside a transaction: if any
+    line is short the caller's transaction is rolled back by the raised
+    ``InsufficientStock``.
+
+    Args:
+        quantities (dict): product_id -> quantity to take
+    """
+    wanted = Case(
+        *[When(pk=pid, then=Value(qty)) for pid, qty in quantities.items()],
+        default=Value(0),
+    )
+    updated = (
+        Product.objects.filter(pk__in=quantities, is_active=True, stock__gte=F('held_stock') + wanted)
+        # Touch updated_at so incremental catalog exports pick up the new stock
+        .update(stock=F('stock') - wanted, updated_at=timezone.now())
+    )
+    if updated != len(quantities):
+        short = [
+            product for product in Product.objects.filter(pk__in=quantities)
+            if not product.is_active or product.available_stock < quantities[product.pk]
+        ]
+        raise InsufficientStock(short)
+
+
+def place_order(cart, details=None, shipping_method='standard', coupon_code=None):
+    """
+    Turn the cart into an ``Order`` and take the ordered lines out of the cart.
+
+    The cart's own checkout hold is released first, so held units count
+    towards its order. Stock reservation, the order row, its items (one bulk
+    insert) and the cart clean-up all commit together or not at all. Only
+    the quantities that were ordered leave the cart, so a line added in
+    another tab meanwhile stays in it.
+
+    Args:
+        cart (CartService): Cart of the customer placing the order
+        details (dict): Optional checkout fields (see ORDER_DETAIL_FIELDS)
+        shipping_method (str): Key into pricing.SHIPPING_RATES
+        coupon_code (str): Optional coupon to redeem with the order
+
+    Returns:
+        Order: The created order
+
+    Raises:
+        OrderError: If the cart is empty
+        InsufficientStock: If a product sold out before the order committed
+        CouponError: If the coupon is unknown or cannot be used
+    """
+    items = cart.get_cart_items()
+    if not items:
+        raise OrderError('Cart is empty')
+
+    details = {field: value for field, value in (details or {}).items() if field in ORDER_DETAIL_FIELDS and value}
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    coupon = coupons.get_coupon(coupon_code) if coupon_code else None
+    quote = pricing.build_quote(items, coupon, shipping_method)
+    if quote.coupon_error:
+        raise coupons.CouponError(quote.coupon_error)
+
+    # Taken before the transaction so a block refill never waits on its locks
+    order_number = next_order_number()
+
+    with transaction.atomic():
+        holds.release_cart(holds.cart_key(cart))
+        holds.release_expired(product_ids=quantities)
+        reserve_stock(quantities)
+        if coupon:
+            coupons.redeem(coupon, cart.user, quote.subtotal)
+        order = Order.objects.create(
+            order_number=order_number,
+            user=cart.user if cart.user.is_authenticated else None,
+            coupon=coupon,
+            subtotal=quote.subtotal,
+            discount=quote.discount,
+            tax=quote.tax,
+            shipping_cost=quote.shipping,
+            total=quote.total,
+            **details,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line.product_id, quantity=line.quantity, price=line.unit_price)
+            for line in quote.lines
+        ])
+        cart.remove_ordered(quantities)
+        holds.publish_available_stock(quantities)
+    return order
@@ -0,0 +1,207 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+
+# Unfiltered listings of tables estimated above this many rows show an
+# approximate total instead of running COUNT(*) over the whole table
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 100_000)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+class KeysetPage:
+    """A single page of results plus the cursor for the page after it"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a ``(field, id)`` ordering.
+
+    Instead of ``OFFSET n`` each page continues from the last row of the
+    previous one with ``WHERE (field, id) > (last_field, last_id)``, so the
+    database walks an index range and the cost of a page does not depend on
+    how deep into the listing it is.
+
+    Args:
+        queryset (QuerySet): Filtered queryset to paginate
+        field (str): Model field or numeric annotation to order by
+            (``id`` is the tie-breaker)
+        descending (bool): Walk the ordering from highest to lowest
+        page_size (int): Number of rows per page
+    """
+
+    def __init__(self, queryset, field, descending=False, page_size=24):
+        self.queryset = queryset
+        self.field = field
+        self.descending = descending
+        self.page_size = page_size
+        try:
+            model_field = queryset.model._meta.get_field(field)
+            # Generated columns are typed by their output field
+            self.model_field = getattr(model_field, 'output_field', model_field)
+            self.nullable = self.model_field.null
+        except FieldDoesNotExist:
+            # Annotations (e.g. a search rank) are computed for every row
+            self.model_field = None
+            self.nullable = False
+
+    def ordering(self):
+        """ORDER BY expressions; NULL values always sort after real values"""
+        if self.descending:
+            return (models.F(self.field).desc(nulls_last=True), '-id')
+        return (models.F(self.field).asc(nulls_last=True), 'id')
+
+    def page(self, cursor=None):
+        """
+        Return the page that starts after ``cursor``.
+
+        Rows with a value and the trailing NULL block are fetched by separate
+        queries, so each one is a plain index range seek.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed
+        """
+        queryset = self.queryset.order_by(*self.ordering())
+        limit = self.page_size + 1
+        value, last_id = self.decode_cursor(cursor) if cursor else (None, None)
+
+        rows = []
+        if not cursor or value is not None:
+            valued = queryset
+            if self.nullable:
+                valued = valued.filter(**{f'{self.field}__isnull': False})
+            if cursor:
+                valued = valued.filter(self._after(value, last_id))
+            rows = list(valued[:limit])
+
+        if self.nullable and len(rows) < limit:
+            nulls = queryset.filter(**{f'{self.field}__isnull': True})
+            if cursor and value is None:
+                nulls = nulls.filter(**{f'id__{self._cmp}': last_id})
+            rows += list(nulls[:limit - len(rows)])
+
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            last = rows[-1]
+            next_cursor = self.encode_cursor(getattr(last, self.field), last.pk)
+        return KeysetPage(rows, next_cursor)
+
+    @property
+    def _cmp(self):
+        return 'lt' if self.descending else 'gt'
+
+    def _after(self, value, last_id):
+        """WHERE clause for rows strictly after ``(value, last_id)``, written as a range"""
+        bound = 'lte' if self.descending else 'gte'
+        return models.Q(**{f'{self.field}__{bound}': value}) & (
+            models.Q(**{f'{self.field}__{self._cmp}': value})
+            | models.Q(**{f'id__{self._cmp}': last_id})
+        )
+
+    def encode_cursor(self, value, last_id):
+        """Serialize a ``(value, id)`` position into an opaque URL-safe token"""
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif value is not None and not isinstance(value, (int, float)):
+            value = str(value)
+        raw = json.dumps([value, last_id], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Parse a token produced by :meth:`encode_cursor`"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        if value is None:
+            return None, last_id
+        if isinstance(self.model_field, models.DateTimeField):
+            parsed = parse_datetime(str(value))
+        elif isinstance(self.model_field, models.DecimalField):
+            try:
+                parsed = Decimal(str(value))
+            except InvalidOperation:
+                parsed = None
+        elif self.model_field is None:
+            parsed = value if isinstance(value, (int, float)) else None
+        else:
+            parsed = value
+        if parsed is None:
+            raise InvalidCursor('Invalid cursor')
+        return parsed, last_id
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Approximate number of rows in a model's table, without scanning it.
+
+    Reads the planner statistics on PostgreSQL and MySQL and the highest
+    rowid on SQLite. Returns ``None`` when the backend offers no estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(_rowid_) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for a table that was never analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts table statistics for large, unfiltered listings.
+
+    An exact ``COUNT(*)`` over millions of rows dominates the cost of an
+    admin changelist page. When the queryset has no filters and the table
+    is estimated above ``threshold`` rows, the estimate is used as the
+    count; filtered or small listings are counted exactly.
+    """
+    threshold = ESTIMATED_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, models.QuerySet) and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,177 @@
+import hashlib
+import math
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .utils import get_cart_version
+
+TAX_RATE = Decimal('0.10')
+SHIPPING_RATES = {
+    'standard': Decimal('0.00'),
+    'express': Decimal('10.00'),
+}
+DEFAULT_SHIPPING = 'standard'
+
+# Quotes are reused while neither the cart nor any price or coupon changed
+QUOTE_TIMEOUT = 300
+
+_CENT = Decimal('0.01')
+_PRICING_VERSION_KEY = 'pricing:version'
+
+
+@dataclass(frozen=True)
+class QuoteLine:
+    product_id: int
+    quantity: int
+    unit_price: Decimal
+    total: Decimal
+
+
+@dataclass(frozen=True)
+class Quote:
+    """Every amount the customer sees for a cart, computed in one place"""
+    lines: tuple
+    subtotal: Decimal
+    discount: Decimal
+    tax: Decimal
+    shipping: Decimal
+    total: Decimal
+    shipping_method: str = DEFAULT_SHIPPING
+    coupon_code: str = None
+    coupon_error: str = None
+
+    @property
+    def item_count(self):
+        return sum(line.quantity for line in self.lines)
+
+    def as_dict(self):
+        return {
+            'subtotal': str(self.subtotal),
+            'discount': str(self.discount),
+            'tax': str(self.tax),
+            'shipping': str(self.shipping),
+            'total': str(self.total),
+            'shipping_method': self.shipping_method,
+            'coupon_code': self.coupon_code,
+            'coupon_error': self.coupon_error,
+            'item_count': self.item_count,
+        }
+
+
+def get_pricing_version():
+    """Stamp that moves whenever a product price or coupon may have changed"""
+    version = cache.get(_PRICING_VERSION_KEY)
+    if version is None:
+        cache.add(_PRICING_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(_PRICING_VERSION_KEY)
+    return version
+
+
+def bump_pricing_version():
+    try:
+        cache.incr(_PRICING_VERSION_KEY)
+    except ValueError:
+        cache.set(_PRICING_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def build_quote(items, coupon=None, shipping_method=DEFAULT_SHIPPING, coupon_error=None):
+    """
+    Run the pricing pipeline: lines, subtotal, coupon discount, tax, shipping.
+
+    Tax applies to the discounted subtotal. A coupon that is not valid for
+    the cart is left out and its reason recorded on the quote.
+
+    Args:
+        items: Cart lines (``Cart`` or ``GuestCartItem``) with products loaded
+        coupon (Coupon): Optional coupon to preview; it is not redeemed
+        shipping_method (str): Key into SHIPPING_RATES
+
+    Returns:
+        Quote: The frozen result
+    """
+    lines = []
+    for item in items:
+        unit_price = item.product.get_price or Decimal('0')
+        lines.append(QuoteLine(item.product_id, item.quantity, unit_price, unit_price * item.quantity))
+    subtotal = sum((line.total for line in lines), Decimal('0'))
+
+    discount = Decimal('0')
+    if coupon is not None:
+        valid, message = coupon.is_valid()
+        if not valid:
+            coupon_error = message
+        elif coupon.min_purchase_amount and subtotal < coupon.min_purchase_amount:
+            coupon_error = f'Coupon requires a minimum purchase of ${coupon.min_purchase_amount}'
+        else:
+            discount = coupon.calculate_discount(subtotal).quantize(_CENT)
+
+    if shipping_method not in SHIPPING_RATES:
+        shipping_method = DEFAULT_SHIPPING
+    shipping = SHIPPING_RATES[shipping_method]
+    tax = ((subtotal - discount) * TAX_RATE).quantize(_CENT)
+
+    return Quote(
+        lines=tuple(lines),
+        subtotal=subtotal,
+        discount=discount,
+        tax=tax,
+        shipping=shipping,
+        total=subtotal - discount + tax + shipping,
+        shipping_method=shipping_method,
+        coupon_code=coupon.code if coupon is not None else None,
+        coupon_error=coupon_error,
+    )
+
+
+def _cart_stamp(cart):
+    """Version stamp of a cart: the user's cart version, or a digest of the session cart"""
+    if cart.user.is_authenticated:
+        return f'user:{cart.user.pk}:{get_cart_version(cart.user.pk)}'
+    contents = repr(sorted((str(pid), qty) for pid, qty in cart.cart.items()))
+    return 'guest:' + hashlib.blake2b(contents.encode(), digest_size=12).hexdigest()
+
+
+def _quote_timeout(coupon):
+    """Seconds a quote may be reused: never past the moment its coupon starts or stops being valid"""
+    timeout = QUOTE_TIMEOUT
+    if coupon is not None:
+        now = timezone.now()
+        for boundary in (coupon.valid_from, coupon.valid_to):
+            if boundary > now:
+                timeout = min(timeout, max(1, math.ceil((boundary - now).total_seconds())))
+    return timeout
+
+
+def quote_cart(cart, coupon_code=None, shipping_method=DEFAULT_SHIPPING):
+    """
+    Price a cart, reusing the quote while the cart and prices are unchanged.
+
+    The memo key combines the cart's version stamp, the pricing version and
+    the requested coupon and shipping method, so a hit skips loading the
+    cart lines entirely. A quote with a coupon expires when the coupon's
+    validity window opens or closes.
+
+    Returns:
+        Quote: The frozen quote
+    """
+    from .coupons import CouponError, get_coupon
+
+    key = 'quote:' + hashlib.blake2b(
+        repr((_cart_stamp(cart), get_pricing_version(), coupon_code or '', shipping_method)).encode(),
+        digest_size=16,
+    ).hexdigest()
+    quote = cache.get(key)
+    if quote is None:
+        coupon, coupon_error = None, None
+        if coupon_code:
+            try:
+                coupon = get_coupon(coupon_code)
+            except CouponError as e:
+                coupon_error = str(e)
+        quote = build_quote(cart.get_cart_items(), coupon, shipping_method, coupon_error)
+        cache.set(key, quote, _quote_timeout(coupon))
+    return quote
@@ -0,0 +1,148 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models
+from django.db.models.functions import Cast, Round
+
+STAR_FIELDS = {stars: f'rating_{stars}_count' for stars in range(1, 6)}
+AGGREGATE_FIELDS = ['rating_sum', 'rating_count', 'rating_avg', *STAR_FIELDS.values()]
+
+
+def apply_rating_change(product_id, removed=None, added=None):
+    """
+    Move a product's stored rating aggregates by one review.
+
+    Runs a single ``UPDATE`` built from ``F()`` expressions, so concurrent
+    review writes never overwrite each other's counts. The average is
+    rounded in SQL to the cents the column holds, the same value
+    :func:`actual_aggregates` computes: an unrounded 4.3333 would sort and
+    compare differently from the 4.33 read back (and put in cursors).
+
+    Args:
+        product_id (int): Product whose aggregates change
+        removed (int): Star rating that stops counting (or None)
+        added (int): Star rating that starts counting (or None)
+    """
+    from .models import Product
+
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+    star_deltas = {}
+    for stars, delta in ((removed, -1), (added, 1)):
+        if stars is not None:
+            star_deltas[stars] = star_deltas.get(stars, 0) + delta
+    if not count_delta and not sum_delta and not any(star_deltas.values()):
+        return
+
+    new_count = models.F('rating_count') + count_delta
+    new_sum = models.F('rating_sum') + sum_delta
+    updates = {
+        'rating_count': new_count,
+        'rating_sum': new_sum,
+        'rating_avg': models.Case(
+            models.When(
+                rating_count__gt=-count_delta,
+                # Rounding hundredths to an integer keeps exact .5 ties exact in floating point
+                then=Round(Cast(new_sum * 100, models.FloatField()) / new_count) / 100,
+            ),
+            default=models.Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=3, decimal_places=2),
+        ),
+    }
+    for stars, delta in star_deltas.items():
+        if delta:
+            updates[STAR_FIELDS[stars]] = models.F(STAR_FIELDS[stars]) + delta
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def counted_rating(review):
+    """Return ``(product_id, rating)`` if the review counts towards aggregates"""
+    if review is None or not review.is_approved:
+        return None
+    return review.product_id, review.rating
+
+
+def apply_review_transition(before, after):
+    """
+    Update aggregates for a review going from state ``before`` to ``after``.
+
+    Both states are ``(product_id, rating)`` tuples from :func:`counted_rating`
+    or None when the review doesn't count (new, unapproved or deleted).
+    """
+    if before == after:
+        return
+    if before and after and before[0] == after[0]:
+        apply_rating_change(after[0], removed=before[1], added=after[1])
+        return
+    if before:
+        apply_rating_change(before[0], removed=before[1])
+    if after:
+        apply_rating_change(after[0], added=after[1])
+
+
+def actual_aggregates(product_ids):
+    """
+    Compute aggregates from the review table for the given products.
+
+    Returns:
+        dict: product_id -> {field: value} for products with approved reviews
+    """
+    from .models import ProductReview
+
+    annotations = {
+        'rating_sum': models.Sum('rating'),
+        'rating_count': models.Count('id'),
+    }
+    for stars, field in STAR_FIELDS.items():
+        annotations[field] = models.Count('id', filter=models.Q(rating=stars))
+    rows = (
+        ProductReview.objects
+        .filter(product_id__in=product_ids, is_approved=True)
+        .order_by()
+        .values('product_id')
+        .annotate(**annotations)
+    )
+    result = {}
+    for row in rows:
+        product_id = row.pop('product_id')
+        row['rating_avg'] = (Decimal(row['rating_sum']) / row['rating_count']).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP,
+        )
+        result[product_id] = row
+    return result
+
+
+def reconcile(chunk_size=1000):
+    """
+    Recompute every product's aggregates and repair the ones that drifted.
+
+    Products are walked in primary-key chunks so memory stays bounded.
+
+    Returns:
+        tuple: (checked, repaired) product counts
+    """
+    from .models import Product
+
+    empty = {field: 0 for field in AGGREGATE_FIELDS}
+    empty['rating_avg'] = Decimal('0.00')
+    checked = repaired = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            Product.objects.filter(pk__gt=last_id).order_by('pk')
+            .only('pk', *AGGREGATE_FIELDS)[:chunk_size]
+        )
+        if not chunk:
+            return checked, repaired
+        last_id = chunk[-1].pk
+        actual = actual_aggregates([product.pk for product in chunk])
+        stale = []
+        for product in chunk:
+            expected = actual.get(product.pk, empty)
+            if any(getattr(product, field) != expected[field] for field in AGGREGATE_FIELDS):
+                for field in AGGREGATE_FIELDS:
+                    setattr(product, field, expected[field])
+                stale.append(product)
+        if stale:
+            Product.objects.bulk_update(stale, AGGREGATE_FIELDS)
+        checked += len(chunk)
+        repaired += len(stale)
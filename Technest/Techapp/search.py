@@ -0,0 +1,133 @@
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+# FTS5 virtual table mirroring Product.name / desc / sku, keyed by product id (rowid)
+FTS_TABLE = 'techapp_product_fts'
+
+# Product fields copied into the index; saves that touch none of them skip it
+INDEXED_FIELDS = ('name', 'desc', 'sku')
+
+# bm25() column weights: a hit in the name outranks one in the SKU or description
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    """Full-text search is backed by SQLite FTS5 and only used on that backend"""
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term (``"lapt"*``) and all terms must
+    match, so partially typed words already return results and user input
+    can never inject FTS5 query syntax.
+
+    Returns:
+        str: MATCH expression, or an empty string if the query has no words
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(queryset, query):
+    """
+    Filter ``queryset`` to products matching ``query``.
+
+    On SQLite the index table is joined in and the rows are annotated with
+    ``search_rank`` (bm25, lower is more relevant) so callers can order by
+    relevance. Other backends fall back to
+    a case-insensitive substring match without a rank.
+
+    Returns:
+        tuple: (queryset, ranked) where ranked says if ``search_rank`` exists
+    """
+    if not is_available():
+        return queryset.filter(
+            models.Q(name__icontains=query) |
+            models.Q(desc__icontains=query) |
+            models.Q(sku__icontains=query)
+        ), False
+
+    expression = build_match_expression(query)
+    if not expression:
+        return queryset.none(), False
+
+    # Join the index once and rank the matched rows in place; a correlated
+    # subquery would run the MATCH again for every product
+    product_table = connection.ops.quote_name(queryset.model._meta.db_table)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    queryset = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {product_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[expression],
+    ).annotate(
+        search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', [], output_field=models.FloatField())
+    )
+    return queryset, True
+
+
+def index_product(product):
+    """Insert or refresh the index row for a single product"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, sku) VALUES (%s, %s, %s, %s)',
+            [product.pk, product.name, product.desc, product.sku or ''],
+        )
+
+
+def index_products(product_ids):
+    """Refresh the index rows for many products with two set-based statements"""
+    if not is_available() or not product_ids:
+        return
+    from .models import Product
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        # SQLite caps bound parameters per statement, so go in slices
+        for start in range(0, len(product_ids), 500):
+            ids = product_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, sku) '
+                f'SELECT id, name, "desc", COALESCE(sku, \'\') FROM {product_table} '
+                f'WHERE id IN ({placeholders})',
+                ids,
+            )
+
+
+def remove_product(product_id):
+    """Drop a product's index row"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index():
+    """
+    Repopulate the whole index from the product table and merge its segments.
+
+    Returns:
+        int: Number of indexed products
+    """
+    from .models import Product
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, sku) '
+            f'SELECT id, name, "desc", COALESCE(sku, \'\') FROM {product_table}'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import coupons, events, images, pricing, ratings, search
+from .models import Category, Coupon, Product, ProductReview, Wishlist
+from .utils import forget_wishlist_ids
+
+
+# ==================== SEARCH INDEX SYNC ====================
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the full-text index row in step with the product"""
+    if raw or (update_fields is not None and not set(search.INDEXED_FIELDS) & set(update_fields)):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+# ==================== LIVE STOCK EVENTS ====================
+@receiver(post_save, sender=Product)
+def publish_stock_on_save(sender, instance, raw=False, **kwargs):
+    """Push the saved availability to pages watching this product"""
+    if raw or not events.hub.has_subscribers(events.stock_channel(instance.pk)):
+        return
+    product_id, available = instance.pk, instance.available_stock
+    transaction.on_commit(lambda: events.publish_stock(product_id, available))
+
+
+# ==================== RATING AGGREGATES ====================
+@receiver(pre_save, sender=ProductReview)
+def remember_counted_rating(sender, instance, raw=False, **kwargs):
+    """Capture what the stored row contributed before it is overwritten"""
+    instance._counted_before = None
+    if raw or instance.pk is None:
+        return
+    previous = (
+        ProductReview.objects.filter(pk=instance.pk)
+        .only('product_id', 'rating', 'is_approved')
+        .first()
+    )
+    instance._counted_before = ratings.counted_rating(previous)
+
+
+@receiver(post_save, sender=ProductReview)
+def update_ratings_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ratings.apply_review_transition(
+        getattr(instance, '_counted_before', None),
+        ratings.counted_rating(instance),
+    )
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_ratings_on_delete(sender, instance, **kwargs):
+    ratings.apply_review_transition(ratings.counted_rating(instance), None)
+
+
+# ==================== COUPON LOOKUPS ====================
+@receiver(post_save, sender=Coupon)
+def forget_unknown_coupon_code(sender, instance, **kwargs):
+    """A new or renamed coupon must not stay hidden behind a cached miss"""
+    coupons.forget_unknown_code(instance.code)
+
+
+# ==================== PRICE QUOTES ====================
+@receiver(post_save, sender=Product)
+def invalidate_quotes_on_price_change(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """
+    Stop reusing quotes when a product's price changed.
+
+    Stock-only and other saves leave the memo alone; a new product is in no
+    cart yet, so it can't make a quote stale either.
+    """
+    if not raw and not created and instance.pricing_changed(update_fields):
+        pricing.bump_pricing_version()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_quotes(sender, **kwargs):
+    """Prices or coupons may have changed: stop reusing memoized quotes"""
+    pricing.bump_pricing_version()
+
+
+# ==================== WISHLIST ID SETS ====================
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def forget_cached_wishlist(sender, instance, **kwargs):
+    """Adding, moving or removing an item invalidates the owner's cached set"""
+    forget_wishlist_ids(instance.user_id)
+
+
+# ==================== IMAGE RENDITIONS ====================
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def refresh_image_renditions(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Queue a resize of a new or replaced image once the row is committed"""
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    if 'image' in instance.get_deferred_fields():
+        # Not loaded, so this save did not change it
+        return
+    # Saves never write the record (it is a maintained field), so compare with the stored one
+    model, pk = type(instance), instance.pk
+    stored = model._default_manager.filter(pk=pk).values_list('image_renditions', flat=True).first()
+    if not images.needs_refresh(instance.image.name, stored):
+        return
+    transaction.on_commit(lambda: images.refresh_later(model, pk))
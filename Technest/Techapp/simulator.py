@@ -0,0 +1,146 @@
+from collections import namedtuple
+from decimal import Decimal
+from itertools import islice
+
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the simulator needs it
+    np = None
+
+from .models import Order
+
+# Orders read from the database per chunk
+SIMULATION_CHUNK_SIZE = 50_000
+
+# Upper edges (in dollars) of the per-order discount distribution buckets
+DISCOUNT_BUCKETS = (5, 10, 25, 50, 100, 250)
+
+# Orders that never turned into revenue don't count towards the cost
+EXCLUDED_STATUSES = ('cancelled', 'refunded')
+
+CouponSpec = namedtuple('CouponSpec', ['label', 'discount_type', 'discount_value', 'min_purchase_amount'])
+CouponSpec.__new__.__defaults__ = (None,)
+
+SimulationResult = namedtuple(
+    'SimulationResult',
+    ['spec', 'orders', 'affected_orders', 'total_discount', 'average_discount', 'distribution'],
+)
+
+
+class SimulatorUnavailable(RuntimeError):
+    """Raised when NumPy is not installed"""
+
+
+def is_available():
+    return np is not None
+
+
+def spec_from_coupon(coupon):
+    return CouponSpec(coupon.code, coupon.discount_type, coupon.discount_value, coupon.min_purchase_amount)
+
+
+def iter_order_totals(queryset=None, chunk_size=SIMULATION_CHUNK_SIZE):
+    """
+    Stream order subtotals as NumPy arrays of cents, one chunk at a time.
+
+    Values are cast to floats in the database and read with a server-side
+    iterator, so memory stays bounded by ``chunk_size`` whatever the table
+    size.
+    """
+    if np is None:
+        raise SimulatorUnavailable('The coupon simulator requires NumPy (pip install numpy)')
+    if queryset is None:
+        queryset = Order.objects.exclude(status__in=EXCLUDED_STATUSES)
+    values = iter(
+        queryset.order_by()
+        .annotate(subtotal_value=Cast(F('subtotal'), FloatField()))
+        .values_list('subtotal_value', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = np.fromiter(islice(values, chunk_size), dtype=np.float64)
+        if not len(chunk):
+            return
+        yield np.rint(chunk * 100).astype(np.int64)
+
+
+def _spec_arrays(specs):
+    """Column vectors (one row per spec) of percentage flag, value and minimum, in cents"""
+    is_percentage = np.array([[spec.discount_type == 'percentage'] for spec in specs])
+    value = np.array([[float(spec.discount_value)] for spec in specs])
+    minimum = np.array([[round(float(spec.min_purchase_amount or 0) * 100)] for spec in specs], dtype=np.int64)
+    return is_percentage, value, minimum
+
+
+def discounts_for_chunk(totals, specs):
+    """
+    Discount in cents for every (spec, order) pair of one chunk.
+
+    Mirrors ``Coupon.calculate_discount``: a percentage of the subtotal or a
+    fixed amount, never more than the subtotal, and nothing below the
+    coupon's minimum purchase. All specs are evaluated in one broadcast.
+
+    Returns:
+        ndarray: int64 array of shape (len(specs), len(totals))
+    """
+    is_percentage, value, minimum = _spec_arrays(specs)
+    raw = np.where(is_percentage, totals * value / 100, value * 100)
+    discounts = np.minimum(np.rint(raw).astype(np.int64), totals)
+    return np.where(totals >= minimum, discounts, 0)
+
+
+def simulate(specs, chunks=None, buckets=DISCOUNT_BUCKETS):
+    """
+    Evaluate coupon definitions against historical orders.
+
+    Args:
+        specs (list): CouponSpec definitions to compare
+        chunks: Iterable of cent arrays; defaults to every past order
+        buckets (tuple): Upper edges in dollars of the distribution buckets
+
+    Returns:
+        list: One SimulationResult per spec. ``distribution`` maps a bucket
+        label to the number of discounted orders whose discount fell in it.
+    """
+    if np is None:
+        raise SimulatorUnavailable('The coupon simulator requires NumPy (pip install numpy)')
+    specs = list(specs)
+    if chunks is None:
+        chunks = iter_order_totals()
+    upper_edges = np.array([edge * 100 for edge in buckets], dtype=np.int64)
+    bucket_count = len(buckets) + 1
+
+    orders = 0
+    affected = np.zeros(len(specs), dtype=np.int64)
+    total = np.zeros(len(specs), dtype=np.int64)
+    histogram = np.zeros(len(specs) * bucket_count, dtype=np.int64)
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        discounts = discounts_for_chunk(chunk, specs)
+        orders += len(chunk)
+        affected += np.count_nonzero(discounts, axis=1)
+        total += discounts.sum(axis=1)
+        # Bucket every discounted order, offset by its spec row, in one bincount
+        rows, columns = np.nonzero(discounts)
+        buckets_hit = np.searchsorted(upper_edges, discounts[rows, columns], side='left')
+        histogram += np.bincount(rows * bucket_count + buckets_hit, minlength=histogram.size)
+    histogram = histogram.reshape(len(specs), bucket_count)
+
+    labels = [f'${low}-{high}' for low, high in zip((0, *buckets), buckets)] + [f'${buckets[-1]}+']
+    results = []
+    for row, spec in enumerate(specs):
+        total_discount = (Decimal(int(total[row])) / 100).quantize(Decimal('0.01'))
+        average = (total_discount / int(affected[row])).quantize(Decimal('0.01')) if affected[row] else Decimal('0.00')
+        results.append(SimulationResult(
+            spec=spec,
+            orders=orders,
+            affected_orders=int(affected[row]),
+            total_discount=total_discount,
+            average_discount=average,
+            distribution=dict(zip(labels, (int(n) for n in histogram[row]))),
+        ))
+    return results
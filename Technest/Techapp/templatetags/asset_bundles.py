@@ -0,0 +1,29 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from Techapp import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset_bundle(name):
+    """
+    ``<link>`` or ``<script>`` for a bundle from ``assets.BUNDLES``.
+
+    Uses the fingerprinted file of the last ``build_assets`` run; until one
+    exists (e.g. in development) every source file is included separately.
+
+    Usage::
+
+        {% load asset_bundles %}
+        {% asset_bundle 'core.css' %}
+    """
+    if name not in assets.BUNDLES:
+        raise template.TemplateSyntaxError(f'Unknown asset bundle {name!r}')
+    url = assets.bundle_url(name)
+    urls = [url] if url else [static(source) for source in assets.BUNDLES[name]]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((href,) for href in urls))
+    return format_html_join('\n', '<script src="{}"></script>', ((href,) for href in urls))
@@ -0,0 +1,46 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from Techapp import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(obj, sizes='100vw', **attrs):
+    """
+    ``<picture>`` for an object's image: WebP and JPEG renditions in ``srcset``.
+
+    Falls back to a plain ``<img>`` of the original while no renditions
+    exist for the current file. A stored blurred placeholder is inlined as
+    the ``<img>`` background, so the card shows something before the image
+    arrives. Extra keyword arguments (``alt``, ``class``,
+    ``style``...) become attributes of the ``<img>``; images load lazily
+    unless ``loading`` says otherwise.
+
+    Usage::
+
+        {% load responsive_images %}
+        {% responsive_image product sizes="(max-width: 576px) 100vw, 280px" alt=product.name %}
+    """
+    image = obj.image
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    record = getattr(obj, 'image_renditions', None) or {}
+    stale = images.needs_refresh(image.name, record)
+    placeholder = getattr(obj, images.PLACEHOLDER_FIELD, '')
+    if placeholder and not stale:
+        attrs['style'] = f'background: center / cover no-repeat url({placeholder}); ' + attrs.get('style', '')
+    attributes = format_html_join('', ' {}="{}"', attrs.items())
+    if stale or not record.get('widths'):
+        return format_html('<img src="{}"{}>', image.url, attributes)
+
+    largest = images.rendition_name(record['name'], record['widths'][-1], 'jpg')
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        images.srcset(record, 'webp', image.storage), sizes,
+        image.storage.url(largest), images.srcset(record, 'jpg', image.storage), sizes, attributes,
+    )
@@ -1,10 +1,71 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
+
+from PIL import Image
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, models, transaction
+from django.http import Http404
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Product, Cart, Category
+from django.utils import timezone
+from . import assets, coupons, events, feeds, holds, images, orders, pricing, ratings, search, simulator, utils
+from .models import (
+    Cart,
+    Category,
+    Coupon,
+    CouponRedemption,
+    Order,
+    OrderItem,
+    Product,
+    ProductReview,
+    Sequence,
+    StockHold,
+    Wishlist,
+)
+from .order_numbers import BlockAllocator, reserve_block
+from .pagination import EstimatedCountPaginator
+from .utils import CartService
+from .views import PRODUCTS_PER_PAGE, REVIEWS_PER_PAGE, WISHLIST_STATUS_BATCH_LIMIT
 
 User = get_user_model()
 
+
+def temp_dir(test):
+    """Throwaway directory removed once ``test`` finishes"""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    return tmp.name
+
+
 class CartModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='password')
@@ -95,8 +156,6 @@ class ProductSortTest(TestCase):
         self.p3 = Product.objects.create(name='P3', desc='Product 3', price=5.00, category=self.category)
         
         # Ensure distinct timestamps
-        from django.utils import timezone
-        from datetime import timedelta
         now = timezone.now()
         self.p1.created_at = now - timedelta(hours=3)
         self.p1.save()
@@ -119,3 +178,1748 @@ class ProductSortTest(TestCase):
         response = self.client.get(reverse('products') + '?sort=newest')
         products = list(response.context['products'])
         self.assertEqual(products, [self.p3, self.p2, self.p1])
+
+class EffectivePriceTest(TestCase):
+    def setUp(self):
+        self.regular = Product.objects.create(name='Regular', desc='Full price', price=50)
+        self.sale = Product.objects.create(name='Sale', desc='Discounted', price=100, on_sale=True, sale_price=30)
+        self.flagged = Product.objects.create(name='Flagged', desc='No sale price', price=40, on_sale=True)
+
+    def listing(self, **params):
+        return list(self.client.get(reverse('products'), params).context['products'])
+
+    def test_effective_price_follows_sale_fields(self):
+        self.sale.refresh_from_db()
+        self.flagged.refresh_from_db()
+        self.assertEqual(self.sale.effective_price, self.sale.get_price)
+        self.assertEqual(self.flagged.effective_price, self.flagged.get_price)
+        # Queryset updates bypass save() but the database still recomputes the column
+        Product.objects.filter(pk=self.sale.pk).update(on_sale=False)
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.effective_price, 100)
+
+    def test_price_filter_and_sort_are_sale_aware(self):
+        self.assertEqual(self.listing(sort='price_low'), [self.sale, self.flagged, self.regular])
+        self.assertEqual(self.listing(sort='price_high'), [self.regular, self.flagged, self.sale])
+        self.assertEqual(self.listing(max_price=35), [self.sale])
+        self.assertEqual(self.listing(min_price=35, sort='price_low'), [self.flagged, self.regular])
+
+
+class ProductPaginationTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # Repeated prices and timestamps exercise the id tie-breaker
+        self.products = [
+            Product.objects.create(
+                name=f'P{i}', desc=f'Product {i}', price=(i % 4) * 5 or None,
+                created_at=now - timedelta(minutes=i // 2)
+            )
+            for i in range(11)
+        ]
+
+    def walk(self, sort):
+        """Follow the API's next cursors until the listing is exhausted"""
+        seen = []
+        cursor = None
+        while True:
+            params = {'sort': sort, 'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(reverse('api_products'), params).json()
+            seen.extend(item['id'] for item in data['results'])
+            cursor = data['next']
+            if not cursor:
+                return seen
+
+    def test_api_pages_match_full_ordering(self):
+        for sort, ordering in [
+            ('newest', ['-created_at', '-id']),
+            ('price_low', [models.F('effective_price').asc(nulls_last=True), 'id']),
+            ('price_high', [models.F('effective_price').desc(nulls_last=True), '-id']),
+        ]:
+            expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+            self.assertEqual(self.walk(sort), expected, sort)
+
+    def test_html_page_links_to_next_cursor(self):
+        for i in range(PRODUCTS_PER_PAGE):
+            Product.objects.create(name=f'Extra {i}', desc='Extra', price=1)
+        response = self.client.get(reverse('products'), {'sort': 'price_low'})
+        self.assertEqual(len(response.context['products']), PRODUCTS_PER_PAGE)
+        self.assertIn('cursor=', response.context['next_query'])
+        self.assertIn('sort=price_low', response.context['next_query'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api_products'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('products'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_numeric_filters(self):
+        for params in ({'min_price': 'abc'}, {'max_price': 'NaN'}, {'min_rating': 'five'}):
+            response = self.client.get(reverse('api_products'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'error')
+            # The page drops the filter instead
+            self.assertEqual(self.client.get(reverse('products'), params).status_code, 200)
+        response = self.client.get(reverse('api_products'), {'min_price': '10.5', 'max_price': ''})
+        self.assertEqual(response.status_code, 200)
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.laptop = Product.objects.create(name='Gaming Laptop', desc='Fast machine', price=1500, sku='LAP-001')
+        self.bag = Product.objects.create(name='Backpack', desc='Fits any laptop up to 16"', price=80, sku='BAG-7')
+        self.mouse = Product.objects.create(name='Wireless Mouse', desc='Ergonomic', price=40, sku='MOU-3')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('products'), {'q': query, **params})
+        return list(response.context['products'])
+
+    def test_results_ranked_by_relevance(self):
+        # A name hit outranks a description hit; partial words match as prefixes
+        self.assertEqual(self.search('lapt'), [self.laptop, self.bag])
+        self.assertEqual(self.search('lap 001'), [self.laptop])
+        self.assertEqual(self.search('"OR*'), [])
+
+    def test_relevance_pages_match_the_index_once_per_query(self):
+        for i in range(5):
+            Product.objects.create(name=f'Laptop Stand {i}', desc='Aluminium', price=30 + i, sku=f'STD-{i}')
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                params = {'q': 'laptop', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+                data = self.client.get(reverse('api_products'), params).json()
+                seen.extend(item['id'] for item in data['results'])
+                cursor = data['next']
+                if not cursor:
+                    break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), set(
+            Product.objects.filter(name__icontains='laptop').values_list('id', flat=True)
+        ) | {self.bag.id})
+        self.assertEqual(seen[-1], self.bag.id)
+        searches = [query['sql'] for query in queries.captured_queries if 'MATCH' in query['sql']]
+        self.assertEqual(len(searches), 4)
+        for sql in searches:
+            self.assertEqual(sql.count('MATCH'), 1)
+
+    def test_index_follows_save_and_delete(self):
+        self.mouse.name = 'Wireless Trackball'
+        self.mouse.save()
+        self.assertEqual(self.search('trackball'), [self.mouse])
+        self.assertEqual(self.search('mouse'), [])
+        self.mouse.delete()
+        self.assertEqual(self.search('trackball'), [])
+
+    def test_rebuild_command(self):
+        Product.objects.filter(pk=self.bag.pk).update(name='Messenger Bag')
+        self.assertEqual(self.search('messenger'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 products', out.getvalue())
+        self.assertEqual(self.search('messenger'), [self.bag])
+
+class RatingAggregateTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Headphones', desc='Noise cancelling', price=200)
+        self.users = [User.objects.create_user(username=f'reviewer{i}', password='password') for i in range(3)]
+
+    def review(self, user, rating, **kwargs):
+        return ProductReview.objects.create(
+            product=self.product, user=user, rating=rating, title='Review', comment='Text', **kwargs
+        )
+
+    def assertAggregates(self, total, count, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (total, count))
+        self.assertEqual([n for _, n in self.product.rating_histogram], histogram)
+
+    def test_create_edit_approve_delete(self):
+        first = self.review(self.users[0], 5)
+        second = self.review(self.users[1], 2)
+        self.assertAggregates(7, 2, [1, 0, 0, 1, 0])
+        self.assertEqual(self.product.average_rating, 3.5)
+        self.assertEqual(str(self.product.rating_avg), '3.50')
+
+        second.rating = 4
+        second.save()
+        self.assertAggregates(9, 2, [1, 1, 0, 0, 0])
+
+        hidden = self.review(self.users[2], 1, is_approved=False)
+        self.assertAggregates(9, 2, [1, 1, 0, 0, 0])
+        hidden.is_approved = True
+        hidden.save()
+        self.assertAggregates(10, 3, [1, 1, 0, 0, 1])
+
+        first.delete()
+        self.assertAggregates(5, 2, [0, 1, 0, 0, 1])
+        hidden.is_approved = False
+        hidden.save()
+        second.delete()
+        self.assertAggregates(0, 0, [0, 0, 0, 0, 0])
+        self.assertEqual(self.product.average_rating, 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.review(self.users[0], 4)
+        self.review(self.users[1], 3)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=50, rating_count=1)
+        out = StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('Repaired 1 of 1', out.getvalue())
+        self.assertAggregates(7, 2, [0, 1, 1, 0, 0])
+
+    def test_sort_by_rating_uses_stored_average(self):
+        other = Product.objects.create(name='Speaker', desc='Loud', price=50)
+        ProductReview.objects.create(product=other, user=self.users[0], rating=5, title='T', comment='C')
+        self.review(self.users[1], 3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products'), {'sort': 'rating', 'min_rating': 1})
+        self.assertEqual(list(response.context['products']), [other, self.product])
+        self.assertFalse([q for q in queries if ProductReview._meta.db_table in q['sql']])
+
+    def test_invalid_min_rating_is_ignored(self):
+        self.review(self.users[0], 2)
+        for value in ('abc', 'NaN', 'inf'):
+            response = self.client.get(reverse('products'), {'min_rating': value})
+            self.assertEqual(list(response.context['products']), [self.product])
+        response = self.client.get(reverse('products'), {'min_rating': '4.5'})
+        self.assertEqual(list(response.context['products']), [])
+
+    def test_rating_sort_pages_through_tied_repeating_averages(self):
+        products = [self.product] + [
+            Product.objects.create(name=f'Earbuds {i}', desc='Wireless', price=80) for i in range(3)
+        ]
+        for product in products:
+            for user, rating in zip(self.users, (5, 4, 4)):
+                ProductReview.objects.create(product=product, user=user, rating=rating, title='T', comment='C')
+        # 13/3 is stored as the 4.33 that is read back, and matches what reconcile computes
+        self.assertEqual(Product.objects.filter(rating_avg=Decimal('4.33')).count(), 4)
+        self.assertEqual(ratings.reconcile(), (4, 0))
+
+        seen, cursor = [], None
+        while True:
+            params = {'sort': 'rating', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('api_products'), params).json()
+            seen.extend(item['id'] for item in data['results'])
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted((p.id for p in products), reverse=True))
+
+    def test_half_cent_averages_round_up_like_reconcile(self):
+        # 4.125 and 4.375 (33/8, 35/8) are exact ties at the cent
+        users = self.users + [User.objects.create_user(username=f'extra{i}', password='password') for i in range(5)]
+        for user, rating in zip(users, (5, 5, 5, 4, 4, 4, 3, 3)):
+            self.review(user, rating)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_avg, Decimal('4.13'))
+        self.assertEqual(ratings.reconcile(), (1, 0))
+
+class GuestCartTest(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Item {i}', desc='Item', price=10, stock=50)
+            for i in range(12)
+        ]
+        self.products[0].on_sale = True
+        self.products[0].sale_price = 4
+        self.products[0].save()
+
+    def fill_cart(self, count):
+        session = self.client.session
+        session['cart'] = {str(product.id): 2 for product in self.products[:count]}
+        session.save()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return len(queries), response
+
+    def test_query_count_independent_of_cart_size(self):
+        self.fill_cart(2)
+        small, _ = self.count_queries(reverse('cart'))
+        self.fill_cart(12)
+        large, response = self.count_queries(reverse('cart'))
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.context['cart_items']), 12)
+
+    def test_guest_lines_use_sale_price(self):
+        self.fill_cart(2)
+        session = self.client.session
+        session['cart']['999999'] = 1  # deleted product is skipped
+        session.save()
+        response = self.client.get(reverse('checkout'))
+        items = response.context['cart_items']
+        self.assertEqual([item.product_id for item in items], [p.id for p in self.products[:2]])
+        self.assertEqual(items[0].total_price, 8)
+        self.assertEqual(response.context['quote'].subtotal, 28)
+
+class CartMergeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password='password')
+        self.products = [
+            Product.objects.create(name=f'Item {i}', desc='Item', price=10, stock=50)
+            for i in range(20)
+        ]
+        Cart.objects.create(user=self.user, product=self.products[0], quantity=3)
+
+    def login_with_cart(self, cart):
+        session = self.client.session
+        session['cart'] = cart
+        session.save()
+        return self.client.post(reverse('sign_in'), {'username': 'shopper', 'password': 'password'})
+
+    def test_merge_increments_and_skips_missing_products(self):
+        inactive = Product.objects.create(name='Retired', desc='Gone', price=5, is_active=False)
+        response = self.login_with_cart({
+            str(self.products[0].id): 2,
+            str(self.products[1].id): 1,
+            str(inactive.id): 4,
+            '999999': 1,
+        })
+        self.assertEqual(response.status_code, 302)
+        quantities = dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].id: 5, self.products[1].id: 1})
+        self.assertNotIn('cart', self.client.session)
+
+    def test_merge_query_count_independent_of_cart_size(self):
+        def merge(products):
+            request = RequestFactory().get('/')
+            request.user = self.user
+            request.session = SessionStore()
+            request.session['cart'] = {str(p.id): 1 for p in products}
+            with self.assertNumQueries(5):
+                # product lookup, savepoint, insert, update, release
+                CartService(request).merge_session_cart()
+
+        merge(self.products[:2])
+        merge(self.products)
+
+class AtomicCartUpdateTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.product = Product.objects.create(name='Cable', desc='USB-C', price=9, stock=5)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.request.session = self.client.session
+
+    def quantity(self):
+        return Cart.objects.get(user=self.user, product=self.product).quantity
+
+    def test_add_and_update_are_capped_at_stock(self):
+        cart = CartService(self.request)
+        cart.add(self.product.id, 2)
+        cart.add(self.product.id, 2)
+        self.assertEqual(self.quantity(), 4)
+        cart.add(self.product.id, 3)
+        self.assertEqual(self.quantity(), 5)
+        cart.update(self.product.id, 1)
+        self.assertEqual(self.quantity(), 1)
+        cart.update(self.product.id, 50)
+        self.assertEqual(self.quantity(), 5)
+        cart.update(self.product.id, 0)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_existing_line_is_one_update(self):
+        cart = CartService(self.request)
+        cart.add(self.product.id, 1)
+        with self.assertNumQueries(3):
+            # savepoint, UPDATE, release
+            cart.add(self.product.id, 1)
+
+    def test_out_of_stock_is_rejected(self):
+        self.product.stock = 0
+        self.product.save()
+        with self.assertRaises(ValueError):
+            CartService(self.request).add(self.product.id, 1)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_deactivated_product_is_not_incremented(self):
+        cart = CartService(self.request)
+        cart.add(self.product.id, 1)
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        with self.assertRaises(Http404):
+            cart.add(self.product.id, 1)
+        self.assertEqual(self.quantity(), 1)
+
+    def test_non_positive_quantities_are_rejected(self):
+        cart = CartService(self.request)
+        cart.add(self.product.id, 2)
+        for quantity in (0, -1):
+            with self.assertRaises(ValueError):
+                cart.add(self.product.id, quantity)
+        self.assertEqual(self.quantity(), 2)
+
+        guest = RequestFactory().get('/')
+        guest.user = AnonymousUser()
+        guest.session = SessionStore()
+        with self.assertRaises(ValueError):
+            CartService(guest).add(self.product.id, -3)
+        self.assertNotIn('cart', guest.session)
+
+
+class ConcurrentCartAddTest(TransactionTestCase):
+    def test_concurrent_adds_lose_no_updates(self):
+        user = User.objects.create_user(username='racer', password='password')
+        product = Product.objects.create(name='Hot Item', desc='Popular', price=5, stock=10000)
+        threads, adds_per_thread = 8, 25
+        errors = []
+
+        def worker():
+            request = RequestFactory().get('/')
+            request.user = user
+            request.session = SessionStore()
+            try:
+                for _ in range(adds_per_thread):
+                    while True:
+                        try:
+                            CartService(request).add(product.id, 1)
+                            break
+                        except OperationalError:
+                            # SQLite reports lock contention instead of waiting; retry
+                            continue
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Cart.objects.get(user=user, product=product).quantity, threads * adds_per_thread)
+
+class CartCountCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='counter', password='password')
+        self.product = Product.objects.create(name='Charger', desc='65W', price=30, stock=20)
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        self.client.login(username='counter', password='password')
+
+    def test_count_is_cached_until_cart_changes(self):
+        self.assertEqual(self.client.get(reverse('cart_count')).json()['count'], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('cart_count')).json()['count'], 2)
+        self.assertFalse([q for q in queries if Cart._meta.db_table in q['sql']])
+
+        self.client.post(
+            reverse('add_to_cart'),
+            data='{"product_id": %d, "quantity": 3}' % self.product.id,
+            content_type='application/json',
+        )
+        self.assertEqual(self.client.get(reverse('cart_count')).json()['count'], 5)
+        self.client.post(reverse('remove_from_cart', args=[self.product.id]))
+        self.assertEqual(self.client.get(reverse('cart_count')).json()['count'], 0)
+
+    def test_per_process_cache_keeps_counts_briefly(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.client.get(reverse('cart_count'))
+        self.assertEqual(cache_set.call_args.args[2], utils.PER_PROCESS_CACHE_TIMEOUT)
+
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': temp_dir(self),
+        }}
+        with override_settings(CACHES=shared):
+            self.assertEqual(utils.shared_timeout(utils.CART_COUNT_TIMEOUT), utils.CART_COUNT_TIMEOUT)
+            self.assertEqual(utils.shared_timeout(utils.WISHLIST_IDS_TIMEOUT), utils.WISHLIST_IDS_TIMEOUT)
+
+    def test_count_rendered_with_page(self):
+        response = self.client.get(reverse('about'))
+        self.assertContains(response, 'data-count="2"')
+
+class EventStreamTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Drone', desc='4K camera', price=500, stock=7)
+
+    async def test_stream_pushes_cart_and_stock_events(self):
+        response = await self.async_client.get(reverse('event_stream'), {'products': self.product.id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        received = asyncio.Queue()
+
+        async def consume():
+            async for chunk in response.streaming_content:
+                await received.put(chunk)
+
+        reader = asyncio.create_task(consume())
+        self.assertEqual(await received.get(), b'retry: 5000\n\n')
+        self.assertEqual(await received.get(), b'event: cart\ndata: {"count": 0}\n\n')
+
+        channel = events.stock_channel(self.product.id)
+        self.assertTrue(events.hub.has_subscribers(channel))
+        # Publishing from a worker thread is delivered to the loop holding the stream
+        publisher = threading.Thread(target=events.publish_stock, args=(self.product.id, 3))
+        publisher.start()
+        publisher.join()
+        self.assertEqual(
+            await received.get(),
+            b'event: stock\ndata: {"product_id": %d, "stock": 3}\n\n' % self.product.id,
+        )
+
+        # A client disconnect cancels the response task, which unsubscribes
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertFalse(events.hub.has_subscribers(channel))
+
+    def test_wsgi_requests_fall_back_to_polling(self):
+        self.assertEqual(self.client.get(reverse('event_stream')).status_code, 204)
+
+    def test_stock_saves_are_published(self):
+        with mock.patch.object(events.hub, 'has_subscribers', return_value=True), \
+                mock.patch.object(events, 'publish_stock') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.stock = 2
+                self.product.save()
+        publish.assert_called_once_with(self.product.id, 2)
+
+
+class PlaceOrderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client.login(username='buyer', password='password')
+        self.phone = Product.objects.create(name='Phone', desc='Smart', price=100, stock=5)
+        self.case = Product.objects.create(name='Case', desc='Leather', price=20, stock=1)
+        Cart.objects.create(user=self.user, product=self.phone, quantity=2)
+        Cart.objects.create(user=self.user, product=self.case, quantity=1)
+
+    def test_order_is_created_and_stock_taken(self):
+        response = self.client.post(reverse('place_order'), {'shipping_address': '1 Main St'})
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(order_number=response.json()['order_id'])
+        self.assertEqual(order.user, self.user)
+        self.assertEqual(order.subtotal, 220)
+        self.assertEqual(order.shipping_address, '1 Main St')
+        self.assertRegex(order.order_number, r'^ORD-\d{9}$')
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity')),
+            [('Case', 1), ('Phone', 2)],
+        )
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.case.stock), (3, 0))
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_short_stock_rolls_back_everything(self):
+        Product.objects.filter(pk=self.case.pk).update(stock=0)
+        response = self.client.post(reverse('place_order'))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Case', response.json()['message'])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        Cart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.post(reverse('place_order')).status_code, 400)
+
+    def test_checkout_form_sends_city_separately_from_state(self):
+        response = self.client.get(reverse('checkout'))
+        self.assertContains(response, '<input type="text" class="form-control" id="city" required>', html=True)
+        self.assertContains(response, "formData.append('shipping_city', field('city'));")
+        self.assertContains(response, "formData.append('shipping_state', field('state'));")
+
+    def test_lines_added_during_checkout_stay_in_cart(self):
+        request = RequestFactory().post('/')
+        request.user = self.user
+        request.session = SessionStore()
+        cart = CartService(request)
+        cart.get_cart_items()
+        # Another tab adds a product and bumps the phone after checkout read the cart
+        charger = Product.objects.create(name='Charger', desc='USB-C', price=15, stock=4)
+        Cart.objects.create(user=self.user, product=charger, quantity=1)
+        Cart.objects.filter(user=self.user, product=self.phone).update(quantity=3)
+
+        order = orders.place_order(cart)
+        self.assertEqual(sorted(order.items.values_list('product__name', 'quantity')), [('Case', 1), ('Phone', 2)])
+        self.assertEqual(
+            dict(Cart.objects.filter(user=self.user).values_list('product__name', 'quantity')),
+            {'Charger': 1, 'Phone': 1},
+        )
+
+    def test_guest_cart_keeps_unordered_quantities(self):
+        request = RequestFactory().post('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request.session['cart'] = {str(self.phone.id): 2}
+        cart = CartService(request)
+        cart.get_cart_items()
+        cart.cart[str(self.phone.id)] = 3
+        cart.cart[str(self.case.id)] = 1
+
+        orders.place_order(cart)
+        self.assertEqual(request.session['cart'], {str(self.phone.id): 1, str(self.case.id): 1})
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    def test_hot_product_is_never_oversold(self):
+        out = StringIO()
+        call_command('benchmark_checkout', checkouts=40, workers=8, stock=15, stdout=out)
+        self.assertIn('Placed:      15', out.getvalue())
+        self.assertIn('Oversell:    0', out.getvalue())
+
+
+class StockHoldTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Console', desc='Limited run', price=400, stock=3)
+        self.buyer = User.objects.create_user(username='first', password='password')
+        self.rival = User.objects.create_user(username='second', password='password')
+        Cart.objects.create(user=self.buyer, product=self.product, quantity=2)
+        Cart.objects.create(user=self.rival, product=self.product, quantity=2)
+
+        def cart_for(user):
+            request = RequestFactory().get('/')
+            request.user = user
+            request.session = SessionStore()
+            return CartService(request)
+        self.cart_for = cart_for
+
+    def test_hold_reduces_available_stock(self):
+        hold = holds.hold_cart(self.cart_for(self.buyer))
+        self.assertEqual(hold.short, [])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.held_stock, self.product.available_stock), (3, 2, 1))
+
+        # The rival cannot hold or buy units already held for the buyer
+        hold = holds.hold_cart(self.cart_for(self.rival))
+        self.assertEqual(hold.short, [self.product])
+        with self.assertRaises(orders.InsufficientStock):
+            orders.place_order(self.cart_for(self.rival))
+
+    def test_rehold_replaces_previous_hold(self):
+        holds.hold_cart(self.cart_for(self.buyer))
+        holds.hold_cart(self.cart_for(self.buyer))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.held_stock, 2)
+        self.assertEqual(StockHold.objects.count(), 1)
+
+    def test_order_consumes_own_hold(self):
+        holds.hold_cart(self.cart_for(self.buyer))
+        orders.place_order(self.cart_for(self.buyer))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.held_stock), (1, 0))
+
+    def test_sweeper_releases_expired_holds_in_batches(self):
+        other = Product.objects.create(name='Controller', desc='Pad', price=50, stock=10)
+        Cart.objects.create(user=self.buyer, product=other, quantity=1)
+        holds.hold_cart(self.cart_for(self.buyer), duration=timedelta(seconds=-1))
+
+        out = StringIO()
+        call_command('release_expired_holds', batch_size=1, stdout=out)
+        self.assertIn('Released 2 expired holds', out.getvalue())
+        self.assertFalse(StockHold.objects.exists())
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.held_stock, other.held_stock), (0, 0))
+
+    def test_expired_hold_does_not_block_new_hold(self):
+        holds.hold_cart(self.cart_for(self.buyer), duration=timedelta(seconds=-1))
+        hold = holds.hold_cart(self.cart_for(self.rival))
+        self.assertEqual(hold.short, [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.held_stock, 2)
+
+    def test_stale_save_keeps_counter(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        holds.hold_cart(self.cart_for(self.buyer))
+        stale.name = 'Console Pro'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.held_stock), ('Console Pro', 2))
+
+    def test_deferred_save_writes_only_loaded_fields(self):
+        partial = Product.objects.only('stock').get(pk=self.product.pk)
+        partial.stock = 9
+        with CaptureQueriesContext(connection) as queries:
+            partial.save()
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "Techapp_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"stock"', updates[0])
+        self.assertNotIn('"name"', updates[0])
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT "Techapp_product"') for query in queries.captured_queries
+        ))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.name), (9, 'Console'))
+
+    def test_checkout_page_places_hold(self):
+        self.client.login(username='first', password='password')
+        response = self.client.get(reverse('checkout'))
+        self.assertContains(response, 'reserved until')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.held_stock, 2)
+
+
+def _allocate_order_numbers(allocator, count, path):
+    """Child process body for OrderNumberAllocatorTest"""
+    numbers = array('q', (allocator.allocate() for _ in range(count)))
+    with open(path, 'wb') as f:
+        numbers.tofile(f)
+
+
+class OrderNumberAllocatorTest(SimpleTestCase):
+    # A throwaway on-disk database the forked workers can share
+    alias = 'order_numbers'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        connections.settings[cls.alias] = dict(
+            connections['default'].settings_dict, NAME=f'{cls.tmp.name}/sequence.sqlite3', TEST={},
+        )
+        # Declared here rather than on the class: the alias only exists now
+        cls.databases = {cls.alias}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        with connections[self.alias].schema_editor() as editor:
+            editor.create_model(Sequence)
+        self.addCleanup(self.drop_sequence_table)
+
+    def drop_sequence_table(self):
+        with connections[self.alias].schema_editor() as editor:
+            editor.delete_model(Sequence)
+
+    def test_processes_never_share_numbers(self):
+        allocator = BlockAllocator('test', block_size=1000, start=100, using=self.alias)
+        # The parent holds a half-used block when the workers fork
+        parent = [allocator.allocate() for _ in range(500)]
+        connections[self.alias].close()
+
+        processes, per_process = 4, 500_000
+        context = multiprocessing.get_context('fork')
+        paths = [f'{self.tmp.name}/numbers-{i}' for i in range(processes)]
+        workers = [
+            context.Process(target=_allocate_order_numbers, args=(allocator, per_process, path))
+            for path in paths
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertTrue(all(worker.exitcode == 0 for worker in workers))
+
+        seen = set(parent)
+        total = len(parent)
+        for path in paths:
+            numbers = array('q')
+            with open(path, 'rb') as f:
+                numbers.fromfile(f, per_process)
+            self.assertEqual(list(numbers), sorted(numbers))
+            seen.update(numbers)
+            total += len(numbers)
+        self.assertEqual(total, 500 + processes * per_process)
+        self.assertEqual(len(seen), total)
+        self.assertEqual(min(seen), 100)
+
+    def test_first_use_tolerates_a_concurrent_create(self):
+        connection = connections[self.alias]
+        raced = []
+
+        def create_row_after_first_update(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('UPDATE') and not raced:
+                # Another process creates the row between our UPDATE and INSERT
+                raced.append(sql)
+                connection.connection.cursor().execute(
+                    f"INSERT INTO {Sequence._meta.db_table} (name, last_value) VALUES ('test', 50)"
+                )
+            return result
+
+        with connection.execute_wrapper(create_row_after_first_update), transaction.atomic(using=self.alias):
+            self.assertEqual(reserve_block(connection, 'test', 10), (51, 60))
+        with transaction.atomic(using=self.alias):
+            self.assertEqual(reserve_block(connection, 'test', 10), (61, 70))
+
+    def test_fork_hook_is_registered_once_per_process(self):
+        with mock.patch.object(os, 'register_at_fork') as register:
+            BlockAllocator('other', block_size=10, using=self.alias)
+        register.assert_not_called()
+
+    def test_numbers_inside_a_transaction_are_not_cached(self):
+        allocator = BlockAllocator('test', block_size=1000, using=self.alias)
+        with transaction.atomic(using=self.alias):
+            self.assertEqual([allocator.allocate(), allocator.allocate()], [1, 2])
+            transaction.set_rollback(True, using=self.alias)
+        # The rolled-back numbers are free again and no block was kept
+        self.assertEqual(allocator.allocate(), 1)
+        self.assertEqual(allocator.allocate(), 2)
+
+
+class CouponRedemptionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='saver', password='password')
+        self.client.login(username='saver', password='password')
+        self.product = Product.objects.create(name='Tablet', desc='10 inch', price=200, stock=50)
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SAVE10', discount_type='percentage', discount_value=10, max_uses=2,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+
+    def checkout(self, code='SAVE10'):
+        Cart.objects.update_or_create(user=self.user, product=self.product, defaults={'quantity': 1})
+        return self.client.post(reverse('place_order'), {'coupon_code': code})
+
+    def test_redemption_applies_discount_and_counts_use(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(order_number=response.json()['order_id'])
+        self.assertEqual((order.coupon, order.discount, order.tax, order.total), (self.coupon, 20, 18, 198))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.uses_count, 1)
+        self.assertEqual(CouponRedemption.objects.get(coupon=self.coupon, user=self.user).uses, 1)
+
+    def test_per_user_limit_rolls_back_the_order(self):
+        self.checkout()
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already used', response.json()['message'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.uses_count, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 49)
+
+    def test_global_limit(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(uses_count=2)
+        with self.assertRaisesMessage(coupons.CouponError, 'usage limit reached'):
+            coupons.redeem(self.coupon, self.user, 100)
+
+    def test_stale_save_keeps_uses_count(self):
+        stale = Coupon.objects.get(pk=self.coupon.pk)
+        self.checkout()
+        stale.description = 'Ten percent off'
+        stale.save()
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.uses_count, 1)
+
+    def test_unknown_codes_are_cached(self):
+        with self.assertRaises(coupons.CouponError):
+            coupons.get_coupon('GUESS')
+        with self.assertNumQueries(0):
+            with self.assertRaises(coupons.CouponError):
+                coupons.get_coupon('GUESS')
+        # Creating the coupon clears the cached miss
+        Coupon.objects.create(code='GUESS', discount_value=5, valid_from=timezone.now(), valid_to=timezone.now())
+        self.assertEqual(coupons.get_coupon('GUESS').code, 'GUESS')
+
+    def test_unknown_code_cache_keys_are_bounded(self):
+        for code in ['x' * 5000, 'bad code\n\x00with spaces']:
+            with self.assertRaises(coupons.CouponError):
+                coupons.get_coupon(code)
+        key = coupons._unknown_key('bad code\n\x00with spaces')
+        self.assertRegex(key, r'^coupon-unknown:[0-9a-f]{40}$')
+        self.assertTrue(cache.get(key))
+
+    def test_zero_max_uses_means_no_uses(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(max_uses=0)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.is_valid(), (False, 'Coupon usage limit reached'))
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('usage limit', response.json()['message'])
+
+
+class PricingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='quoter', password='password')
+        self.client.login(username='quoter', password='password')
+        self.product = Product.objects.create(name='Monitor', desc='27 inch', price=300, stock=10)
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        now = timezone.now()
+        Coupon.objects.create(
+            code='FLAT50', discount_type='fixed', discount_value=50, min_purchase_amount=100,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+
+    def test_pipeline(self):
+        response = self.client.get(reverse('cart_quote'), {'coupon': 'FLAT50', 'shipping': 'express'})
+        self.assertEqual(response.json(), {
+            'subtotal': '600.00', 'discount': '50.00', 'tax': '55.00', 'shipping': '10.00', 'total': '615.00',
+            'shipping_method': 'express', 'coupon_code': 'FLAT50', 'coupon_error': None, 'item_count': 2,
+        })
+        quote = self.client.get(reverse('cart_quote'), {'coupon': 'NOPE'}).json()
+        self.assertEqual((quote['discount'], quote['coupon_error']), ('0', 'Invalid coupon code'))
+
+    def test_quote_is_reused_until_cart_or_prices_change(self):
+        self.client.get(reverse('cart_quote'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart_quote'))
+        self.assertFalse([q for q in queries if 'techapp_cart' in q['sql'].lower() or 'techapp_product' in q['sql'].lower()])
+
+        Cart.objects.filter(user=self.user).delete()
+        request = RequestFactory().get('/')
+        request.user, request.session = self.user, self.client.session
+        CartService(request).add(self.product.id, 1)
+        self.assertEqual(self.client.get(reverse('cart_quote')).json()['subtotal'], '300.00')
+
+        self.product.price = 250
+        self.product.save()
+        self.assertEqual(self.client.get(reverse('cart_quote')).json()['subtotal'], '250.00')
+
+    def test_stock_only_saves_keep_memoized_quotes(self):
+        version = pricing.get_pricing_version()
+        self.product.stock = 3
+        self.product.save()
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 2
+        product.save()
+        product.save(update_fields=['stock'])
+        Product.objects.create(name='Cable', desc='HDMI', price=10, stock=5)
+        self.assertEqual(pricing.get_pricing_version(), version)
+
+        product.on_sale, product.sale_price = True, 199
+        product.save()
+        self.assertNotEqual(pricing.get_pricing_version(), version)
+
+    def test_coupon_quotes_expire_with_the_coupon(self):
+        now = timezone.now()
+        coupon = Coupon.objects.get(code='FLAT50')
+        coupon.valid_to = now + timedelta(seconds=30)
+        self.assertLessEqual(pricing._quote_timeout(coupon), 30)
+        coupon.valid_from, coupon.valid_to = now + timedelta(seconds=90), now + timedelta(days=1)
+        self.assertLessEqual(pricing._quote_timeout(coupon), 90)
+        coupon.valid_from = now - timedelta(days=2)
+        self.assertEqual(pricing._quote_timeout(coupon), pricing.QUOTE_TIMEOUT)
+
+        Coupon.objects.filter(code='FLAT50').update(valid_to=now + timedelta(seconds=20))
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.client.get(reverse('cart_quote'), {'coupon': 'FLAT50'})
+        timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0].startswith('quote:')]
+        self.assertEqual(len(timeouts), 1)
+        self.assertLessEqual(timeouts[0], 20)
+
+    def test_order_totals_match_quote(self):
+        response = self.client.post(reverse('place_order'), {'coupon_code': 'FLAT50', 'shipping_method': 'express'})
+        order = Order.objects.get(order_number=response.json()['order_id'])
+        self.assertEqual((order.discount, order.tax, order.shipping_cost, order.total), (50, 55, 10, 615))
+
+
+@unittest.skipUnless(simulator.is_available(), 'NumPy is not installed')
+class CouponSimulatorTest(TestCase):
+    def setUp(self):
+        subtotals = ['12.50', '40.00', '99.99', '100.00', '250.00', '0.00']
+        Order.objects.bulk_create([
+            Order(order_number=f'SIM-{i}', subtotal=Decimal(value), shipping_address='x')
+            for i, value in enumerate(subtotals)
+        ])
+        Order.objects.create(order_number='SIM-X', subtotal=500, status='cancelled', shipping_address='x')
+        now = timezone.now()
+        self.percent = Coupon.objects.create(
+            code='PCT15', discount_type='percentage', discount_value=15,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+        self.fixed = Coupon.objects.create(
+            code='FIX30', discount_type='fixed', discount_value=30, min_purchase_amount=100,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+
+    def test_matches_calculate_discount(self):
+        placed = list(Order.objects.exclude(status='cancelled'))
+        self.percent.refresh_from_db()
+        self.fixed.refresh_from_db()
+        for coupon, result in zip(
+            [self.percent, self.fixed],
+            simulator.simulate([simulator.spec_from_coupon(self.percent), simulator.spec_from_coupon(self.fixed)],
+                               simulator.iter_order_totals(chunk_size=4)),
+        ):
+            expected = [
+                coupon.calculate_discount(order.subtotal).quantize(Decimal('0.01'))
+                for order in placed
+                if not coupon.min_purchase_amount or order.subtotal >= coupon.min_purchase_amount
+            ]
+            self.assertEqual(result.orders, 6)
+            self.assertEqual(result.affected_orders, len([d for d in expected if d]))
+            self.assertEqual(result.total_discount, sum(expected))
+            self.assertEqual(sum(result.distribution.values()), result.affected_orders)
+        self.assertEqual(result.distribution['$25-50'], 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('simulate_coupons', coupon=['FIX30'], spec=['percentage:10:50'], stdout=out)
+        self.assertIn('FIX30', out.getvalue())
+        self.assertIn('Total discount:  $60.00', out.getvalue())
+        self.assertIn('Total discount:  $45.00', out.getvalue())
+
+    def test_admin_action(self):
+        User.objects.create_superuser(username='merch', password='password', email='m@example.com')
+        self.client.login(username='merch', password='password')
+        response = self.client.post(reverse('admin:Techapp_coupon_changelist'), {
+            'action': 'simulate_over_past_orders',
+            '_selected_action': list(Coupon.objects.values_list('pk', flat=True)),
+        })
+        self.assertContains(response, 'Affected orders')
+        self.assertContains(response, 'PCT15')
+
+
+class ReviewPaginationTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Headphones', desc='Wireless', price=150, stock=5)
+        now = timezone.now()
+        User.objects.create_user(username='reader', password='password')
+        self.client.login(username='reader', password='password')
+        users = User.objects.bulk_create([User(username=f'reviewer{i}', password='!') for i in range(25)])
+        for i, user in enumerate(users):
+            review = ProductReview.objects.create(
+                product=self.product, user=user, rating=i % 5 + 1, title=f'Review {i}',
+                comment='Good', is_verified_purchase=True,
+            )
+            # Two reviews share a timestamp to exercise the id tie-breaker
+            ProductReview.objects.filter(pk=review.pk).update(created_at=now - timedelta(minutes=i - (i == 7)))
+
+    def test_detail_renders_first_page_and_histogram(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertEqual(len(response.context['reviews']), REVIEWS_PER_PAGE)
+        self.assertEqual(response.context['reviews'][0].title, 'Review 0')
+        self.assertEqual([row['count'] for row in response.context['rating_histogram']], [5, 5, 5, 5, 5])
+        self.assertContains(response, 'Load more reviews')
+        # Authors come with the page (select_related) and nothing counts or averages reviews
+        review_queries = [q['sql'] for q in queries if 'techapp_productreview' in q['sql'].lower()]
+        self.assertEqual(len(review_queries), 1)
+        self.assertNotIn('COUNT(', review_queries[0].upper())
+
+    def test_load_more_walks_every_review_once(self):
+        titles = [review.title for review in self.client.get(
+            reverse('product_detail', args=[self.product.id])).context['reviews']]
+        cursor = self.client.get(reverse('product_detail', args=[self.product.id])).context['reviews_next']
+        while cursor:
+            data = self.client.get(reverse('api_product_reviews', args=[self.product.id]), {'cursor': cursor}).json()
+            titles += [review['title'] for review in data['results']]
+            cursor = data['next']
+        self.assertEqual(len(titles), 25)
+        self.assertEqual(len(set(titles)), 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api_product_reviews', args=[self.product.id]), {'cursor': 'junk'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reviews_api_requires_login_like_the_product_page(self):
+        self.client.logout()
+        for url in (reverse('product_detail', args=[self.product.id]),
+                    reverse('api_product_reviews', args=[self.product.id])):
+            response = self.client.get(url)
+            self.assertRedirects(response, f"{reverse('sign_in')}?next={url}", fetch_redirect_response=False)
+
+
+class WishlistStatusTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='wisher', password='password')
+        self.products = [
+            Product.objects.create(name=f'Lamp {i}', desc='LED', price=20, stock=5) for i in range(4)
+        ]
+        self.client.login(username='wisher', password='password')
+
+    def _statuses(self, products):
+        return self.client.get(
+            reverse('get_wishlist_statuses'), {'ids': ','.join(str(p.id) for p in products)}
+        ).json()
+
+    def test_batch_answers_from_cached_set(self):
+        Wishlist.objects.create(user=self.user, product=self.products[1])
+        Wishlist.objects.create(user=self.user, product=self.products[3])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self._statuses(self.products)
+        self.assertEqual(data['wishlisted'], [self.products[1].id, self.products[3].id])
+        self.assertEqual(data['statuses'][str(self.products[0].id)], False)
+        self.assertEqual(len([q for q in queries if Wishlist._meta.db_table in q['sql']]), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self._statuses(self.products)
+            self.client.get(reverse('products'))
+        self.assertFalse([q for q in queries if Wishlist._meta.db_table in q['sql']])
+
+    def test_mutations_keep_set_current(self):
+        self.assertEqual(self._statuses(self.products)['wishlisted'], [])
+
+        self.client.post(reverse('add_to_wishlist', args=[self.products[0].id]))
+        self.client.post(reverse('add_to_wishlist', args=[self.products[2].id]))
+        self.assertEqual(self._statuses(self.products)['wishlisted'], [self.products[0].id, self.products[2].id])
+        self.assertTrue(self.client.get(
+            reverse('get_wishlist_status', args=[self.products[0].id])).json()['is_wishlisted'])
+
+        item = Wishlist.objects.get(user=self.user, product=self.products[0])
+        self.client.post(reverse('remove_from_wishlist', args=[item.id]))
+        item = Wishlist.objects.get(user=self.user, product=self.products[2])
+        self.client.post(reverse('move_to_cart', args=[item.id]))
+        self.assertEqual(self._statuses(self.products)['wishlisted'], [])
+
+    def test_rejects_bad_ids(self):
+        response = self.client.get(reverse('get_wishlist_statuses'), {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+        ids = ','.join(str(i) for i in range(WISHLIST_STATUS_BATCH_LIMIT + 1))
+        response = self.client.get(reverse('get_wishlist_statuses'), {'ids': ids})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminChangelistQueryTest(TestCase):
+    # Queries a changelist page may run whatever the number of rows on it
+    QUERY_BUDGET = 8
+    CHANGELISTS = ('order', 'orderitem', 'cart', 'wishlist', 'productreview', 'product', 'stockhold')
+
+    def setUp(self):
+        User.objects.create_superuser(username='admin', password='password', email='admin@example.com')
+        self.client.login(username='admin', password='password')
+        self.batch = 0
+        self.add_rows(5)
+
+    def add_rows(self, count):
+        self.batch += 1
+        category = Category.objects.create(name=f'Audio {self.batch}', slug=f'audio-{self.batch}')
+        for i in range(count):
+            user = User.objects.create(username=f'customer{self.batch}-{i}', first_name='Pat', password='!')
+            product = Product.objects.create(name=f'Speaker {self.batch}-{i}', desc='Loud', price=80, stock=10, category=category)
+            order = Order.objects.create(
+                user=user, shipping_address='1 Main St', shipping_city='Town',
+                shipping_state='ST', shipping_zip='12345', subtotal=80, total=88,
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=80)
+            Cart.objects.create(user=user, product=product, quantity=2)
+            Wishlist.objects.create(user=user, product=product)
+            ProductReview.objects.create(product=product, user=user, rating=4, title='Nice', comment='Good')
+            StockHold.objects.create(
+                product=product, cart_key=f'user:{user.pk}', quantity=1,
+                expires_at=timezone.now() + timedelta(minutes=10),
+            )
+
+    def changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:Techapp_{model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_stay_within_budget(self):
+        before = {name: self.changelist_queries(name) for name in self.CHANGELISTS}
+        self.add_rows(10)
+        for name in self.CHANGELISTS:
+            with self.subTest(changelist=name):
+                queries = self.changelist_queries(name)
+                self.assertLessEqual(queries, self.QUERY_BUDGET)
+                # More rows on the page must not mean more queries
+                self.assertEqual(queries, before[name])
+
+    def test_large_unfiltered_listing_uses_estimate(self):
+        url = reverse('admin:Techapp_order_changelist')
+        with mock.patch.object(EstimatedCountPaginator, 'threshold', 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+            self.assertGreaterEqual(response.context['cl'].result_count, 5)
+
+            # Filtered listings are still counted exactly
+            response = self.client.get(url, {'status__exact': 'pending'})
+            self.assertEqual(response.context['cl'].result_count, 5)
+
+
+class ImportCatalogTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Laptops', slug='laptops')
+        self.existing = Product.objects.create(name='Old name', desc='Old', price=500, stock=1, sku='LAP-1')
+        self.tmpdir = temp_dir(self)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upserts_by_sku_in_batches(self):
+        path = self.write('feed.csv', (
+            'sku,name,desc,price,stock,category,on_sale,sale_price\n'
+            'LAP-1,Ultrabook 14,Thin,899.99,7,laptops,true,799.00\n'
+            'LAP-2,Workstation,Fast,1999,3,laptops,false,\n'
+            'LAP-3,Netbook,Small,199.5,0,,,\n'
+        ))
+        out, err = self.run_import(path, '--batch-size', '2')
+        self.assertIn('Created:  2', out)
+        self.assertIn('Updated:  1', out)
+        self.assertEqual(err, '')
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Ultrabook 14')
+        self.assertEqual(self.existing.stock, 7)
+        self.assertEqual(self.existing.effective_price, Decimal('799.00'))
+        self.assertEqual(self.existing.category, self.category)
+        netbook = Product.objects.get(sku='LAP-3')
+        self.assertEqual(netbook.price, Decimal('199.50'))
+        self.assertIsNone(netbook.category)
+
+        if search.is_available():
+            found, _ = search.search_products(Product.objects.all(), 'workstation')
+            self.assertEqual([p.sku for p in found], ['LAP-2'])
+
+    def test_partial_feed_only_overwrites_its_columns(self):
+        self.existing.category = self.category
+        self.existing.featured = True
+        self.existing.save()
+        path = self.write('prices.csv', 'sku,name,price,is_active\nLAP-1,Old name,450,\nLAP-2,Workstation,1999,\n')
+        out, _ = self.run_import(path)
+        self.assertIn('Created:  1', out)
+        self.assertIn('Updated:  1', out)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, Decimal('450.00'))
+        self.assertEqual(
+            (self.existing.desc, self.existing.stock, self.existing.category, self.existing.featured),
+            ('Old', 1, self.category, True),
+        )
+        # A blank is_active cell keeps the product active rather than switching it off
+        self.assertTrue(self.existing.is_active)
+        self.assertTrue(Product.objects.get(sku='LAP-2').is_active)
+
+        path = self.write('stock.jsonl', '\n'.join([
+            '{"sku": "LAP-1", "name": "Old name", "stock": 9}',
+            '{"sku": "LAP-2", "name": "Workstation", "is_active": false}',
+        ]))
+        self.run_import(path)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.stock, self.existing.price, self.existing.is_active), (9, Decimal('450.00'), True))
+        workstation = Product.objects.get(sku='LAP-2')
+        self.assertEqual((workstation.is_active, workstation.price), (False, Decimal('1999.00')))
+
+    def test_jsonl_reports_invalid_rows(self):
+        path = self.write('feed.jsonl', '\n'.join([
+            '{"sku": "TAB-1", "name": "Tablet", "price": "299", "stock": 4, "featured": true}',
+            '{"sku": "TAB-2", "name": "Tablet Mini", "price": "cheap"}',
+            '{"sku": "TAB-3", "name": "Tablet Max", "category": "tablets"}',
+            '{"name": "No SKU"}',
+        ]))
+        out, err = self.run_import(path)
+        self.assertIn('Created:  1', out)
+        self.assertIn('Invalid:  3', out)
+        self.assertIn("line 3 (TAB-3): unknown category 'tablets'", err)
+        self.assertTrue(Product.objects.get(sku='TAB-1').featured)
+        self.assertFalse(Product.objects.filter(sku__in=['TAB-2', 'TAB-3']).exists())
+
+    def test_jsonl_malformed_lines_are_skipped_not_fatal(self):
+        path = self.write('feed.jsonl', '\n'.join([
+            '{"sku": "TAB-1", "name": "Tablet"',
+            '["TAB-2", "Tablet Mini"]',
+            '{"sku": "TAB-3", "name": "Tablet Max"}',
+        ]))
+        out, err = self.run_import(path)
+        self.assertIn('Created:  1', out)
+        self.assertIn('Invalid:  2', out)
+        self.assertIn('line 1 (no sku): invalid JSON', err)
+        self.assertIn('line 2 (no sku): expected a JSON object', err)
+        self.assertTrue(Product.objects.filter(sku='TAB-3').exists())
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write('feed.csv', 'sku,name,price\nLAP-1,Renamed,1\nLAP-9,New,2\n')
+        out, _ = self.run_import(path, '--dry-run')
+        self.assertIn('Dry run', out)
+        self.assertIn('Valid:    2', out)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Old name')
+        self.assertFalse(Product.objects.filter(sku='LAP-9').exists())
+
+
+class CatalogFeedTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Audio & Video', slug='audio')
+        self.speaker = Product.objects.create(
+            name='Speaker <Pro>', desc='Loud & clear', price=120, stock=4, sku='SPK-1', category=self.category,
+        )
+        self.cable = Product.objects.create(name='Cable', desc='1m', price=5, stock=0, sku='CBL-1')
+        self.retired = Product.objects.create(name='Retired', desc='Gone', price=9, stock=3, sku='OLD-1', is_active=False)
+        # Everything last changed a day ago
+        self.day_ago = timezone.now() - timedelta(days=1)
+        Product.objects.update(updated_at=self.day_ago)
+
+    def stream(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_and_jsonl_export_active_catalog(self):
+        rows = list(csv.DictReader(io.StringIO(self.stream(
+            self.client.get(reverse('catalog_feed', args=['csv']))))))
+        self.assertEqual([row['sku'] for row in rows], ['SPK-1', 'CBL-1'])
+        self.assertEqual(rows[0]['price'], '120.00')
+        self.assertEqual(rows[0]['category'], 'audio')
+        self.assertEqual(rows[0]['url'], 'http://testserver' + reverse('product_detail', args=[self.speaker.id]))
+
+        lines = self.stream(self.client.get(reverse('catalog_feed', args=['jsonl']))).splitlines()
+        self.assertEqual([json.loads(line)['sku'] for line in lines], ['SPK-1', 'CBL-1'])
+        self.assertEqual(self.client.get(reverse('catalog_feed', args=['pdf'])).status_code, 404)
+
+    @mock.patch.object(feeds, 'FEED_TOKEN', 'feed-secret')
+    def test_incremental_feed_includes_deactivated_products(self):
+        response = self.client.get(reverse('catalog_feed', args=['jsonl']), {'token': 'feed-secret'})
+        watermark = response['X-Catalog-Watermark']
+        self.stream(response)
+
+        Product.objects.filter(pk=self.cable.pk).update(stock=10, updated_at=timezone.now() + timedelta(minutes=5))
+        Product.objects.filter(pk=self.speaker.pk).update(is_active=False, updated_at=timezone.now() + timedelta(minutes=5))
+        lines = self.stream(self.client.get(
+            reverse('catalog_feed', args=['jsonl']), {'since': watermark}, headers={'X-Feed-Token': 'feed-secret'},
+        )).splitlines()
+        records = {record['sku']: record for record in map(json.loads, lines)}
+        self.assertEqual(set(records), {'SPK-1', 'CBL-1'})
+        self.assertFalse(records['SPK-1']['active'])
+        self.assertEqual(records['CBL-1']['stock'], 10)
+
+    @mock.patch.object(feeds, 'FEED_TOKEN', 'feed-secret')
+    def test_public_feed_hides_stock_and_deactivated_products(self):
+        Product.objects.filter(pk=self.speaker.pk).update(is_active=False, updated_at=timezone.now())
+        since = {'since': self.day_ago.isoformat()}
+        for params in ({}, {'token': 'wrong'}, {'token': ''}):
+            lines = self.stream(self.client.get(
+                reverse('catalog_feed', args=['jsonl']), {**since, **params},
+            )).splitlines()
+            records = [json.loads(line) for line in lines]
+            self.assertEqual([record['sku'] for record in records], ['CBL-1'])
+            self.assertNotIn('stock', records[0])
+
+        rows = list(csv.DictReader(io.StringIO(self.stream(
+            self.client.get(reverse('catalog_feed', args=['csv']))))))
+        self.assertEqual([row['sku'] for row in rows], ['CBL-1'])
+        self.assertNotIn('stock', rows[0])
+        root = ElementTree.fromstring(self.stream(self.client.get(reverse('catalog_feed', args=['xml']))))
+        self.assertEqual(
+            root.findtext('channel/item/{http://base.google.com/ns/1.0}availability'), 'out_of_stock'
+        )
+
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        lines = self.stream(self.client.get(reverse('catalog_feed', args=['jsonl']), since)).splitlines()
+        self.assertEqual({json.loads(line)['sku'] for line in lines}, {'SPK-1', 'CBL-1', 'OLD-1'})
+
+        response = self.client.get(reverse('catalog_feed', args=['csv']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_shopping_feed_is_escaped_xml(self):
+        root = ElementTree.fromstring(self.stream(self.client.get(reverse('catalog_feed', args=['xml']))))
+        items = root.findall('channel/item')
+        self.assertEqual(len(items), 2)
+        g = '{http://base.google.com/ns/1.0}'
+        self.assertEqual(items[0].findtext('title'), 'Speaker <Pro>')
+        self.assertEqual(items[0].findtext('description'), 'Loud & clear')
+        self.assertEqual(items[0].findtext(f'{g}price'), '120.00 USD')
+        self.assertEqual(items[0].findtext(f'{g}product_type'), 'Audio & Video')
+        self.assertEqual(items[1].findtext(f'{g}availability'), 'out_of_stock')
+
+    def test_sitemaps_split_products_into_pages(self):
+        ns = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+        with mock.patch.object(feeds, 'SITEMAP_MAX_URLS', 1):
+            index = ElementTree.fromstring(self.stream(self.client.get(reverse('sitemap_index'))))
+            self.assertEqual(
+                [loc.text for loc in index.iter(f'{ns}loc')],
+                ['http://testserver/sitemap-categories.xml',
+                 'http://testserver/sitemap-products-1.xml',
+                 'http://testserver/sitemap-products-2.xml'],
+            )
+            page = ElementTree.fromstring(self.stream(self.client.get(reverse('sitemap_products', args=[2]))))
+            self.assertEqual(
+                [loc.text for loc in page.iter(f'{ns}loc')],
+                ['http://testserver' + reverse('product_detail', args=[self.cable.id])],
+            )
+            self.assertEqual(self.client.get(reverse('sitemap_products', args=[3])).status_code, 404)
+        categories = ElementTree.fromstring(self.stream(self.client.get(reverse('sitemap_categories'))))
+        self.assertEqual([loc.text for loc in categories.iter(f'{ns}loc')], ['http://testserver/products/?category=audio'])
+
+    def test_command_incremental_runs_keep_a_watermark(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'catalog.csv')
+
+            def export():
+                call_command('export_catalog', '--format', 'csv', '--output', output, '--incremental', stdout=StringIO())
+                with open(output, encoding='utf-8') as f:
+                    return [line.split(',')[1] for line in f.read().splitlines()[1:]]
+
+            self.assertEqual(export(), ['SPK-1', 'CBL-1'])
+            self.assertTrue(os.path.exists(output + '.state'))
+            self.assertEqual(export(), [])
+            Product.objects.filter(pk=self.cable.pk).update(price=6, updated_at=timezone.now() + timedelta(minutes=5))
+            self.assertEqual(export(), ['CBL-1'])
+
+
+class TempMediaMixin:
+    """Uploads go to a throwaway MEDIA_ROOT"""
+
+    def setUp(self):
+        settings_override = override_settings(MEDIA_ROOT=temp_dir(self))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Render inline, inside the test's transaction
+        inline = mock.patch.object(images, 'RENDER_IN_BACKGROUND', False)
+        inline.start()
+        self.addCleanup(inline.stop)
+
+    def upload(self, name, size, mode='RGB'):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, 'PNG' if name.endswith('.png') else 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def create_product(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name='Monitor', desc='4K', price=300, stock=2, image=image)
+
+
+class ImageRenditionTest(TempMediaMixin, TestCase):
+    def test_upload_generates_webp_and_jpeg_widths(self):
+        product = self.create_product(self.upload('monitor.jpg', (1000, 500)))
+        product.refresh_from_db()
+        self.assertEqual(product.image_renditions, {'name': product.image.name, 'widths': [200, 400, 800]})
+        for name in images.rendition_names(product.image_renditions):
+            self.assertTrue(default_storage.exists(name), name)
+        with default_storage.open(images.rendition_name(product.image.name, 400, 'webp')) as f:
+            rendition = Image.open(f)
+            self.assertEqual((rendition.format, rendition.size), ('WEBP', (400, 200)))
+
+    def test_replacing_image_removes_old_renditions(self):
+        product = self.create_product(self.upload('monitor.png', (500, 500), mode='RGBA'))
+        old_record = Product.objects.get(pk=product.pk).image_renditions
+        self.assertEqual(old_record['widths'], [200, 400])
+
+        product.image = self.upload('monitor-v2.jpg', (300, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(any(default_storage.exists(name) for name in images.rendition_names(old_record)))
+        self.assertEqual(Product.objects.get(pk=product.pk).image_renditions['widths'], [200])
+
+    def test_tag_emits_srcset_and_falls_back_to_original(self):
+        template = Template('{% load responsive_images %}{% responsive_image product sizes="280px" alt=product.name %}')
+        product = self.create_product(self.upload('monitor.jpg', (1000, 500)))
+        product.refresh_from_db()
+        html = template.render(Context({'product': product}))
+        self.assertIn('<source type="image/webp" srcset="/media/products/monitor.200w.webp 200w, ', html)
+        self.assertIn('/media/products/monitor.800w.jpg 800w', html)
+        self.assertIn('sizes="280px"', html)
+        self.assertIn('alt="Monitor"', html)
+
+        # Renditions not (yet) generated for the current file: plain original
+        Product.objects.filter(pk=product.pk).update(image_renditions={})
+        product.refresh_from_db()
+        html = template.render(Context({'product': product}))
+        self.assertEqual(html, '<img src="/media/products/monitor.jpg" alt="Monitor" loading="lazy" decoding="async">')
+
+    def test_saves_that_cannot_change_the_image_do_not_render(self):
+        product = self.create_product(self.upload('monitor.jpg', (1000, 500)))
+        with mock.patch.object(images, 'render', side_effect=AssertionError('image did not change')):
+            with self.captureOnCommitCallbacks(execute=True):
+                product.stock = 5
+                product.save(update_fields=['stock'])
+                partial = Product.objects.only('stock').get(pk=product.pk)
+                partial.stock = 4
+                partial.save()
+                # In-memory record predates the render, but the stored one is current
+                product.save()
+
+    def test_uploads_render_off_the_request_thread(self):
+        with mock.patch.object(images, 'RENDER_IN_BACKGROUND', True), \
+                mock.patch.object(images, '_renderer') as renderer, \
+                mock.patch.object(images, 'render', side_effect=AssertionError('rendered inline')):
+            product = self.create_product(self.upload('monitor.jpg', (1000, 500)))
+        renderer.submit.assert_called_once_with(images._refresh_in_worker, Product, product.pk)
+
+    def test_decompression_bomb_upload_is_left_unrendered(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            product = self.create_product(self.upload('huge.jpg', (1000, 500)))
+        product.refresh_from_db()
+        self.assertEqual(product.image_renditions, {})
+
+    def test_backfill_command_renders_only_stale_images(self):
+        name = default_storage.save('products/imported.jpg', self.upload('imported.jpg', (900, 900)))
+        Product.objects.bulk_create([Product(name='Imported', desc='Feed', price=10, image=name)])
+        out = StringIO()
+        call_command('generate_image_renditions', '--workers', '2', stdout=out, stderr=StringIO())
+        self.assertIn('Rendered 1 images (0 failed)', out.getvalue())
+        self.assertEqual(Product.objects.get(name='Imported').image_renditions['widths'], [200, 400, 800])
+
+        out = StringIO()
+        call_command('generate_image_renditions', '--workers', '2', stdout=out)
+        self.assertIn('Rendered 0 images', out.getvalue())
+
+
+class ImagePlaceholderTest(TempMediaMixin, TestCase):
+    def test_upload_stores_tiny_placeholder_and_page_inlines_it(self):
+        product = self.create_product(self.upload('monitor.jpg', (1200, 600)))
+        product.refresh_from_db()
+        prefix = 'data:image/webp;base64,'
+        self.assertTrue(product.image_placeholder.startswith(prefix))
+        self.assertLess(len(product.image_placeholder), 400)
+        preview = Image.open(io.BytesIO(base64.b64decode(product.image_placeholder[len(prefix):])))
+        self.assertEqual(preview.size, (24, 12))
+
+        response = self.client.get(reverse('products'))
+        self.assertContains(response, f'background: center / cover no-repeat url({product.image_placeholder});')
+
+    def test_backfill_is_incremental(self):
+        product = self.create_product(self.upload('monitor.jpg', (600, 600)))
+        # Renditions are current but the placeholder predates the feature
+        Product.objects.filter(pk=product.pk).update(image_placeholder='')
+        with mock.patch.object(images, 'render', side_effect=AssertionError('renditions are up to date')):
+            out = StringIO()
+            call_command('generate_image_renditions', '--workers', '1', '--model', 'products', stdout=out)
+        self.assertIn('Rendered 1 images (0 failed)', out.getvalue())
+        self.assertTrue(Product.objects.get(pk=product.pk).image_placeholder)
+
+        out = StringIO()
+        call_command('generate_image_renditions', '--workers', '1', '--model', 'products', stdout=out)
+        self.assertIn('Rendered 0 images', out.getvalue())
+
+    def test_clearing_image_clears_placeholder(self):
+        product = self.create_product(self.upload('monitor.jpg', (600, 600)))
+        product.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual((product.image_renditions, product.image_placeholder), ({}, ''))
+
+
+class FetchProductImagesTest(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        def image_bytes(color, fmt):
+            buffer = io.BytesIO()
+            Image.new('RGB', (300, 300), color).save(buffer, fmt)
+            return buffer.getvalue()
+
+        red, blue = image_bytes('red', 'JPEG'), image_bytes('blue', 'PNG')
+        routes = {
+            '/red.jpg': (200, red),
+            '/red-copy.jpg': (200, red),
+            '/blue.png': (200, blue),
+            '/moved': (302, b''),
+            '/text': (200, b'not an image'),
+        }
+        stats = self.server_stats = {'connections': 0, 'requests': 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                stats['connections'] += 1
+
+            def do_GET(self):
+                stats['requests'] += 1
+                if self.path == '/stall':
+                    # Promise a body, send a little of it, then go quiet past the client's timeout
+                    self.send_response(200)
+                    self.send_header('Content-Length', '100000')
+                    self.end_headers()
+                    self.wfile.write(red[:100])
+                    self.wfile.flush()
+                    time.sleep(2)
+                    return
+                status, body = routes.get(self.path, (404, b'missing'))
+                self.send_response(status)
+                if status == 302:
+                    self.send_header('Location', '/blue.png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        self.products = [
+            Product.objects.create(name=f'Phone {i}', desc='5G', price=500, stock=3, sku=f'PH-{i}') for i in range(6)
+        ]
+
+    def run_fetch(self, mapping, *args):
+        path = os.path.join(settings.MEDIA_ROOT, 'mapping.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('sku,url\n' + ''.join(f'{sku},{self.base_url}{route}\n' for sku, route in mapping))
+        out, err = StringIO(), StringIO()
+        call_command('fetch_product_images', path, '--skip-renditions', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_downloads_deduplicate_by_content(self):
+        out, err = self.run_fetch([
+            ('PH-0', '/red.jpg'), ('PH-1', '/red-copy.jpg'), ('PH-2', '/red.jpg'),
+            ('PH-3', '/moved'), ('PH-4', '/text'), ('PH-5', '/gone'), ('NOPE', '/red.jpg'),
+        ], '--workers', '1')
+        self.assertIn('Stored:       2', out)
+        self.assertIn('Duplicates:   1', out)
+        self.assertIn('Failed:       2', out)
+        self.assertIn('Products:     4', out)
+        self.assertIn("No product with sku 'NOPE'", err)
+        self.assertIn('/text: not a valid image', err)
+        self.assertIn('/gone: HTTP 404', err)
+
+        stored = {p.sku: p.image.name for p in Product.objects.filter(sku__in=['PH-0', 'PH-1', 'PH-2', 'PH-3'])}
+        self.assertEqual(stored['PH-0'], stored['PH-1'])
+        self.assertEqual(stored['PH-0'], stored['PH-2'])
+        with default_storage.open(stored['PH-0']) as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(stored['PH-0'], f'products/{digest[:2]}/{digest}.jpg')
+        self.assertTrue(stored['PH-3'].endswith('.png'))
+        # One worker: every request, redirects included, went over a single kept-alive connection
+        self.assertEqual(self.server_stats['connections'], 1)
+        self.assertEqual(self.server_stats['requests'], 6)
+
+    def test_existing_images_kept_unless_overwrite(self):
+        Product.objects.filter(pk=self.products[0].pk).update(image='products/original.jpg')
+        self.run_fetch([('PH-0', '/red.jpg')])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).image.name, 'products/original.jpg')
+        self.run_fetch([('PH-0', '/red.jpg')], '--overwrite')
+        self.assertNotEqual(Product.objects.get(pk=self.products[0].pk).image.name, 'products/original.jpg')
+
+    def test_stalled_body_fails_one_url_and_the_worker_reconnects(self):
+        out, err = self.run_fetch([('PH-0', '/stall'), ('PH-1', '/red.jpg')], '--workers', '1', '--timeout', '0.5')
+        self.assertIn('Stored:       1', out)
+        self.assertIn('Failed:       1', out)
+        self.assertIn('/stall: timed out', err)
+        self.assertTrue(Product.objects.get(pk=self.products[1].pk).image)
+        self.assertEqual(self.server_stats['connections'], 2)
+
+    def test_decompression_bomb_is_rejected(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            out, err = self.run_fetch([('PH-0', '/blue.png')])
+        self.assertIn('Failed:       1', out)
+        self.assertIn('/blue.png: not a valid image', err)
+
+    def test_body_over_limit_is_rejected(self):
+        out, err = self.run_fetch([('PH-0', '/blue.png')], '--max-bytes', '100')
+        self.assertIn('Failed:       1', out)
+        self.assertIn('byte limit', err)
+        self.assertFalse(Product.objects.get(pk=self.products[0].pk).image)
+
+
+class AssetBundleTest(TestCase):
+    def setUp(self):
+        self.build_dir = temp_dir(self)
+        patcher = mock.patch.object(assets, 'ASSET_BUILD_DIR', self.build_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, filename):
+        with open(os.path.join(self.build_dir, filename), 'rb') as f:
+            return f.read()
+
+    def test_build_writes_fingerprinted_bundles_with_gzip_siblings(self):
+        manifest = assets.build()
+        self.assertEqual(set(manifest), {'core.css', 'core.js'})
+        self.assertRegex(manifest['core.css'], r'^core\.[0-9a-f]{12}\.css$')
+        content = self.read(manifest['core.css'])
+        self.assertEqual(gzip.decompress(self.read(manifest['core.css'] + '.gz')), content)
+
+        css = content.decode()
+        # @import rules are only valid first; relative urls now point at STATIC_URL
+        imports = [i for i, line in enumerate(css.splitlines()) if line.startswith('@import')]
+        self.assertEqual(imports, [0, 1])
+        self.assertIn('url(/static/images/slider-01.jpg)', css)
+        self.assertNotIn('sourceMappingURL', css)
+        self.assertIn('/* js/quick-wins.js */', self.read(manifest['core.js']).decode())
+        self.assertEqual(assets.build(), manifest)
+        self.assertFalse([f for f in os.listdir(self.build_dir) if f.endswith('.tmp')])
+
+    def test_rebuild_keeps_only_previous_build(self):
+        first = assets.build({'core.css': ['css/cart-badge.css']})
+        second = assets.build({'core.css': ['css/readability.css']})
+        third = assets.build({'core.css': ['css/responsive.css']})
+        files = os.listdir(self.build_dir)
+        self.assertNotIn(first['core.css'], files)
+        self.assertIn(second['core.css'], files)
+        self.assertIn(third['core.css'], files)
+        self.assertEqual(assets.read_manifest(), third)
+
+    def test_served_with_negotiated_encoding_and_far_future_caching(self):
+        filename = assets.build()['core.css']
+        url = assets.ASSET_URL + filename
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(b''.join(response.streaming_content), self.read(filename + '.gz'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertNotIn('sessionid', response.cookies)
+
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), self.read(filename))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        for bad in ('core.000000000000.css', 'manifest.json', '..%2Fsettings.py', filename + '.gz'):
+            self.assertEqual(self.client.get(assets.ASSET_URL + bad).status_code, 404)
+
+    def test_base_template_links_bundles_once_built(self):
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '/static/css/bootstrap.min.css')
+        self.assertContains(response, '/static/js/quick-wins.js')
+
+        manifest = assets.build()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, f'<link rel="stylesheet" href="/assets/{manifest["core.css"]}">', html=True)
+        self.assertContains(response, f'<script src="/assets/{manifest["core.js"]}"></script>', html=True)
+        self.assertNotContains(response, '/static/css/bootstrap.min.css')
+
+
+class SessionWriteTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Tablet', desc='10 inch', price=250, stock=5)
+
+    def session_writes(self, *requests):
+        """Run ``(method, url, kwargs)`` requests, returning how many INSERT/UPDATEs hit the session table"""
+        with CaptureQueriesContext(connection) as queries:
+            for method, url, kwargs in requests:
+                response = getattr(self.client, method)(url, **kwargs)
+                self.assertLess(response.status_code, 500, url)
+        return sum(
+            query['sql'].startswith(('INSERT', 'UPDATE')) and 'django_session' in query['sql']
+            for query in queries.captured_queries
+        )
+
+    def browse(self):
+        urls = [
+            reverse('index'), reverse('products'), reverse('about'), reverse('contact'), reverse('policy'),
+            reverse('cart'), reverse('checkout'), reverse('cart_count'), reverse('cart_quote'),
+            reverse('api_products'), reverse('api_product_reviews', args=[self.product.id]),
+        ]
+        return [('get', url, {}) for url in urls]
+
+    def test_browsing_never_writes_the_session(self):
+        self.assertEqual(self.session_writes(*self.browse()), 0)
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn('sessionid', self.client.cookies)
+
+    def test_only_cart_mutations_write_the_session(self):
+        add = ('post', reverse('add_to_cart'), {
+            'data': {'product_id': self.product.id, 'quantity': 1}, 'content_type': 'application/json',
+        })
+        self.assertEqual(self.session_writes(add), 1)
+        self.assertEqual(self.client.session['cart'], {str(self.product.id): 1})
+
+        # A stored cart is read on every page but not written back
+        self.assertEqual(self.session_writes(*self.browse()), 0)
+
+        remove = ('post', reverse('remove_from_cart', args=[self.product.id]), {})
+        self.assertEqual(self.session_writes(remove), 1)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_emptying_an_unstored_cart_creates_no_session(self):
+        self.assertEqual(self.session_writes(
+            ('post', reverse('remove_from_cart', args=[self.product.id]), {}),
+            ('post', reverse('update_cart', args=[self.product.id]), {'data': {'quantity': 0}}),
+        ), 0)
@@ -5,6 +5,10 @@ from django.contrib.auth import views as auth_views
 
 urlpatterns = [
     path('api/cart/count/', views.cart_count, name='cart_count'),
+    path('api/cart/quote/', views.cart_quote, name='cart_quote'),
+    path('api/products/', views.api_products, name='api_products'),
+    path('api/products/<int:product_id>/reviews/', views.api_product_reviews, name='api_product_reviews'),
+    path('api/events/', views.event_stream, name='event_stream'),
     path('', views.index, name='index'),
     path('products/', views.products, name='products'),
     path('about/', views.about, name='about'),
@@ -26,9 +30,16 @@ urlpatterns = [
     path('wishlist/add/<int:product_id>/', views.add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/remove/<int:wishlist_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('wishlist/move-to-cart/<int:wishlist_id>/', views.move_to_cart, name='move_to_cart'),
+    path('wishlist/status/', views.get_wishlist_statuses, name='get_wishlist_statuses'),
     path('wishlist/status/<int:product_id>/', views.get_wishlist_status, name='get_wishlist_status'),
     
     # Product detail & reviews
     path('product/<int:product_id>/', views.product_detail, name='product_detail'),
     path('product/<int:product_id>/review/', views.submit_review, name='submit_review'),
+
+    # Catalog feeds & sitemaps
+    path('feeds/catalog.<str:fmt>', views.catalog_feed, name='catalog_feed'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemap-categories.xml', views.sitemap_categories, name='sitemap_categories'),
+    path('sitemap-products-<int:page>.xml', views.sitemap_products, name='sitemap_products'),
 ]
\ No newline at end of file
@@ -1,48 +1,183 @@
-from django.shortcuts import get_object_or_404
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Least
+from django.http import Http404
+from . import events
+
+
+# Backends private to each worker process: invalidating an entry only reaches
+# the worker that made the write, so other workers may serve it until it
+# expires. There entries are kept for PER_PROCESS_CACHE_TIMEOUT at most.
+PER_PROCESS_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+PER_PROCESS_CACHE_TIMEOUT = 5
+
+
+def shared_timeout(timeout):
+    """``timeout`` when the default cache is shared between workers, capped when it is per process"""
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHE_BACKENDS:
+        return min(timeout, PER_PROCESS_CACHE_TIMEOUT)
+    return timeout
+
+
+# Cached cart counts live under a per-user version that every mutation bumps,
+# so a stale count is never served and old entries simply expire
+CART_COUNT_TIMEOUT = 300
+
+
+def _cart_version_key(user_id):
+    return f'cart:{user_id}:version'
+
+
+def get_cart_version(user_id):
+    """Current cart version stamp for a user"""
+    key = _cart_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost version key can never revive old entries
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cart_version(user_id):
+    """
+    Move a user's cart to a new version, orphaning everything cached for it.
+
+    Bumped again when the surrounding transaction commits, so a reader that
+    ran before the commit can't pin the pre-commit count to the new version.
+    """
+    def bump():
+        key = _cart_version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    bump()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def get_user_cart_count(user_id):
+    """Total quantity in a user's cart, computed once per cart version"""
+    from .models import Cart
+    key = f'cart:{user_id}:{get_cart_version(user_id)}:count'
+    count = cache.get(key)
+    if count is None:
+        count = Cart.objects.filter(user_id=user_id, is_active=True).aggregate(
+            total=Sum('quantity')
+        )['total'] or 0
+        cache.set(key, count, shared_timeout(CART_COUNT_TIMEOUT))
+    return count
+
+
+# A user's wishlisted product IDs are cached as one set; any change to the
+# user's wishlist drops it and the next read reloads it in a single query
+WISHLIST_IDS_TIMEOUT = 3600
+
+
+def _wishlist_ids_key(user_id):
+    return f'wishlist:{user_id}:ids'
+
+
+def get_wishlist_ids(user_id):
+    """Frozen set of the product IDs on a user's wishlist"""
+    from .models import Wishlist
+    key = _wishlist_ids_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Wishlist.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+        cache.set(key, ids, shared_timeout(WISHLIST_IDS_TIMEOUT))
+    return ids
+
+
+def forget_wishlist_ids(user_id):
+    """
+    Drop a user's cached wishlist set.
+
+    Dropped again when the surrounding transaction commits, so a reader that
+    ran before the commit can't cache the old set after the write.
+    """
+    def forget():
+        cache.delete(_wishlist_ids_key(user_id))
+
+    forget()
+    if connection.in_atomic_block:
+        transaction.on_commit(forget)
+
+
+def get_cart_count(request):
+    """Cart badge count without building a CartService or touching the database for guests"""
+    if request.user.is_authenticated:
+        return get_user_cart_count(request.user.pk)
+    cart = request.session.get('cart') or {}
+    return sum(cart.values())
+
+
+class GuestCartItem:
+    """Session cart line exposing the same interface as a ``Cart`` row"""
+    __slots__ = ('product', 'quantity')
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def product_id(self):
+        return self.product.pk
+
+    @property
+    def subtotal(self):
+        """Calculate subtotal for this cart item"""
+        return self.product.get_price * self.quantity
+
+    @property
+    def total_price(self):
+        return self.subtotal
+
 
 class CartService:
     def __init__(self, request):
         self.request = request
         self.session = request.session
         self.user = request.user
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        # Read-only until mutated: browsing must not create or rewrite the session
+        self.cart = self.session.get('cart') or {}
+        # Loaded lines and total, reused until the cart is mutated
+        self._items = None
+        self._total = None
 
     def add(self, product_id, quantity=1):
-        from .models import Product, Cart
+        """
+        Add ``quantity`` units of a product to the cart.
+
+        Raises:
+            ValueError: If ``quantity`` is less than 1
+        """
         product_id = str(product_id)
+        quantity = int(quantity)
+        if quantity < 1:
+            raise ValueError('Quantity must be at least 1')
         if self.user.is_authenticated:
-            product = get_object_or_404(Product, id=product_id)
-            cart_item, created = Cart.objects.get_or_create(
-                user=self.user,
-                product=product,
-                defaults={'quantity': 0}
-            )
-            cart_item.quantity += int(quantity)
-            cart_item.save()
+            self._write_line(int(product_id), quantity, increment=True)
         else:
-            if product_id in self.cart:
-                self.cart[product_id] += int(quantity)
-            else:
-                self.cart[product_id] = int(quantity)
+            self.cart[product_id] = self.cart.get(product_id, 0) + quantity
             self.save_session()
+        self._changed()
 
     def update(self, product_id, quantity):
-        from .models import Product, Cart
+        from .models import Cart
         product_id = str(product_id)
         quantity = int(quantity)
         if self.user.is_authenticated:
-            product = get_object_or_404(Product, id=product_id)
             if quantity > 0:
-                Cart.objects.update_or_create(
-                    user=self.user,
-                    product=product,
-                    defaults={'quantity': quantity}
-                )
+                self._write_line(int(product_id), quantity, increment=False)
             else:
-                Cart.objects.filter(user=self.user, product=product).delete()
+                Cart.objects.filter(user=self.user, product_id=product_id).delete()
         else:
             if quantity > 0:
                 self.cart[product_id] = quantity
@@ -50,6 +185,43 @@ class CartService:
                 if product_id in self.cart:
                     del self.cart[product_id]
             self.save_session()
+        self._changed()
+
+    def _write_line(self, product_id, quantity, increment):
+        """
+        Increment or set the user's cart row for a product in place.
+
+        The new quantity is computed by the database in a single conditional
+        ``UPDATE`` and capped at the product's current stock, so concurrent
+        requests can't lose each other's changes. When no row exists yet, a
+        zero-quantity row is inserted (ignoring a conflicting insert from a
+        concurrent request) and the same ``UPDATE`` is applied to it.
+
+        Raises:
+            Http404: If the product doesn't exist or is inactive (also when
+                it was deactivated after being added)
+            ValueError: If the product is out of stock
+        """
+        from .models import Product, Cart
+        stock = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('stock')[:1])
+        new_quantity = F('quantity') + quantity if increment else Value(quantity)
+        rows = Cart.objects.filter(
+            user=self.user, product_id=product_id, product__is_active=True, product__stock__gt=0,
+        )
+
+        with transaction.atomic():
+            if rows.update(quantity=Least(new_quantity, stock)):
+                return
+            product = Product.objects.filter(pk=product_id, is_active=True).values('stock').first()
+            if product is None:
+                raise Http404('No Product matches the given query.')
+            if not product['stock'] or product['stock'] <= 0:
+                raise ValueError('Product is out of stock')
+            Cart.objects.bulk_create(
+                [Cart(user=self.user, product_id=product_id, quantity=0)],
+                ignore_conflicts=True,
+            )
+            rows.update(quantity=Least(new_quantity, stock))
 
     def remove(self, product_id):
         from .models import Product, Cart
@@ -60,51 +232,151 @@ class CartService:
             if product_id in self.cart:
                 del self.cart[product_id]
                 self.save_session()
+        self._changed()
+
+    def clear(self):
+        """Empty the cart, e.g. once its lines became an order"""
+        from .models import Cart
+        if self.user.is_authenticated:
+            Cart.objects.filter(user=self.user).delete()
+        else:
+            self.cart = {}
+            self.save_session()
+        self._changed()
+
+    def remove_ordered(self, quantities):
+        """
+        Take the quantities that went into an order out of the cart.
+
+        Lines added or increased since the cart was read (e.g. from another
+        tab during checkout) keep whatever was not ordered, where ``clear()``
+        would drop them unordered. Logged-in carts take two statements
+        whatever the cart size.
+
+        Args:
+            quantities (dict): product_id -> quantity ordered
+        """
+        from .models import Cart
+        if not quantities:
+            return
+        if self.user.is_authenticated:
+            rows = Cart.objects.filter(user=self.user)
+            fully_ordered = Q()
+            for pid, quantity in quantities.items():
+                fully_ordered |= Q(product_id=pid, quantity__lte=quantity)
+            rows.filter(fully_ordered).delete()
+            rows.filter(product_id__in=quantities).update(quantity=F('quantity') - Case(
+                *[When(product_id=pid, then=Value(quantity)) for pid, quantity in quantities.items()],
+                default=Value(0),
+            ))
+        else:
+            for pid, quantity in quantities.items():
+                remaining = self.cart.get(str(pid), 0) - quantity
+                if remaining > 0:
+                    self.cart[str(pid)] = remaining
+                else:
+                    self.cart.pop(str(pid), None)
+            self.save_session()
+        self._changed()
 
     def get_cart_items(self):
+        """
+        Return the cart lines as a list, loading them at most once.
+
+        Guest carts are hydrated with one bulk product query and returned as
+        ``GuestCartItem`` objects; entries whose product no longer exists
+        are skipped.
+        """
         from .models import Product, Cart
+        if self._items is not None:
+            return self._items
         if self.user.is_authenticated:
-            return Cart.objects.filter(user=self.user).select_related('product')
+            self._items = list(Cart.objects.filter(user=self.user).select_related('product'))
         else:
-            items = []
-            for product_id, quantity in self.cart.items():
-                try:
-                    product = Product.objects.get(id=product_id)
-                    items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'total_price': product.price * quantity
-                    })
-                except Product.DoesNotExist:
-                    pass
-            return items
+            product_ids = [int(pid) for pid in self.cart if str(pid).isdigit()]
+            products = Product.objects.in_bulk(product_ids) if product_ids else {}
+            self._items = [
+                GuestCartItem(products[int(pid)], quantity)
+                for pid, quantity in self.cart.items()
+                if str(pid).isdigit() and int(pid) in products
+            ]
+        return self._items
 
     def get_total_price(self):
+        if self._total is None:
+            self._total = sum((item.total_price for item in self.get_cart_items()), Decimal('0'))
+        return self._total
+
+    def count(self):
+        """Total quantity in the cart (cached per user version for logged-in users)"""
         if self.user.is_authenticated:
-            return sum(item.total_price for item in self.get_cart_items())
-        else:
-            return sum(item['total_price'] for item in self.get_cart_items())
+            return get_user_cart_count(self.user.pk)
+        return sum(self.cart.values())
+
+    def _changed(self):
+        """Drop loaded lines, move a user's cached cart to a new version and notify streams"""
+        self._items = None
+        self._total = None
+        user_id = self.user.pk if self.user.is_authenticated else None
+        if user_id is not None:
+            bump_cart_version(user_id)
+        channel = events.cart_channel(user_id, self.session.session_key)
+        if channel and events.hub.has_subscribers(channel):
+            transaction.on_commit(lambda: events.publish_cart_count(channel, self.count()))
 
     def merge_session_cart(self):
+        """
+        Fold the guest session cart into the user's saved cart at login.
+
+        Runs a fixed number of statements whatever the cart size: one lookup of
+        the still-purchasable products, one ``INSERT ... ON CONFLICT DO NOTHING``
+        creating missing rows at quantity 0, and one ``UPDATE`` adding every
+        session quantity with a database-side expression. Deleted or inactive
+        products are skipped instead of aborting the login.
+        """
         from .models import Product, Cart
         if not self.user.is_authenticated:
             return
-        
+
+        quantities = {}
         for product_id, quantity in self.cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            cart_item, created = Cart.objects.get_or_create(
-                user=self.user,
-                product=product,
-                defaults={'quantity': 0}
-            )
-            # If item exists in DB, we can choose to add or overwrite. 
-            # Here we'll add the session quantity to existing DB quantity.
-            cart_item.quantity += quantity 
-            cart_item.save()
-        
+            try:
+                product_id, quantity = int(product_id), int(quantity)
+            except (TypeError, ValueError):
+                continue
+            if quantity > 0:
+                quantities[product_id] = quantity
+
+        if quantities:
+            with transaction.atomic():
+                product_ids = list(
+                    Product.objects.filter(id__in=quantities, is_active=True).values_list('id', flat=True)
+                )
+                if product_ids:
+                    Cart.objects.bulk_create(
+                        [Cart(user=self.user, product_id=pid, quantity=0) for pid in product_ids],
+                        ignore_conflicts=True,
+                    )
+                    Cart.objects.filter(user=self.user, product_id__in=product_ids).update(
+                        quantity=F('quantity') + Case(
+                            *[When(product_id=pid, then=Value(quantities[pid])) for pid in product_ids],
+                            default=Value(0),
+                        )
+                    )
+
         # Clear session cart after merge
-        self.session['cart'] = {}
+        self.cart = {}
         self.save_session()
+        self._changed()
 
     def save_session(self):
-        self.session.modified = True
+        """
+        Store the guest cart after a mutation.
+
+        An empty cart is removed from the session instead of being written,
+        so emptying a cart that was never stored leaves the session untouched.
+        """
+        if self.cart:
+            self.session['cart'] = self.cart
+        elif 'cart' in self.session:
+            del self.session['cart']
@@ -4,105 +4,210 @@ from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
-from decimal import Decimal
-from .utils import CartService
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import asyncio
+from django.urls import reverse
+from .utils import CartService, get_cart_count, get_wishlist_ids
+from .pagination import KeysetPaginator, InvalidCursor
+from . import coupons, events, feeds, holds, orders, pricing, search
 import json
-from .models import Product, Wishlist, ProductReview, Category, Cart
-from django.db import models
+from decimal import Decimal, InvalidOperation
+from .models import Product, Wishlist, ProductReview, Category
 from .forms import ProductReviewForm, CustomUserCreationForm
 
+# Listing sort options mapped to their keyset (field, descending) ordering
+PRODUCT_SORTS = {
+    'relevance': ('search_rank', False),
+    'newest': ('created_at', True),
+    'price_low': ('effective_price', False),
+    'price_high': ('effective_price', True),
+    'rating': ('rating_avg', True),
+}
+PRODUCTS_PER_PAGE = 24
+PRODUCTS_API_MAX_LIMIT = 100
+REVIEWS_PER_PAGE = 10
+WISHLIST_STATUS_BATCH_LIMIT = 100
+
+# Server-sent events: products one page may watch, and idle keep-alive interval
+EVENT_STREAM_MAX_PRODUCTS = 100
+EVENT_STREAM_HEARTBEAT = 20
+
 # Create your views here.
 def index(request):
     products = Product.objects.all()
     return render(request, 'index.html', {'products': products})
 
-def products(request):
-    # Start with all active products
-    products = Product.objects.filter(is_active=True)
-    categories = Category.objects.filter(is_active=True)
-    
-    # Search
-    query = request.GET.get('q')
+class InvalidFilter(ValueError):
+    """Raised for a listing filter value that cannot be applied"""
+
+
+def _decimal_param(params, name, strict=False):
+    """
+    A finite decimal query parameter, or None when it is missing.
+
+    A value that is not a number is ignored too, unless ``strict``, in which
+    case InvalidFilter is raised.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        if strict:
+            raise InvalidFilter(f'{name} must be a number')
+        return None
+    return number
+
+
+def _filter_products(params, strict=False):
+    """
+    Apply the listing filters from a GET query dict; returns (queryset, sort_by).
+
+    Malformed numeric filters are dropped, or raise InvalidFilter when ``strict``.
+    """
+    products = Product.objects.filter(is_active=True).select_related('category')
+
+    # Search (full-text, ranked by relevance where the backend supports it)
+    query = params.get('q')
+    ranked = False
     if query:
-        products = products.filter(
-            models.Q(name__icontains=query) | 
-            models.Q(desc__icontains=query)
-        )
+        products, ranked = search.search_products(products, query)
 
     # Category Filter
-    category_slug = request.GET.get('category')
+    category_slug = params.get('category')
     if category_slug:
         products = products.filter(category__slug=category_slug)
 
-    # Price Filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-
-    # Sorting
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    else:
-        products = products.order_by('-created_at')
+    # Price Filter (on the sale-aware price customers actually pay)
+    min_price = _decimal_param(params, 'min_price', strict)
+    max_price = _decimal_param(params, 'max_price', strict)
+    if min_price is not None:
+        products = products.filter(effective_price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(effective_price__lte=max_price)
+
+    # Rating Filter (reads the stored average, no review aggregation)
+    min_rating = _decimal_param(params, 'min_rating', strict)
+    if min_rating is not None:
+        products = products.filter(rating_avg__gte=min_rating)
+
+    # Searches default to relevance order; it only exists when a rank was computed
+    sort_by = params.get('sort') or ('relevance' if ranked else 'newest')
+    if sort_by not in PRODUCT_SORTS or (sort_by == 'relevance' and not ranked):
+        sort_by = 'newest'
+    return products, sort_by
+
+
+def _paginate_products(products, sort_by, cursor, page_size=PRODUCTS_PER_PAGE):
+    """Return one keyset page of ``products`` in the requested sort order"""
+    field, descending = PRODUCT_SORTS[sort_by]
+    paginator = KeysetPaginator(products, field, descending=descending, page_size=page_size)
+    return paginator.page(cursor)
+
+
+def products(request):
+    products, sort_by = _filter_products(request.GET)
+    categories = Category.objects.filter(is_active=True)
+    query = request.GET.get('q')
+    category_slug = request.GET.get('category')
+
+    # Only the current page is loaded; a stale or tampered cursor restarts the listing
+    try:
+        page = _paginate_products(products, sort_by, request.GET.get('cursor'))
+    except InvalidCursor:
+        page = _paginate_products(products, sort_by, None)
     
     # Get cart quantities
     cart_service = CartService(request)
     cart_items = cart_service.get_cart_items()
     
-    cart_quantities = {}
-    if request.user.is_authenticated:
-        cart_quantities = {item.product_id: item.quantity for item in cart_items}
-    else:
-        # For session cart, items is a list of dicts
-        for item in cart_items:
-            cart_quantities[item['product'].id] = item['quantity']
+    cart_quantities = {item.product_id: item.quantity for item in cart_items}
             
-    # Get wishlist items for logged-in users
-    wishlist_product_ids = set()
+    # Wishlist status comes from the user's cached set of wishlisted IDs
+    wishlist_product_ids = frozenset()
     if request.user.is_authenticated:
-        wishlist_product_ids = set(Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True))
+        wishlist_product_ids = get_wishlist_ids(request.user.pk)
         
     # Add cart quantities and wishlist status to products
-    for product in products:
+    for product in page:
         product.cart_quantity = cart_quantities.get(product.id, 0)
         product.in_wishlist = product.id in wishlist_product_ids
+
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
     
     context = {
-        'products': products,
+        'products': page.items,
         'categories': categories,
         'current_category': category_slug,
         'current_sort': sort_by,
         'search_query': query,
+        'next_cursor': page.next_cursor,
+        'next_query': next_query,
     }
     return render(request, 'products.html', context)
 
+
+def api_products(request):
+    """JSON catalog listing with the same filters and sorts as the products page"""
+    try:
+        products, sort_by = _filter_products(request.GET, strict=True)
+    except InvalidFilter as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    try:
+        page_size = min(max(int(request.GET.get('limit', PRODUCTS_PER_PAGE)), 1), PRODUCTS_API_MAX_LIMIT)
+    except ValueError:
+        page_size = PRODUCTS_PER_PAGE
+
+    try:
+        page = _paginate_products(products, sort_by, request.GET.get('cursor'), page_size)
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    results = [
+        {
+            'id': product.id,
+            'name': product.name,
+            'sku': product.sku,
+            'price': str(product.price) if product.price is not None else None,
+            'sale_price': str(product.sale_price) if product.sale_price is not None else None,
+            'on_sale': product.on_sale,
+            'effective_price': str(product.effective_price) if product.effective_price is not None else None,
+            'stock': product.stock,
+            'image': product.image.url if product.image else None,
+            'category': product.category.slug if product.category else None,
+            'created_at': product.created_at.isoformat(),
+            'url': reverse('product_detail', args=[product.id]),
+        }
+        for product in page
+    ]
+    return JsonResponse({'results': results, 'next': page.next_cursor})
+
 def about(request):
     return render(request, 'about.html')
 
 def checkout(request):
     cart_service = CartService(request)
     cart_items = cart_service.get_cart_items()
-    
-    # Calculate totals
-    cart_total = sum(
-        item.total_price if hasattr(item, 'total_price') else item['total_price'] 
-        for item in cart_items
-    )
-    tax_amount = cart_total * Decimal('0.10')  # 10% tax
-    total_with_tax = cart_total + tax_amount
+
+    # Set the cart's stock aside while the customer fills in payment details
+    hold = holds.hold_cart(cart_service)
     
     context = {
         'cart_items': cart_items,
-        'cart_total': cart_total,
-        'tax_amount': tax_amount,
-        'total_with_tax': total_with_tax,
+        'quote': pricing.quote_cart(cart_service),
+        'hold_expires_at': hold.expires_at if hold else None,
+        'unheld_products': hold.short if hold else [],
     }
     return render(request, 'checkout.html', context)
 
@@ -152,20 +257,21 @@ def add_to_cart(request):
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
+def cart_quote(request):
+    """JSON price breakdown for the current cart, e.g. after picking shipping or a coupon"""
+    quote = pricing.quote_cart(
+        CartService(request),
+        coupon_code=request.GET.get('coupon', '').strip() or None,
+        shipping_method=request.GET.get('shipping', pricing.DEFAULT_SHIPPING),
+    )
+    return JsonResponse(quote.as_dict())
+
 def cart_view(request):
     cart_service = CartService(request)
-    cart_items = cart_service.get_cart_items()
-    cart_total = cart_service.get_total_price()
-    
-    # Calculate tax (example 10%)
-    tax_amount = Decimal('0.10') * Decimal(cart_total)
-    total_with_tax = Decimal(cart_total) + tax_amount
 
     context = {
-        'cart_items': cart_items,
-        'cart_total': cart_total,
-        'tax_amount': tax_amount,
-        'total_with_tax': total_with_tax,
+        'cart_items': cart_service.get_cart_items(),
+        'quote': pricing.quote_cart(cart_service),
     }
     
     return render(request, 'cart.html', context)
@@ -204,7 +310,7 @@ def wishlist_view(request):
     # Check if products are in cart
     cart_service = CartService(request)
     cart_items = cart_service.get_cart_items()
-    cart_product_ids = {item.product_id for item in cart_items} if request.user.is_authenticated else set()
+    cart_product_ids = {item.product_id for item in cart_items}
     
     # Add in_cart flag to each wishlist item
     for item in wishlist_items:
@@ -304,29 +410,68 @@ def move_to_cart(request, wishlist_id):
 @login_required
 def get_wishlist_status(request, product_id):
     """Check if product is in user's wishlist"""
-    is_wishlisted = Wishlist.objects.filter(
-        user=request.user,
-        product_id=product_id
-    ).exists()
-    
     return JsonResponse({
-        'is_wishlisted': is_wishlisted
+        'is_wishlisted': product_id in get_wishlist_ids(request.user.pk)
+    })
+
+
+@login_required
+def get_wishlist_statuses(request):
+    """
+    Wishlist status for a batch of products, e.g. every card on a page.
+
+    Takes ``ids`` as a comma-separated list (or repeated) and answers from
+    the user's cached wishlist set, so the whole batch costs at most one query.
+    """
+    try:
+        product_ids = {
+            int(value)
+            for raw in request.GET.getlist('ids')
+            for value in raw.split(',') if value.strip()
+        }
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'ids must be integers'}, status=400)
+    if len(product_ids) > WISHLIST_STATUS_BATCH_LIMIT:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {WISHLIST_STATUS_BATCH_LIMIT} products per request'
+        }, status=400)
+
+    wishlisted = get_wishlist_ids(request.user.pk)
+    return JsonResponse({
+        'wishlisted': sorted(product_ids & wishlisted),
+        'statuses': {str(pid): pid in wishlisted for pid in sorted(product_ids)},
     })
 
 # ==================== PRODUCT DETAIL & REVIEWS ====================
+def _review_page(product, cursor=None):
+    """One keyset page of a product's reviews, newest first, with their authors"""
+    reviews = ProductReview.objects.filter(product=product, is_verified_purchase=True).select_related('user')
+    return KeysetPaginator(reviews, 'created_at', descending=True, page_size=REVIEWS_PER_PAGE).page(cursor)
+
+
+def _rating_histogram(product):
+    """Star histogram rows with bar widths, from the stored aggregates"""
+    total = product.rating_count
+    return [
+        {'stars': stars, 'count': count, 'percent': round(count * 100 / total) if total else 0}
+        for stars, count in product.rating_histogram
+    ]
+
+
 @login_required
 def product_detail(request, product_id):
     """Display product details along with reviews and review form"""
     product = get_object_or_404(Product, id=product_id)
-    # Fetch reviews
-    reviews = ProductReview.objects.filter(product=product, is_verified_purchase=True).order_by('-created_at')
-    # Average rating
-    avg_rating = reviews.aggregate(avg=models.Avg('rating'))['avg'] or 0
+    # First page of reviews; the rest load on demand from api_product_reviews
+    reviews = _review_page(product)
+    # Average rating and histogram from the product's stored aggregates
+    avg_rating = product.average_rating
     
     # Check wishlist status
     in_wishlist = False
     if request.user.is_authenticated:
-        in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
+        in_wishlist = product.id in get_wishlist_ids(request.user.pk)
 
     # Review form for logged-in users
     if request.method == 'POST':
@@ -343,13 +488,36 @@ def product_detail(request, product_id):
         form = ProductReviewForm()
     context = {
         'product': product,
-        'reviews': reviews,
+        'reviews': reviews.items,
+        'reviews_next': reviews.next_cursor,
+        'rating_histogram': _rating_histogram(product),
         'avg_rating': avg_rating,
         'review_form': form,
         'in_wishlist': in_wishlist,
     }
     return render(request, 'product_detail.html', context)
 
+@login_required
+def api_product_reviews(request, product_id):
+    """JSON "load more" page of a product's reviews"""
+    product = get_object_or_404(Product, id=product_id)
+    try:
+        page = _review_page(product, request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    results = [
+        {
+            'id': review.id,
+            'title': review.title,
+            'rating': review.rating,
+            'comment': review.comment,
+            'user': review.user.username,
+            'created_at': review.created_at.isoformat(),
+        }
+        for review in page
+    ]
+    return JsonResponse({'results': results, 'next': page.next_cursor})
+
 @require_POST
 @login_required
 def submit_review(request, product_id):
@@ -367,31 +535,156 @@ def submit_review(request, product_id):
 
 def cart_count(request):
     """Return the number of items in the cart"""
-    if request.user.is_authenticated:
-        count = Cart.objects.filter(user=request.user, is_active=True).aggregate(
-            total=models.Sum('quantity')
-        )['total'] or 0
-    else:
-        cart = request.session.get('cart', {})
-        count = sum(cart.values()) if cart else 0
-    
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': get_cart_count(request)})
+
+async def event_stream(request):
+    """
+    Server-sent events for the cart badge and live stock levels.
+
+    Pushes ``cart`` events for the current user (or guest session) and
+    ``stock`` events for the product ids in ``?products=1,2,3``. Connections
+    are held by the ASGI event loop; under WSGI, where each open stream would
+    pin a worker thread, it answers 204 so browsers fall back to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    cart_channel = events.cart_channel(
+        user.pk if user.is_authenticated else None,
+        request.session.session_key,
+    )
+    product_ids = []
+    for value in request.GET.get('products', '').split(','):
+        if value.strip().isdigit():
+            product_ids.append(int(value))
+    channels = [events.stock_channel(pid) for pid in product_ids[:EVENT_STREAM_MAX_PRODUCTS]]
+    if cart_channel:
+        channels.append(cart_channel)
+
+    async def stream():
+        subscription = events.hub.subscribe(channels)
+        try:
+            yield 'retry: 5000\n\n'
+            # Current count first, so a reconnect never leaves the badge stale
+            count = await sync_to_async(get_cart_count)(request)
+            yield events.format_event('cart', {'count': count})
+            while True:
+                try:
+                    event_type, data = await asyncio.wait_for(
+                        subscription.get(), EVENT_STREAM_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield events.format_event(event_type, data)
+        finally:
+            events.hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @require_POST
 def place_order(request):
     """Handle order placement"""
     try:
         cart_service = CartService(request)
-        cart_items = cart_service.get_cart_items()
-        
-        if not cart_items:
-            return JsonResponse({'success': False, 'message': 'Cart is empty'}, status=400)
-        
-        # Placeholder - implement full order processing later
+        details = {field: request.POST.get(field, '').strip() for field in orders.ORDER_DETAIL_FIELDS}
+        order = orders.place_order(
+            cart_service,
+            details,
+            shipping_method=request.POST.get('shipping_method', 'standard'),
+            coupon_code=request.POST.get('coupon_code', '').strip() or None,
+        )
         return JsonResponse({
             'success': True,
             'message': 'Order placed successfully',
-            'order_id': '12345'
+            'order_id': order.order_number,
         })
+    except orders.InsufficientStock as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=409)
+    except (orders.OrderError, coupons.CouponError) as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+# ==================== CATALOG FEEDS & SITEMAPS ====================
+async def _pull_chunks(chunks):
+    """Async view of a sync chunk generator, advanced on the thread that owns the DB connection"""
+    pull = sync_to_async(lambda: next(chunks, None))
+    while (chunk := await pull()) is not None:
+        yield chunk
+
+
+def _streaming_response(request, lines, content_type):
+    """
+    Stream generated lines in buffered chunks.
+
+    Under ASGI Django would read a sync iterator into memory before sending
+    it, so the chunks are handed over through an async generator instead.
+    """
+    chunks = feeds.buffered(lines)
+    if isinstance(request, ASGIRequest):
+        chunks = _pull_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+def _site_url(request):
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def catalog_feed(request, fmt):
+    """
+    The active catalog as CSV, JSONL or a shopping-feed XML, streamed.
+
+    ``?since=<ISO timestamp>`` limits the export to products changed since
+    then; the ``X-Catalog-Watermark`` header is the value to pass next time.
+    Stock counts and deactivated products are only exported to staff and to
+    callers presenting ``FEED_TOKEN`` (``?token=`` or ``X-Feed-Token``).
+    """
+    if fmt not in feeds.FORMATS:
+        raise Http404('Unknown feed format')
+    since = None
+    if request.GET.get('since'):
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            return JsonResponse({'status': 'error', 'message': 'since must be an ISO 8601 timestamp'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    public = not (
+        request.user.is_staff
+        or feeds.valid_token(request.GET.get('token') or request.headers.get('X-Feed-Token'))
+    )
+    watermark = timezone.now()
+    products = feeds.iter_products(feeds.export_queryset(since, with_description=fmt == 'xml', public=public))
+    response = _streaming_response(
+        request, feeds.export_lines(fmt, products, _site_url(request), public), feeds.FORMATS[fmt]
+    )
+    response['X-Catalog-Watermark'] = watermark.isoformat()
+    if fmt != 'xml':
+        response['Content-Disposition'] = f'attachment; filename="catalog.{fmt}"'
+    return response
+
+
+def sitemap_index(request):
+    """Sitemap index pointing at the category sitemap and every product sitemap file"""
+    site_url = _site_url(request)
+    sections = [site_url + reverse('sitemap_categories')] + [
+        site_url + reverse('sitemap_products', args=[page])
+        for page in range(1, feeds.sitemap_product_pages() + 1)
+    ]
+    return _streaming_response(request, feeds.sitemap_index_lines(sections), feeds.FORMATS['xml'])
+
+
+def sitemap_products(request, page):
+    if not 1 <= page <= feeds.sitemap_product_pages():
+        raise Http404('No such sitemap page')
+    return _streaming_response(request, feeds.product_sitemap_lines(page, _site_url(request)), feeds.FORMATS['xml'])
+
+
+def sitemap_categories(request):
+    return _streaming_response(request, feeds.category_sitemap_lines(_site_url(request)), feeds.FORMATS['xml'])
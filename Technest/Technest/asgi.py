@@ -3,6 +3,10 @@ ASGI config for Technest project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn Technest.asgi:application``) so
+the ``/api/events/`` server-sent event streams are held by the event loop
+instead of a thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
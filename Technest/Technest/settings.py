@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Techapp.assets.AssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,6 +53,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Techapp.context_processors.cart',
             ],
         },
     },
@@ -65,6 +67,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts: SQLite cannot
+            # upgrade a read lock under contention (checkout reads, then writes)
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Cache (per-process by default; point at Redis/Memcached in production so
+# cached cart counts and wishlists are shared between workers; with the
+# per-process cache they are only kept for a few seconds, see Techapp.utils)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'technest',
     }
 }
 
@@ -95,7 +112,7 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Authentication redirects
-LOGIN_URL = 'login'
+LOGIN_URL = 'sign_in'
 LOGIN_REDIRECT_URL = 'products'
 LOGOUT_REDIRECT_URL = 'index'
 AUTH_USER_MODEL = 'Techapp.CustomUser'
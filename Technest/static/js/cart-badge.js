@@ -10,13 +10,40 @@ class CartBadgeManager {
     }
 
     init() {
-        // Update cart count on page load
-        this.updateCartCount();
+        // Use the count rendered with the page; only ask the server if it is missing
+        const initialCount = this.badge ? this.badge.dataset.count : undefined;
+        if (initialCount !== undefined && initialCount !== '') {
+            this.setCount(initialCount);
+        } else {
+            this.updateCartCount();
+        }
 
         // Listen for cart update events
         document.addEventListener('cartUpdated', () => {
             this.updateCartCount();
         });
+
+        this.connectEvents();
+    }
+
+    /**
+     * Subscribe to server-sent cart and stock updates for products on this page.
+     * The server answers 204 when streaming isn't available, which stops EventSource.
+     */
+    connectEvents() {
+        if (!window.EventSource) return;
+
+        const productIds = new Set();
+        document.querySelectorAll('[data-product-id]').forEach(el => productIds.add(el.dataset.productId));
+        const query = productIds.size ? `?products=${Array.from(productIds).join(',')}` : '';
+
+        this.events = new EventSource(`/api/events/${query}`);
+        this.events.addEventListener('cart', (e) => {
+            this.setCount(JSON.parse(e.data).count);
+        });
+        this.events.addEventListener('stock', (e) => {
+            document.dispatchEvent(new CustomEvent('stockUpdated', { detail: JSON.parse(e.data) }));
+        });
     }
 
     async updateCartCount() {
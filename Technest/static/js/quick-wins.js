@@ -389,6 +389,20 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         }
     });
+
+    // Live stock levels pushed by the server (see cart-badge.js)
+    document.addEventListener('stockUpdated', function (e) {
+        const { product_id: productId, stock } = e.detail;
+        document.querySelectorAll(`.stock-count[data-product-id="${productId}"]`).forEach(el => {
+            el.textContent = stock;
+        });
+        document.querySelectorAll(`.product-card-futuristic[data-product-id="${productId}"]`).forEach(card => {
+            const input = card.querySelector('.quantity-input');
+            if (input) input.max = stock;
+            const button = card.querySelector('.add-to-cart-btn');
+            if (button) button.disabled = !(stock > 0);
+        });
+    });
 });
 
 // Wishlist Functionality